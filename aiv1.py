@@ -1,33 +1,53 @@
 import streamlit as st
 import pandas as pd
-import pyodbc
-import sqlite3
-import re
-from sqlalchemy import create_engine, text
-import pandasai as pai
 import logging
-import matplotlib.pyplot as plt
-import time
-import requests
+import os
+import psutil
 from datetime import datetime
+import settings
+from answer_cache import AnswerCache, dataframe_fingerprint
+from question_index import QuestionIndex
+from query_engine import answer_approximately, answer_locally, handle_special_queries, is_meaningful_query
+from loaders import compact_frame, load_csv, load_signature
+from dataset_cache import DatasetCache, content_digest
+from sql_import import load_sql_dump
+from sql_catalog import SQLiteCatalog, answer_from_catalog, catalog_fingerprint
+from pushdown import answer_on_server, count_rows, sample_table
+from db_sync import SyncResetRequired, TableSync
+from db_fetch import fetch_frame
+from connection_pool import PoolManager
+from code_sandbox import ProcessSandbox, SandboxPool
+from llm_executor import LLMExecutor, LLMJob, configure_pandasai, pandasai_available
+from assistant_registry import AssistantRegistry, SessionToken
+from dataset_registry import DatasetRegistry
+from chat_history import message_snapshot, message_time, split_history
+from result_store import ResultHandle, ResultStore, purge_stale_spill_dirs
+from tracing import configure_tracer
+from logging_setup import configure_logging, parse_module_levels
+from dataset_profile import ProfileIndex, format_distinct, format_value, new_profile_builder, profile_description
+from sketches import DatasetSketches, sketch_description
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+# Copy-on-write lets assistants and views share the loaded frame's buffers safely
+pd.set_option("mode.copy_on_write", True)
+
+# Configure logging once per process: queued, non-blocking, levels and debug sampling from settings
+configure_logging(
+    level=settings.LOG_LEVEL,
+    module_levels=parse_module_levels(settings.LOG_MODULE_LEVELS),
+    log_file=settings.LOG_FILE or None,
+    debug_per_minute=settings.LOG_DEBUG_PER_MINUTE,
+    queue_size=settings.LOG_QUEUE_SIZE
+)
 logger = logging.getLogger(__name__)
 
-# Check if PandasAI is available
-try:
-    import pandasai
-    PANDASAI_AVAILABLE = True
-except ImportError:
-    PANDASAI_AVAILABLE = False
-    st.error("PandasAI n'est pas installé. Installez-le avec: pip install pandasai==2.1.0")
+# Tracing spans feed the Performance panel and, when configured, a JSON-lines export file
+tracer = configure_tracer(max_spans=settings.TRACE_MAX_SPANS, export_path=settings.TRACE_EXPORT_PATH)
 
-# Set PandasAI global configuration
-if PANDASAI_AVAILABLE:
-    pai.config.verbose = False
-    pai.config.enable_cache = False
-    pai.api_key.set("****")
+# PandasAI is imported and configured by configure_pandasai() the first time a question
+# needs the LLM, not on every rerun
+PANDASAI_AVAILABLE = pandasai_available()
+if not PANDASAI_AVAILABLE:
+    st.error("PandasAI n'est pas installé. Installez-le avec: pip install pandasai==2.1.0")
 
 # Page configuration
 st.set_page_config(
@@ -219,154 +239,479 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Function to preprocess SQL file for SQLite
-def preprocess_sql_for_sqlite(sql_content):
-    sql_content = re.sub(r'^\s*SET.*;$\n?', '', sql_content, flags=re.MULTILINE)
-    sql_content = re.sub(r'/\*!.*?\*/;', '', sql_content)
-    sql_content = re.sub(r'\s*ENGINE\s*=\s*\w+\s*', ' ', sql_content)
-    sql_content = re.sub(r'\s*DEFAULT\s+CHARSET\s*=\s*\w+\s*', ' ', sql_content)
-    sql_content = re.sub(r'\s*COLLATE\s*=\s*\w+\s*', ' ', sql_content)
-    sql_content = re.sub(r'^\s*START TRANSACTION;$\n?', '', sql_content, flags=re.MULTILINE)
-    sql_content = re.sub(r'^\s*COMMIT;$\n?', '', sql_content, flags=re.MULTILINE)
-    sql_content = sql_content.replace('`', '"')
-    return sql_content
+# Function to get the process-wide pool manager shared by all sessions
+@st.cache_resource
+def get_pool_manager():
+    return PoolManager(
+        pool_size=settings.POOL_SIZE,
+        max_overflow=settings.POOL_MAX_OVERFLOW,
+        recycle_seconds=settings.POOL_RECYCLE_SECONDS,
+        timeout_seconds=settings.POOL_TIMEOUT_SECONDS,
+        validate_idle_seconds=settings.POOL_VALIDATE_IDLE_SECONDS,
+        health_ttl_seconds=settings.POOL_HEALTH_TTL_SECONDS
+    )
 
 # Function to connect to MySQL
-@st.cache_resource
 def connect_to_mysql_sqlalchemy(host, database, username, password, port=3306):
-    try:
-        conn_str = f"mysql+pymysql://{username}:{password or ''}@{host}:{port}/{database}"
-        logger.debug(f"Attempting MySQL connection: {conn_str.replace(password or '', '[hidden]')}")
-        engine = create_engine(conn_str)
-        with engine.connect() as connection:
-            connection.execute(text("SELECT 1"))
-        logger.debug("MySQL connection successful")
-        return engine
-    except Exception as e:
-        logger.error(f"MySQL connection failed: {str(e)}")
-        st.error(f"Échec de la connexion MySQL : {str(e)}")
+    pool_manager = get_pool_manager()
+    logger.debug("Attempting MySQL connection: %s@%s:%s/%s", username, host, port, database)
+    pool = pool_manager.mysql_pool(host, database, username, password, port)
+    if not pool_manager.is_healthy(pool, force=True):
+        logger.error("MySQL connection failed: %s", pool.last_error)
+        st.error(f"Échec de la connexion MySQL : {pool.last_error}")
+        pool_manager.release(pool)
         return None
+    logger.debug("MySQL connection successful")
+    return pool
 
 # Function to connect to Azure SQL or Dataverse
-@st.cache_resource
 def connect_to_database(server, database, username, password, driver="ODBC Driver 17 for SQL Server"):
-    try:
-        conn_str = f"DRIVER={{{driver}}};SERVER={server};DATABASE={database};UID={username};PWD={password};Connection Timeout=30"
-        logger.debug(f"Attempting Azure SQL connection with driver: {driver}")
-        conn = pyodbc.connect(conn_str)
-        logger.debug("Azure SQL connection successful")
-        return conn
-    except Exception as e:
-        logger.error(f"Azure SQL connection failed: {str(e)}")
-        st.error(f"Connection failed: {e}")
+    pool_manager = get_pool_manager()
+    logger.debug("Attempting Azure SQL connection with driver: %s", driver)
+    pool = pool_manager.odbc_pool(server, database, username, password, driver)
+    if not pool_manager.is_healthy(pool, force=True):
+        logger.error("Azure SQL connection failed: %s", pool.last_error)
+        st.error(f"Connection failed: {pool.last_error}")
+        pool_manager.release(pool)
         return None
+    logger.debug("Azure SQL connection successful")
+    return pool
 
-# Function to check connection validity
+# Function to check connection validity (rate-limited, cached per pool)
 def is_connection_valid(conn):
-    if conn is None:
-        return False
+    return get_pool_manager().is_healthy(conn)
+
+# Function to give the session's pooled connection back to the pool manager
+def release_db_conn():
+    if st.session_state.db_conn is not None:
+        get_pool_manager().release(st.session_state.db_conn)
+        st.session_state.db_conn = None
+    st.session_state.table_sync = None
+    st.session_state.sync_profile_builder = None
+
+# Function to fetch rows from the database in chunks converted to Arrow batches
+def fetch_rows(conn, sql, params=None):
+    return fetch_frame(conn, sql, params)[0]
+
+# Function to load a live table for the assistant: a sample of its rows, or with
+# `sync_options` the latest rows by key, kept up to date by the returned TableSync.
+# Rows arrive in chunks behind a progress bar; the cancel button reruns the app, which
+# stops the fetch after the current chunk, and the next run reports the cancelled load.
+# With a `source`, a sample another session loaded recently is shared instead, with the
+# row count stored next to it; the last value returned is then its (fingerprint, frame)
+# pair from the dataset registry.
+def load_database_table(conn, table_name, dialect, rows, random_sample, sync_options=None, source=None):
+    if source is not None:
+        registry = get_dataset_registry()
+        shared = registry.lookup(
+            source, st.session_state.session_token, max_age_seconds=settings.DATASET_REGISTRY_LIVE_MAX_AGE_SECONDS
+        )
+        if shared is not None:
+            # The row count was taken with the sample, so it is as recent as the rows
+            table_rows = registry.info(shared[0]).get("table_rows")
+            if table_rows is None:
+                table_rows = count_rows(conn, table_name, dialect)
+            return shared[1], table_rows, None, shared
+    reports = []
+    progress_bar = st.sidebar.progress(0.0, text="Loading rows...")
+    cancel_slot = st.sidebar.empty()
+    cancel_slot.button("✋ Cancel loading", key="cancel_db_load")
+    st.session_state.db_load_pending = table_name
+
+    def fetch(fetch_conn, sql, params=None):
+        df, report = fetch_frame(
+            fetch_conn, sql, params, expected_rows=rows,
+            progress_callback=lambda fraction: progress_bar.progress(fraction, text=f"Loading rows... {fraction:.0%}")
+        )
+        reports.append(report)
+        return df
+
     try:
-        if isinstance(conn, pyodbc.Connection):
-            cursor = conn.cursor()
-            cursor.execute("SELECT 1")
-            return cursor.fetchone() is not None
-        elif hasattr(conn, 'connect'):
-            with conn.connect() as connection:
-                result = connection.execute(text("SELECT 1"))
-                return result.fetchone() is not None
-        return False
-    except Exception as e:
-        logger.error(f"Connection validation failed: {str(e)}")
-        return False
+        with tracer.span("load.db_sample", dialect=dialect, random=random_sample, sync=sync_options is not None) as span:
+            table_rows = count_rows(conn, table_name, dialect)
+            table_sync = None
+            if sync_options is not None:
+                table_sync = TableSync(
+                    conn, table_name, dialect, batch_rows=settings.DB_SYNC_BATCH_ROWS,
+                    max_batches=settings.DB_SYNC_MAX_BATCHES, fetch=fetch_rows, **sync_options
+                )
+                df = table_sync.initial_load(rows, fetch=fetch)
+            else:
+                df = sample_table(conn, table_name, dialect, rows, random=random_sample, total_rows=table_rows, fetch=fetch)
+            span.set("rows", len(df))
+            span.set("table_rows", table_rows)
+            span.set("chunks", sum(report["chunks"] for report in reports))
+    except Exception:
+        st.session_state.db_load_pending = None
+        raise
+    st.session_state.db_load_pending = None
+    progress_bar.empty()
+    cancel_slot.empty()
+    if reports and reports[-1]["truncated"]:
+        st.sidebar.warning(
+            f"⚠️ Chargement limité à {len(df):,} lignes : plafond mémoire de "
+            f"{settings.DB_FETCH_MAX_MEMORY_BYTES / 1024 / 1024:.0f} MB atteint."
+        )
+    return df, table_rows, table_sync, None
+
+# Function to check that incremental sync, when enabled, names the columns its mode needs
+def sync_options_complete(sync_options):
+    if sync_options is None:
+        return True
+    return bool(sync_options["key_column"]) and (sync_options["mode"] != "timestamp" or bool(sync_options["timestamp_column"]))
+
+# Function to start tracking the loaded table's profile, so syncs that only append rows
+# update it instead of profiling the whole window again
+def start_sync_profile():
+    builder = new_profile_builder().update(st.session_state.df)
+    st.session_state.sync_profile_builder = builder
+    get_profile_index().put(get_dataset_fingerprint(), builder.finalize(rows=st.session_state.table_rows))
 
-# Function to create AI assistant
-def create_ai_assistant(df):
+# Function to bring the loaded rows of a synced table up to date with the server. Nothing
+# derived is touched when no row changed. Otherwise the frame gets a new fingerprint, so
+# answers cached for the previous rows are no longer used, and the profile is updated
+# from the appended rows, or rebuilt after updates, deletes and rows pushed out of the window.
+def sync_database_table():
+    table_sync = st.session_state.table_sync
+    with tracer.span("load.db_sync", mode=table_sync.mode) as span:
+        try:
+            df, result = table_sync.sync(st.session_state.df)
+        except SyncResetRequired as e:
+            logger.warning("Reloading %s: %s", table_sync.table, e)
+            df = table_sync.initial_load(table_sync.window_rows or len(st.session_state.df))
+            result = table_sync.last_result = None
+            st.session_state.table_rows = count_rows(table_sync.conn, table_sync.table, table_sync.dialect)
+        if result is not None:
+            span.set("inserted", result.inserted)
+            span.set("updated", result.updated)
+            span.set("deleted", result.deleted)
+            span.set("batches", result.batches)
+            if not result.changed:
+                return result
+            st.session_state.table_rows = (st.session_state.table_rows or 0) + result.inserted - result.deleted
+        share_frame(None, df)
+        st.session_state.ai_assistant = None
+        builder = st.session_state.sync_profile_builder
+        if result is not None and result.appended is not None and not result.trimmed and builder is not None:
+            builder.update(result.appended)
+            get_profile_index().put(get_dataset_fingerprint(), builder.finalize(rows=st.session_state.table_rows))
+        else:
+            start_sync_profile()
+    return result
+
+# Function to create AI assistant. Also called from LLM worker threads, which cannot
+# write to the page: failures are logged and None returned for the caller to report.
+# `dataset_key` (the frame's fingerprint) lets sandboxes of the same data share one export.
+def create_ai_assistant(df, description=None, dataset_key=None):
     if not PANDASAI_AVAILABLE:
         logger.error("PandasAI is not available")
         return None
     try:
-        df_copy = pd.DataFrame(df.copy())
-        logger.debug(f"Preparing DataFrame for chat with shape: {df_copy.shape}, columns: {df_copy.columns.tolist()}")
-        return pai.SmartDataframe(df_copy)
+        # With copy-on-write the SmartDataframe wraps df's buffers; generated code that
+        # modifies its frame copies the touched columns instead of altering df
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Preparing DataFrame for chat with shape: %s, columns: %s", df.shape, df.columns.tolist())
+        pai = configure_pandasai()
+        if not settings.SANDBOX_ENABLED:
+            return pai.SmartDataframe(df, description=description)
+        # Generated code runs in a sandbox worker against a shared Arrow copy of df
+        frame = pai.DataFrame(df, description=description)
+        return pai.Agent(frame, sandbox=ProcessSandbox(get_sandbox_pool(), frame.schema.name, df, dataset_key))
     except Exception as e:
-        logger.error(f"Error preparing DataFrame: {str(e)}")
-        st.error("❌ Impossible de préparer les données pour l'assistant IA.")
+        logger.error("Error preparing DataFrame: %s", e)
         return None
 
-# Function to check if query is meaningful
-def is_meaningful_query(query):
-    query_lower = query.strip().lower()
-    if len(query_lower) < 3:
-        return False, "Question trop courte"
-    non_meaningful = ["hi", "hello", "bonjour", "salut", "test", "ok", "yes", "no", "oui", "non"]
-    if query_lower in non_meaningful:
-        return False, "Veuillez poser une question sur les données"
-    analysis_keywords = [
-        "montre", "affiche", "graphique", "tableau", "analyse", "combien", "quelle", "quel",
-        "moyenne", "somme", "total", "maximum", "minimum", "répartition", "distribution",
-        "compare", "comparaison", "tendance", "évolution", "statistique", "corrélation",
-        "pourcentage", "proportion", "nombre", "créé", "génère", "visualise",
-        "show", "display", "chart", "graph", "table", "analyze", "how many", "what", "which",
-        "average", "sum", "total", "max", "min", "distribution", "compare", "comparison",
-        "trend", "statistics", "correlation", "percentage", "proportion", "count", "create",
-        "generate", "visualize", "plot", "most", "common", "type"
-    ]
-    if any(keyword in query_lower for keyword in analysis_keywords) or len(query_lower) > 10:
-        return True, ""
-    return False, "Veuillez poser une question sur les données"
-
-# Function to handle special queries directly
-def handle_special_queries(query, df):
-    query_lower = query.lower().strip()
-    if any(keyword in query_lower for keyword in ["colonnes", "columns", "nom des colonnes", "column names", "structure", "champs", "fields"]):
-        columns_info = [f"{i}. **{col}** ({df[col].dtype})" for i, col in enumerate(df.columns, 1)]
-        return "text", f"**Colonnes disponibles dans le dataset :**\n\n" + "\n".join(columns_info)
-    elif any(keyword in query_lower for keyword in ["taille", "size", "dimensions", "combien de lignes", "rows", "shape"]):
-        return "text", f"**Informations sur le dataset :**\n\n- **Nombre de lignes :** {len(df)}\n- **Nombre de colonnes :** {len(df.columns)}\n- **Taille totale :** {df.shape}"
-    elif any(keyword in query_lower for keyword in ["types", "dtypes", "type de données", "data types"]):
-        types_info = [f"- **{col}** : {df[col].dtype}" for col in df.columns]
-        return "text", f"**Types de données :**\n\n" + "\n".join(types_info)
-    elif any(keyword in query_lower for keyword in ["aperçu", "preview", "head", "premières lignes", "first rows", "échantillon", "sample"]):
-        return "dataframe", df.head(10)
-    return None, None
-
-# Function to execute query with retries
-def execute_pandasai_query(df, query, max_retries=2, retry_delay=2):
-    for attempt in range(max_retries):
-        try:
-            logger.debug(f"Attempt {attempt + 1}/{max_retries} to execute query: {query}")
-            response = df.chat(query)
-            logger.debug(f"Query executed successfully, response type: {type(response)}")
-            if response is None:
-                return "text", "Je n'ai pas pu générer une réponse pour cette question. Essayez de la reformuler."
-            if hasattr(response, 'figure') or str(type(response)).find('matplotlib') != -1:
-                return "chart", response
-            if isinstance(response, pd.DataFrame):
-                return "dataframe", response
-            response_str = str(response)
-            return "text", response_str if response_str.strip() else "Réponse vide reçue. Essayez une question différente."
-        except requests.exceptions.ConnectionError as e:
-            logger.error(f"Connection error on attempt {attempt + 1}: {str(e)}")
-            if attempt < max_retries - 1:
-                logger.info(f"Retrying after {retry_delay} seconds...")
-                time.sleep(retry_delay)
+# Function to get the process-wide pool of processes running PandasAI-generated code
+@st.cache_resource
+def get_sandbox_pool():
+    os.makedirs(settings.SANDBOX_DIR, exist_ok=True)
+    return SandboxPool(
+        settings.SANDBOX_DIR,
+        max_workers=settings.SANDBOX_WORKERS,
+        cpu_seconds=settings.SANDBOX_CPU_SECONDS,
+        wall_seconds=settings.SANDBOX_WALL_SECONDS,
+        memory_bytes=settings.SANDBOX_MEMORY_BYTES
+    )
+
+# Function to get the process-wide registry of AI assistants shared by sessions
+@st.cache_resource
+def get_assistant_registry():
+    return AssistantRegistry()
+
+# Function to get the process-wide registry of loaded datasets shared by sessions
+@st.cache_resource
+def get_dataset_registry():
+    return DatasetRegistry(max_bytes=settings.DATASET_REGISTRY_MAX_BYTES)
+
+# Function to make a (fingerprint, frame) pair handed out by the dataset registry the session's dataset
+def adopt_dataset(shared):
+    st.session_state.dataset_fingerprint, st.session_state.df = shared
+    return st.session_state.df
+
+# Function to register a frame the session just loaded, so sessions loading the same
+# source or the same content share one copy, and make it the session's dataset
+def share_frame(source, df, fingerprint=None, memory_bytes=None, info=None):
+    return adopt_dataset(get_dataset_registry().register(
+        source, df, st.session_state.session_token, fingerprint=fingerprint, memory_bytes=memory_bytes, info=info
+    ))
+
+# Function to drop the session's dataset and its share in the dataset registry
+def clear_session_frame():
+    get_dataset_registry().release(st.session_state.session_token)
+    st.session_state.df = None
+
+# Function to get the session's AI assistant, shared with sessions holding the same dataset
+def get_session_assistant():
+    if st.session_state.ai_assistant is None and st.session_state.df is not None:
+        # The dataset profile gives PandasAI the schema and value ranges without rescanning the frame
+        description = profile_description(get_dataset_profile())
+        fingerprint = get_dataset_fingerprint()
+        assistant = get_assistant_registry().acquire(
+            fingerprint, st.session_state.df,
+            lambda frame: create_ai_assistant(frame, description, fingerprint), st.session_state.session_token
+        )
+        if assistant is None and PANDASAI_AVAILABLE:
+            st.error("❌ Impossible de préparer les données pour l'assistant IA.")
+        st.session_state.ai_assistant = assistant
+    return st.session_state.ai_assistant
+
+# Function to get the process-wide answer cache shared by all sessions
+@st.cache_resource
+def get_answer_cache():
+    return AnswerCache(
+        settings.ANSWER_CACHE_DIR,
+        max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+        max_bytes=settings.ANSWER_CACHE_MAX_BYTES,
+        ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS
+    )
+
+# Function to get the process-wide index of answered questions, or None when it is disabled
+@st.cache_resource
+def get_question_index():
+    if not settings.QUESTION_INDEX_ENABLED:
+        return None
+    return QuestionIndex(
+        settings.QUESTION_INDEX_PATH,
+        max_entries=settings.QUESTION_INDEX_MAX_ENTRIES,
+        memory_entries=settings.QUESTION_INDEX_MEMORY_ENTRIES,
+        reuse_similarity=settings.QUESTION_INDEX_REUSE_PERCENT / 100,
+        suggest_similarity=settings.QUESTION_INDEX_SUGGEST_PERCENT / 100
+    )
+
+# Function to cache a fresh answer and index its question, so rephrasings can reuse it
+def remember_answer(answer_cache, question_index, fingerprint, question, result):
+    if answer_cache.put(fingerprint, question, *result) and question_index is not None:
+        question_index.add(fingerprint, question)
+
+# Function to find the cached answer of a past question similar to `question`. Returns
+# (SimilarQuestion, cached answer), the answer being None when the question is only close
+# enough to be suggested; (None, None) when there is no such question.
+def find_similar_answer(answer_cache, question_index, fingerprint, question):
+    if question_index is None:
+        return None, None
+    similar = question_index.nearest(fingerprint, question)
+    if similar is None:
+        return None, None
+    cached = answer_cache.get(fingerprint, similar.question) if similar.reuse else None
+    if similar.reuse and cached is None:
+        # The answer has left the cache since the question was indexed
+        question_index.forget(fingerprint, similar.question)
+        return None, None
+    return similar, cached
+
+# Function to build the chat message of an answer reused from a similar question
+def build_similar_message(similar, cached):
+    message = build_chat_message(*cached, cache_status="similar")
+    message["content"] = f"<i>Réponse à une question proche : « {similar.question} »</i><br>{message['content']}"
+    return message
+
+# Function to get the process-wide columnar cache of parsed uploads
+@st.cache_resource
+def get_dataset_cache():
+    return DatasetCache(settings.DATASET_CACHE_DIR, max_bytes=settings.DATASET_CACHE_MAX_BYTES)
+
+# Function to get the directory holding the sessions' spilled chat results, purged once per process
+@st.cache_resource
+def get_result_spill_root():
+    purge_stale_spill_dirs(settings.RESULT_SPILL_DIR)
+    return settings.RESULT_SPILL_DIR
+
+# Function to get the content digest of an uploaded file, hashed once per upload
+def get_upload_digest(uploaded_file):
+    upload_id = getattr(uploaded_file, "file_id", None) or f"{uploaded_file.name}:{uploaded_file.size}"
+    if upload_id not in st.session_state.upload_digests:
+        st.session_state.upload_digests[upload_id] = content_digest(uploaded_file)
+    return st.session_state.upload_digests[upload_id]
+
+# Function to get the fingerprint of the loaded dataset, computed once per load
+def get_dataset_fingerprint():
+    if st.session_state.dataset_fingerprint is None:
+        if st.session_state.sql_catalog is not None:
+            st.session_state.dataset_fingerprint = catalog_fingerprint(st.session_state.dataset_digest, [st.session_state.table_name])
+        elif st.session_state.df is not None:
+            st.session_state.dataset_fingerprint = dataframe_fingerprint(st.session_state.df)
+    return st.session_state.dataset_fingerprint
+
+# Function to get the process-wide index of dataset profiles
+@st.cache_resource
+def get_profile_index():
+    return ProfileIndex(settings.PROFILE_DIR, max_entries=settings.PROFILE_MAX_ENTRIES)
+
+# Function to get the profile of the active dataset, built once per dataset fingerprint.
+# Live database tables and SQL tables not loaded yet are profiled from their sample.
+def get_dataset_profile():
+    fingerprint = get_dataset_fingerprint()
+    if fingerprint is None:
+        return None
+    df = st.session_state.df
+    full_frame = df is not None and st.session_state.db_conn is None
+
+    def build():
+        with tracer.span("profile.build") as span:
+            if df is None:
+                catalog = st.session_state.sql_catalog
+                tables = [st.session_state.table_name]
+                profile = new_profile_builder().update(catalog.sample(tables)).finalize(rows=catalog.row_count(tables))
             else:
-                return "text", "Problème de connexion avec PandasAI. Vérifiez votre connexion Internet."
-        except Exception as e:
-            error_msg = str(e).lower()
-            logger.error(f"Error executing query on attempt {attempt + 1}: {str(e)}")
-            if "invalid output" in error_msg or "incompatible type" in error_msg:
-                return "text", f"PandasAI n'a pas pu générer une réponse appropriée. Essayez de reformuler votre question."
-            if "connection" in error_msg or "timeout" in error_msg:
-                return "text", "Problème de connexion avec PandasAI. Vérifiez votre connexion Internet."
-            if attempt < max_retries - 1:
-                continue
-            return "text", f"Erreur lors du traitement : {str(e)}"
+                rows = None if full_frame else st.session_state.table_rows
+                profile = new_profile_builder().update(df).finalize(rows=rows)
+            span.set("rows", profile["profiled_rows"])
+        return profile
+
+    index = get_profile_index()
+    profile = index.get_or_build(fingerprint, build)
+    if full_frame and (profile["sampled"] or (settings.APPROX_SKETCHES and "sketches" not in profile)):
+        # The table was profiled from its sample before being loaded in full, or without sketches
+        profile = build()
+        index.put(fingerprint, profile)
+    return profile
+
+# Function to get the sketches of the active dataset for approximate answers; None when
+# they are disabled or the profile only covers a sample of the table
+def get_dataset_sketches():
+    profile = get_dataset_profile()
+    if profile is None or profile["sampled"] or "sketches" not in profile:
+        return None
+    fingerprint = get_dataset_fingerprint()
+    cached = st.session_state.dataset_sketches
+    if cached is None or cached[0] != fingerprint:
+        cached = st.session_state.dataset_sketches = (fingerprint, DatasetSketches.from_dict(profile["sketches"]))
+    return cached[1]
+
+# Function to close the SQL catalog of the session, if any
+def close_sql_catalog():
+    if st.session_state.sql_catalog is not None:
+        st.session_state.sql_catalog.close()
+        st.session_state.sql_catalog = None
+
+# Function to materialize the active table of the SQL catalog on first use
+def get_active_dataframe():
+    catalog = st.session_state.sql_catalog
+    if st.session_state.df is None and catalog is not None:
+        table_name = st.session_state.table_name
+        dataset_cache = get_dataset_cache()
+        fingerprint = catalog_fingerprint(st.session_state.dataset_digest, [table_name])
+        cache_key = f"{st.session_state.dataset_digest}-{fingerprint[:16]}-{load_signature()}"
+        shared = get_dataset_registry().lookup(cache_key, st.session_state.session_token)
+        if shared is not None:
+            return adopt_dataset(shared)
+        with tracer.span("load.catalog_table", table=table_name) as span:
+            df = dataset_cache.get_frame(cache_key)
+            span.set("from_cache", df is not None)
+            tracer.count("dataset_cache", "hit" if df is not None else "miss")
+            if df is None:
+                with st.spinner(f"📥 Loading table {table_name}..."):
+                    df = compact_frame(catalog.select([table_name]))
+                dataset_cache.put_frame(cache_key, df)
+            span.set("rows", len(df))
+        share_frame(cache_key, df, fingerprint=fingerprint)
+    return st.session_state.df
+
+# Function to get the process-wide worker pool running PandasAI queries
+@st.cache_resource
+def get_llm_executor():
+    return LLMExecutor(
+        max_workers=settings.LLM_WORKERS,
+        max_retries=settings.LLM_MAX_RETRIES,
+        base_delay=settings.LLM_RETRY_BASE_SECONDS,
+        max_delay=settings.LLM_RETRY_MAX_SECONDS
+    )
+
+# Function to build the chat message for a (type, value) answer
+def build_chat_message(response_type, response, cache_status=None):
+    timestamp = datetime.now().strftime("%H:%M")
+    if response_type == "error":
+        return {"role": "error", "content": response, "timestamp": timestamp}
+    message = {
+        "role": "assistant",
+        "timestamp": timestamp,
+        "content_type": response_type,
+        "cache_status": cache_status
+    }
+    if response_type == "text":
+        message["content"] = response
+    elif response_type == "dataframe":
+        # Approximate answers carry their error bound in the frame's attrs
+        message["content"] = "Here's the data you requested:" + getattr(response, "attrs", {}).get("note", "")
+        message["extra_content"] = st.session_state.result_store.put(response_type, response)
+    elif response_type == "chart":
+        message["content"] = "I've created this visualization for you:"
+        message["extra_content"] = st.session_state.result_store.put(response_type, response)
+    else:
+        message["content"] = str(response)
+    return message
+
+# Function to move finished background jobs of this session into the chat
+def collect_finished_jobs():
+    get_llm_executor().check_timeouts(st.session_state.llm_jobs)
+    finished = [job for job in st.session_state.llm_jobs if job.finished]
+    for job in finished:
+        st.session_state.chat_messages.append(build_chat_message(*job.result, cache_status="miss"))
+    st.session_state.llm_jobs = [job for job in st.session_state.llm_jobs if not job.finished]
+    return finished
+
+# Function to show the questions still being answered, polling until they finish
+@st.fragment(run_every=settings.LLM_POLL_SECONDS)
+def render_pending_jobs():
+    reused = []
+    for job in st.session_state.llm_jobs:
+        col_status, col_cancel = st.columns([5, 1])
+        with col_status:
+            state = "En file d'attente" if job.status == "queued" else "Réflexion en cours"
+            st.markdown(f"""
+            <div class="bot-message">
+                🤔 {state}… <i>{job.question}</i>
+                <div class="message-time">{job.elapsed():.0f}s</div>
+            </div>
+            """, unsafe_allow_html=True)
+            similar = job.context.get("similar")
+            if similar is not None and st.button(
+                f"🔁 Utiliser la réponse à « {similar.question} » ({similar.score:.0%})", key=f"reuse_job_{job.id}"
+            ):
+                reused.append(job)
+        with col_cancel:
+            if st.button("✖", key=f"cancel_job_{job.id}", help="Annuler cette question"):
+                get_llm_executor().cancel(job)
+    for job in reused:
+        similar = job.context["similar"]
+        cached = get_answer_cache().get(job.context["fingerprint"], similar.question)
+        if cached is None:
+            st.toast("Cette réponse n'est plus en cache.")
+            continue
+        get_llm_executor().cancel(job)
+        st.session_state.llm_jobs.remove(job)
+        st.session_state.chat_messages.append(build_similar_message(similar, cached))
+    if reused:
+        st.rerun()
+    # Cancel clicks are read before collecting, so a job finishing meanwhile does not swallow them
+    if collect_finished_jobs():
+        st.rerun()
 
 # Function to display chat messages
-def display_chat_message(role, content, timestamp=None, extra_content=None, content_type=None):
+def display_chat_message(role, content, timestamp=None, extra_content=None, content_type=None, cache_status=None):
     if timestamp is None:
         timestamp = datetime.now().strftime("%H:%M")
+    timestamp = message_time(timestamp, cache_status)
     if role == "user":
         st.markdown(f"""
         <div class="user-message">
@@ -381,6 +726,13 @@ def display_chat_message(role, content, timestamp=None, extra_content=None, cont
             <div class="message-time">{timestamp}</div>
         </div>
         """, unsafe_allow_html=True)
+        if isinstance(extra_content, ResultHandle):
+            # Results live in the session's result store; large tables display a preview
+            store = st.session_state.result_store
+            if content_type == "dataframe":
+                extra_content = store.preview(extra_content)
+            else:
+                extra_content = store.get(extra_content)
         if extra_content is not None:
             with st.container():
                 if content_type == "dataframe":
@@ -389,7 +741,10 @@ def display_chat_message(role, content, timestamp=None, extra_content=None, cont
                     st.markdown('</div>', unsafe_allow_html=True)
                 elif content_type == "chart":
                     st.markdown('<div class="message-chart">', unsafe_allow_html=True)
-                    st.pyplot(extra_content, use_container_width=True)
+                    if isinstance(extra_content, bytes):
+                        st.image(extra_content, use_container_width=True)
+                    else:
+                        st.pyplot(extra_content, use_container_width=True)
                     st.markdown('</div>', unsafe_allow_html=True)
     elif role == "error":
         st.markdown(f"""
@@ -421,12 +776,43 @@ if "chat_messages" not in st.session_state:
     st.session_state.chat_messages = []
 if "ai_assistant" not in st.session_state:
     st.session_state.ai_assistant = None
-if "processing_query" not in st.session_state:
-    st.session_state.processing_query = False
+if "session_token" not in st.session_state:
+    st.session_state.session_token = SessionToken()
+    st.session_state.dataset_fingerprint = None
+if "llm_jobs" not in st.session_state:
+    st.session_state.llm_jobs = []
+if "result_store" not in st.session_state:
+    st.session_state.result_store = ResultStore(
+        get_result_spill_root(),
+        memory_budget_bytes=settings.RESULT_MEMORY_BUDGET_BYTES,
+        spill_bytes=settings.RESULT_SPILL_BYTES,
+        preview_rows=settings.RESULT_PREVIEW_ROWS
+    )
 if "connection_params" not in st.session_state:
     st.session_state.connection_params = None
 if "table_name" not in st.session_state:
     st.session_state.table_name = None
+if "dataset_fingerprint" not in st.session_state:
+    st.session_state.dataset_fingerprint = None
+if "dataset_digest" not in st.session_state:
+    st.session_state.dataset_digest = None
+if "upload_digests" not in st.session_state:
+    st.session_state.upload_digests = {}
+if "load_report" not in st.session_state:
+    st.session_state.load_report = None
+if "sql_catalog" not in st.session_state:
+    st.session_state.sql_catalog = None
+if "db_dialect" not in st.session_state:
+    st.session_state.db_dialect = None
+if "table_rows" not in st.session_state:
+    st.session_state.table_rows = None
+if "dataset_sketches" not in st.session_state:
+    st.session_state.dataset_sketches = None
+if "table_sync" not in st.session_state:
+    st.session_state.table_sync = None
+    st.session_state.sync_profile_builder = None
+if "db_load_pending" not in st.session_state:
+    st.session_state.db_load_pending = None
 
 # Sidebar for data source selection
 st.sidebar.title("🔍 Data Source & Configuration")
@@ -444,43 +830,149 @@ if data_source == "CSV File":
     uploaded_file = st.sidebar.file_uploader("📁 Upload CSV file", type=["csv"], key="csv_uploader")
     if uploaded_file:
         try:
-            df = pd.read_csv(uploaded_file)
-            st.session_state.df = df
-            st.session_state.db_conn = None
-            st.session_state.ai_assistant = None
+            # The loader caps are part of the key: a frame truncated under one setting is not the file under another
+            dataset_key = f"csv-{get_upload_digest(uploaded_file)}-{load_signature()}"
+            if st.session_state.dataset_digest != dataset_key or st.session_state.df is None:
+                dataset_cache = get_dataset_cache()
+                registry = get_dataset_registry()
+                with tracer.span("load.csv", bytes=uploaded_file.size) as span:
+                    # Another session already holds this upload: share its frame
+                    shared = registry.lookup(dataset_key, st.session_state.session_token)
+                    if shared is not None:
+                        df, cached = shared[1], registry.info(shared[0])
+                    else:
+                        df, cached = dataset_cache.get_frame(dataset_key, with_metadata=True)
+                    profile_builder = None
+                    if shared is not None:
+                        load_report = {
+                            "rows": len(df), "memory_bytes": registry.memory_bytes(shared[0]), "shared": True,
+                            "truncated": cached.get("truncated", False)
+                        }
+                    elif df is None:
+                        progress_bar = st.sidebar.progress(0.0, text="Loading CSV...")
+                        profile_builder = new_profile_builder()
+                        df, load_report = load_csv(
+                            uploaded_file, progress_callback=lambda fraction: progress_bar.progress(fraction, text="Loading CSV..."),
+                            profile_builder=profile_builder
+                        )
+                        progress_bar.empty()
+                        dataset_cache.put_frame(dataset_key, df, metadata={"rows": load_report["rows"], "truncated": load_report["truncated"]})
+                    else:
+                        load_report = {
+                            "rows": len(df), "memory_bytes": int(df.memory_usage(deep=True).sum()), "from_cache": True,
+                            "truncated": cached.get("truncated", False)
+                        }
+                    span.set("rows", len(df))
+                    span.set("from_cache", bool(load_report.get("from_cache")))
+                    span.set("shared", shared is not None)
+                    if shared is None:
+                        tracer.count("dataset_cache", "hit" if load_report.get("from_cache") else "miss")
+                close_sql_catalog()
+                release_db_conn()
+                if shared is None:
+                    share_frame(dataset_key, df, memory_bytes=load_report["memory_bytes"], info={"truncated": load_report["truncated"]})
+                else:
+                    adopt_dataset(shared)
+                st.session_state.ai_assistant = None
+                st.session_state.dataset_digest = dataset_key
+                st.session_state.load_report = load_report
+                if profile_builder is not None:
+                    # Profile accumulated while streaming the chunks
+                    get_profile_index().put(get_dataset_fingerprint(), profile_builder.finalize(dtypes=df.dtypes))
+            load_report = st.session_state.load_report
             st.sidebar.success("✅ CSV file loaded successfully")
+            if load_report.get("shared"):
+                st.sidebar.caption(f"💾 {load_report['memory_bytes'] / 1024 / 1024:.1f} MB in memory (shared with other sessions)")
+            elif load_report.get("from_cache"):
+                st.sidebar.caption(f"💾 {load_report['memory_bytes'] / 1024 / 1024:.1f} MB in memory (loaded from dataset cache)")
+            else:
+                st.sidebar.caption(
+                    f"💾 {load_report['memory_bytes'] / 1024 / 1024:.1f} MB in memory "
+                    f"(saved {load_report['saved_bytes'] / 1024 / 1024:.1f} MB through dtype compaction)"
+                )
+            if load_report.get("truncated"):
+                st.sidebar.warning(f"⚠️ File truncated to {load_report['rows']:,} rows to stay within the memory limit.")
         except Exception as e:
-            logger.error(f"Error reading CSV file: {str(e)}")
+            logger.error("Error reading CSV file: %s", e)
             st.sidebar.error(f"❌ Error reading CSV: {e}")
 
 elif data_source == "SQL File":
     uploaded_file = st.sidebar.file_uploader("📁 Upload SQL file", type=["sql"], key="sql_uploader")
     if uploaded_file:
         try:
-            conn = sqlite3.connect(':memory:')
-            cursor = conn.cursor()
-            sql_content = uploaded_file.read().decode('utf-8')
-            sql_content = preprocess_sql_for_sqlite(sql_content)
-            cursor.executescript(sql_content)
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-            tables = cursor.fetchall()
-            if tables:
-                table_name = tables[0][0]
-                df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
-                st.session_state.df = df
-                st.session_state.db_conn = None
+            dataset_key = f"sql-{get_upload_digest(uploaded_file)}"
+            if st.session_state.dataset_digest != dataset_key or st.session_state.sql_catalog is None:
+                dataset_cache = get_dataset_cache()
+                db_path = dataset_cache.path_for(dataset_key, ".sqlite") if settings.SQL_IMPORT_ON_DISK else ":memory:"
+                if db_path != ":memory:" and os.path.exists(db_path):
+                    # Another session already imported this dump: reuse its database file
+                    os.utime(db_path)
+                    with tracer.span("load.sql_catalog", bytes=uploaded_file.size):
+                        catalog = SQLiteCatalog.open(db_path, sample_rows=settings.SQL_CATALOG_SAMPLE_ROWS)
+                else:
+                    progress_bar = st.sidebar.progress(0.0, text="Importing SQL dump...")
+                    with tracer.span("load.sql_dump", bytes=uploaded_file.size) as span:
+                        conn, import_stats = load_sql_dump(
+                            uploaded_file,
+                            db_path=db_path,
+                            batch_rows=settings.SQL_IMPORT_BATCH_ROWS,
+                            commit_rows=settings.SQL_IMPORT_COMMIT_ROWS,
+                            progress_callback=lambda fraction: progress_bar.progress(fraction, text="Importing SQL dump...")
+                        )
+                        progress_bar.empty()
+                        span.set("rows", import_stats["rows"])
+                        span.set("failed_statements", import_stats["failed"])
+                    if import_stats["failed"]:
+                        st.sidebar.warning(f"⚠️ {import_stats['failed']} SQL statement(s) could not be imported.")
+                    catalog = SQLiteCatalog(conn, sample_rows=settings.SQL_CATALOG_SAMPLE_ROWS)
+                    dataset_cache.evict()
+                close_sql_catalog()
+                release_db_conn()
+                clear_session_frame()
                 st.session_state.ai_assistant = None
-                st.sidebar.success("✅ SQL file loaded successfully")
-                st.sidebar.dataframe(df.head(), use_container_width=True)
+                st.session_state.dataset_fingerprint = None
+                if catalog.table_names():
+                    st.session_state.sql_catalog = catalog
+                    st.session_state.dataset_digest = dataset_key
+                    st.session_state.table_name = catalog.table_names()[0]
+                else:
+                    catalog.close()
+                    st.session_state.dataset_digest = None
+            catalog = st.session_state.sql_catalog
+            if catalog is not None:
+                tables = catalog.tables()
+                st.sidebar.success(f"✅ SQL file loaded successfully ({len(tables)} table(s))")
+                table_names = list(tables)
+                selected_table = st.sidebar.selectbox(
+                    "🗂️ Active table",
+                    table_names,
+                    index=table_names.index(st.session_state.table_name) if st.session_state.table_name in tables else 0,
+                    format_func=lambda name: f"{name} ({tables[name]['rows']:,} rows)",
+                    key=f"sql_table_select_{dataset_key}"
+                )
+                if selected_table != st.session_state.table_name:
+                    st.session_state.table_name = selected_table
+                    clear_session_frame()
+                    st.session_state.ai_assistant = None
+                    st.session_state.dataset_fingerprint = None
+                with st.sidebar.expander("🗂️ Tables in dump"):
+                    for name, info in tables.items():
+                        st.markdown(f"**{name}** — {info['rows']:,} rows")
+                        st.text("\n".join(f"• {column}: {column_type or '?'}" for column, column_type in info["columns"]))
+                    for name, column, other, other_column in catalog.relations():
+                        st.caption(f"🔗 {name}.{column} → {other}.{other_column}")
             else:
                 st.sidebar.error("❌ No tables found in the SQL file.")
-            conn.close()
         except Exception as e:
-            logger.error(f"Error processing SQL file: {str(e)}")
+            logger.error("Error processing SQL file: %s", e)
             st.sidebar.error(f"❌ Error processing SQL file: {e}")
 
 elif data_source in ["Azure SQL", "Dataverse", "MySQL"]:
     st.sidebar.markdown("### 🔗 Enter Connection Details")
+    if st.session_state.db_load_pending:
+        # The previous run stopped while fetching rows (cancel button or browser stop)
+        st.sidebar.warning(f"⏹️ Chargement de {st.session_state.db_load_pending} annulé.")
+        st.session_state.db_load_pending = None
     if data_source == "MySQL":
         host = st.sidebar.text_input("MySQL Host (e.g., localhost):", value="localhost", key="mysql_host")
         port = st.sidebar.text_input("MySQL Port (default 3306):", value="3306", key="mysql_port")
@@ -494,10 +986,24 @@ elif data_source in ["Azure SQL", "Dataverse", "MySQL"]:
         username = st.sidebar.text_input("Username:", key="azure_user")
         password = st.sidebar.text_input("Password:", type="password", key="azure_pass")
         table_name = st.sidebar.text_input("Table Name:", key="azure_table")
+    sample_rows = st.sidebar.number_input(
+        "Rows loaded for the AI assistant:", min_value=20, max_value=1_000_000,
+        value=settings.PUSHDOWN_SAMPLE_ROWS, step=1000, key="sample_rows"
+    )
+    random_sample = st.sidebar.checkbox("Random sample (exploration)", value=False, key="random_sample")
+    sync_options = None
+    if st.sidebar.checkbox("🔄 Incremental sync (live table)", value=False, key="db_sync_enabled"):
+        sync_key = st.sidebar.text_input("Key column (e.g. IncidentNumber):", key="db_sync_key")
+        sync_modes = {"New rows (increasing key)": "key", "New and updated rows (timestamp column)": "timestamp"}
+        if data_source != "MySQL":
+            sync_modes["Inserts, updates and deletes (change tracking)"] = "change_tracking"
+        sync_mode = sync_modes[st.sidebar.selectbox("Changes to fetch:", list(sync_modes), key="db_sync_mode")]
+        sync_timestamp = st.sidebar.text_input("Last-modified column:", key="db_sync_timestamp") if sync_mode == "timestamp" else None
+        sync_options = {"key_column": sync_key.strip(), "mode": sync_mode, "timestamp_column": (sync_timestamp or "").strip() or None}
 
     if st.sidebar.button("Connect", key="connect_button"):
         if data_source == "MySQL":
-            if not all([host, database, username, table_name, port]):
+            if not all([host, database, username, table_name, port]) or not sync_options_complete(sync_options):
                 st.sidebar.error("Veuillez remplir tous les champs obligatoires.")
             else:
                 try:
@@ -508,22 +1014,45 @@ elif data_source in ["Azure SQL", "Dataverse", "MySQL"]:
                     }
                     engine = connect_to_mysql_sqlalchemy(host, database, username, password, port)
                     if engine and is_connection_valid(engine):
-                        df = pd.read_sql(f"SELECT * FROM {table_name} LIMIT 20", engine)
-                        st.session_state.df = df
-                        st.session_state.db_conn = engine
+                        source = None if random_sample or sync_options else f"mysql://{host}:{port}/{database}/{table_name}?rows={sample_rows}"
+                        handed_over = False
+                        try:
+                            df, table_rows, table_sync, shared = load_database_table(
+                                engine, table_name, "mysql", sample_rows, random_sample, sync_options, source=source
+                            )
+                            close_sql_catalog()
+                            release_db_conn()
+                            st.session_state.db_conn, handed_over = engine, True
+                            if shared is None:
+                                share_frame(source, df, info={"table_rows": table_rows})
+                            else:
+                                adopt_dataset(shared)
+                        except BaseException:
+                            # Failed or cancelled load (a rerun stops the script with an exception): give the lease back
+                            if not handed_over:
+                                get_pool_manager().release(engine)
+                            raise
+                        st.session_state.db_dialect = "mysql"
+                        st.session_state.table_rows = table_rows
                         st.session_state.table_name = table_name
                         st.session_state.ai_assistant = None
-                        st.sidebar.success("✅ Connexion MySQL établie et données chargées.")
+                        st.session_state.dataset_digest = None
+                        st.session_state.table_sync = table_sync
+                        if table_sync is not None:
+                            start_sync_profile()
+                        st.sidebar.success(f"✅ Connexion MySQL établie : échantillon de {len(df):,} lignes sur {table_rows:,}.")
                         st.sidebar.dataframe(df.head(), use_container_width=True)
                     else:
+                        if engine:
+                            get_pool_manager().release(engine)
                         st.sidebar.error("❌ Échec de la connexion MySQL.")
                 except ValueError:
                     st.sidebar.error("Le port doit être un nombre valide.")
                 except Exception as e:
-                    logger.error(f"Unexpected error during MySQL connection: {str(e)}")
+                    logger.error("Unexpected error during MySQL connection: %s", e)
                     st.sidebar.error(f"❌ Erreur inattendue : {str(e)}")
         else:
-            if not all([server, database, username, password, table_name]):
+            if not all([server, database, username, password, table_name]) or not sync_options_complete(sync_options):
                 st.sidebar.error("Veuillez remplir tous les champs obligatoires.")
             else:
                 st.session_state.connection_params = {
@@ -533,54 +1062,197 @@ elif data_source in ["Azure SQL", "Dataverse", "MySQL"]:
                 try:
                     conn = connect_to_database(server, database, username, password)
                     if is_connection_valid(conn):
-                        query = f"SELECT TOP 20 * FROM {table_name}"
-                        df = pd.read_sql(query, conn)
-                        st.session_state.df = df
-                        st.session_state.db_conn = conn
+                        source = None if random_sample or sync_options else f"mssql://{server}/{database}/{table_name}?rows={sample_rows}"
+                        handed_over = False
+                        try:
+                            df, table_rows, table_sync, shared = load_database_table(
+                                conn, table_name, "mssql", sample_rows, random_sample, sync_options, source=source
+                            )
+                            close_sql_catalog()
+                            release_db_conn()
+                            st.session_state.db_conn, handed_over = conn, True
+                            if shared is None:
+                                share_frame(source, df, info={"table_rows": table_rows})
+                            else:
+                                adopt_dataset(shared)
+                        except BaseException:
+                            # Failed or cancelled load (a rerun stops the script with an exception): give the lease back
+                            if not handed_over:
+                                get_pool_manager().release(conn)
+                            raise
+                        st.session_state.db_dialect = "mssql"
+                        st.session_state.table_rows = table_rows
                         st.session_state.table_name = table_name
                         st.session_state.ai_assistant = None
-                        st.sidebar.success("✅ Connexion établie et données chargées.")
+                        st.session_state.dataset_digest = None
+                        st.session_state.table_sync = table_sync
+                        if table_sync is not None:
+                            start_sync_profile()
+                        st.sidebar.success(f"✅ Connexion établie : échantillon de {len(df):,} lignes sur {table_rows:,}.")
                         st.sidebar.dataframe(df.head(), use_container_width=True)
                     else:
+                        if conn:
+                            get_pool_manager().release(conn)
                         st.sidebar.error("❌ Échec de la connexion à la base de données.")
                 except Exception as e:
-                    logger.error(f"Azure SQL/Dataverse connection error: {str(e)}")
+                    logger.error("Azure SQL/Dataverse connection error: %s", e)
                     st.sidebar.error(f"❌ Error: {e}")
 
     if st.session_state.db_conn and is_connection_valid(st.session_state.db_conn):
         if st.sidebar.button("Disconnect", key="disconnect_button"):
             try:
-                if isinstance(st.session_state.db_conn, pyodbc.Connection):
-                    st.session_state.db_conn.close()
-                st.session_state.db_conn = None
+                release_db_conn()
+                st.session_state.db_dialect = None
+                st.session_state.table_rows = None
                 st.session_state.connection_params = None
-                st.session_state.df = None
+                clear_session_frame()
                 st.session_state.ai_assistant = None
+                st.session_state.dataset_fingerprint = None
+                st.session_state.dataset_digest = None
                 st.session_state.table_name = None
                 st.sidebar.success("✅ Disconnected from database.")
             except Exception as e:
-                logger.error(f"Error closing connection: {str(e)}")
+                logger.error("Error closing connection: %s", e)
                 st.sidebar.error(f"❌ Error closing connection: {e}")
                 st.session_state.db_conn = None
 
+    # Synced tables catch up with the server on the first rerun after the interval, or on demand
+    table_sync = st.session_state.table_sync
+    if table_sync is not None and st.session_state.df is not None:
+        if st.sidebar.button("🔄 Sync now", key="sync_button") or table_sync.due(settings.DB_SYNC_INTERVAL_SECONDS):
+            try:
+                with st.spinner(f"🔄 Syncing {table_sync.table}..."):
+                    sync_database_table()
+            except Exception as e:
+                logger.error("Error syncing table %s: %s", table_sync.table, e)
+                st.sidebar.error(f"❌ Synchronisation impossible : {e}")
+        result = table_sync.last_result
+        status = f"🔄 Dernière synchronisation : {datetime.fromtimestamp(table_sync.last_sync):%H:%M:%S}"
+        if result is not None:
+            status += f" — {result.inserted:,} nouvelles, {result.updated:,} modifiées, {result.deleted:,} supprimées"
+            if not result.complete:
+                status += " (suite à la prochaine synchronisation)"
+        st.sidebar.caption(status)
+
 # Data information display
-if st.session_state.df is not None:
+if st.session_state.df is not None or st.session_state.sql_catalog is not None:
     df = st.session_state.df
+    if df is None:
+        # SQL catalog table not materialized yet: describe it from its metadata
+        catalog = st.session_state.sql_catalog
+        table_info = catalog.tables()[st.session_state.table_name]
+        row_count, preview = table_info["rows"], catalog.sample([st.session_state.table_name]).head()
+        column_types = table_info["columns"]
+    else:
+        row_count, preview = len(df), df.head()
+        column_types = [(col, df[col].dtype) for col in df.columns]
+        if st.session_state.db_conn is not None and st.session_state.table_rows is not None:
+            # Live connection: df is only a sample of the server table
+            row_count = st.session_state.table_rows
     st.sidebar.markdown("---")
     st.sidebar.markdown("### 📈 Dataset Information")
     col1, col2 = st.sidebar.columns(2)
     with col1:
-        st.metric("📊 Rows", len(df))
+        st.metric("📊 Rows", row_count)
     with col2:
-        st.metric("📋 Columns", len(df.columns))
+        st.metric("📋 Columns", len(column_types))
     with st.sidebar.expander("👁️ Data Preview", expanded=False):
-        st.dataframe(df.head())
+        st.dataframe(preview)
     with st.sidebar.expander("🔍 Column Details"):
-        for col in df.columns:
-            st.text(f"• {col}: {df[col].dtype}")
+        profile = get_dataset_profile()
+        for col, column in profile["columns"].items():
+            st.text(f"• {col}: {column['dtype']}")
+            details = f"  {format_distinct(column)} distinct, {column['null_ratio']:.1%} null"
+            if "min" in column:
+                details += f", {format_value(column['min'])} → {format_value(column['max'])}"
+            elif column.get("top"):
+                details += f", top: {column['top'][0][0]}"
+            st.caption(details)
+        if profile["sampled"]:
+            st.caption(f"Profiled from a {profile['profiled_rows']:,}-row sample.")
+    with st.sidebar.expander("⚡ Answer Cache"):
+        cache_stats = get_answer_cache().stats()
+        st.text(f"• Hits: {cache_stats['hits']} / Misses: {cache_stats['misses']}")
+        st.text(f"• Hit rate: {cache_stats['hit_rate']:.0%}")
+        st.text(f"• Entries: {cache_stats['entries']} ({cache_stats['size_bytes'] / 1024 / 1024:.1f} MB)")
+        question_index = get_question_index()
+        if question_index is not None:
+            index_stats = question_index.stats()
+            st.text(f"• Similar questions: {index_stats['reuses']} reused, {index_stats['suggestions']} suggested")
+            st.text(f"• Questions indexed: {index_stats['entries']} ({index_stats['loaded_entries']} in memory)")
+        if st.button("Clear answer cache", key="clear_answer_cache"):
+            get_answer_cache().clear()
+            if question_index is not None:
+                question_index.clear()
+            st.rerun()
+    with st.sidebar.expander("🧠 Memory"):
+        registry_stats = get_dataset_registry().stats()
+        current = next((dataset for dataset in registry_stats["datasets"]
+                        if dataset["fingerprint"] == st.session_state.dataset_fingerprint), None)
+        if current:
+            st.text(f"• This dataset: {current['memory_bytes'] / 1024 / 1024:.1f} MB, shared by {current['sessions']} session(s)")
+            st.text("• AI assistant: zero-copy view (copy-on-write)")
+        idle = sum(1 for dataset in registry_stats["datasets"] if not dataset["sessions"])
+        st.text(f"• Datasets in memory: {len(registry_stats['datasets'])}, {idle} idle "
+                f"({registry_stats['memory_bytes'] / 1024 / 1024:.1f} / {registry_stats['max_bytes'] / 1024 / 1024:.0f} MB)")
+        st.text(f"• Saved by sharing: {registry_stats['saved_bytes'] / 1024 / 1024:.1f} MB "
+                f"({registry_stats['hits']} shared loads, {registry_stats['evictions']} evictions)")
+        if registry_stats["datasets"]:
+            st.dataframe(pd.DataFrame([{
+                "dataset": (dataset["sources"] or [dataset["fingerprint"][:12]])[0],
+                "rows": dataset["rows"],
+                "MB": round(dataset["memory_bytes"] / 1024 / 1024, 1),
+                "sessions": dataset["sessions"],
+            } for dataset in registry_stats["datasets"]]), hide_index=True, use_container_width=True)
+        assistant_stats = get_assistant_registry().stats()
+        st.text(f"• Assistants built / reused: {assistant_stats['builds']} / {assistant_stats['reuses']}")
+        result_stats = st.session_state.result_store.stats()
+        st.text(f"• Chat results: {result_stats['results']} ({result_stats['memory_bytes'] / 1024 / 1024:.1f} / "
+                f"{result_stats['memory_budget_bytes'] / 1024 / 1024:.0f} MB in memory, "
+                f"{result_stats['disk_bytes'] / 1024 / 1024:.1f} MB on disk)")
+        st.text(f"• Process RSS: {psutil.Process().memory_info().rss / 1024 / 1024:.0f} MB")
+    with st.sidebar.expander("⏱️ Performance"):
+        stage_stats = tracer.stats()
+        if stage_stats:
+            st.dataframe(
+                pd.DataFrame(stage_stats)[["stage", "count", "p50_ms", "p95_ms", "rows"]].round(1),
+                hide_index=True, use_container_width=True
+            )
+        else:
+            st.caption("No timings recorded yet.")
+        counters = tracer.counters()
+        routes = counters.get("query.route", {})
+        if routes:
+            answered = sum(count for route, count in routes.items() if route in ("special", "approx", "local", "server", "cache", "similar"))
+            st.text(f"• Answered without the LLM: {answered / sum(routes.values()):.0%}")
+            st.text("• Routes: " + ", ".join(f"{route} {count}" for route, count in sorted(routes.items())))
+        st.text(f"• Answer cache hit rate: {get_answer_cache().stats()['hit_rate']:.0%}")
+        dataset_hits = counters.get("dataset_cache", {})
+        if dataset_hits:
+            st.text(f"• Dataset cache hit rate: {dataset_hits.get('hit', 0) / sum(dataset_hits.values()):.0%}")
+        # Spans are serialized only on request, not on every rerun
+        if st.button("📤 Export spans", key="export_spans"):
+            col_jsonl, col_otlp = st.columns(2)
+            with col_jsonl:
+                st.download_button("JSON lines", tracer.export_jsonl(), file_name="spans.jsonl",
+                                   mime="application/x-ndjson", on_click="ignore", key="export_spans_jsonl")
+            with col_otlp:
+                st.download_button("OTLP JSON", tracer.export_otlp(), file_name="spans.otlp.json",
+                                   mime="application/json", on_click="ignore", key="export_spans_otlp")
     if st.session_state.db_conn:
         st.sidebar.markdown("### 🔗 Connection Status")
         st.sidebar.markdown('<p class="status-connected">🟢 Connected to database</p>', unsafe_allow_html=True)
+        if settings.PUSHDOWN_ENABLED:
+            st.sidebar.caption(f"🗄️ Aggregations run on the server; the AI assistant sees a {len(df):,}-row sample.")
+        with st.sidebar.expander("🔌 Connection Pools"):
+            for pool_stats in get_pool_manager().stats():
+                health_age = pool_stats["health_age_seconds"]
+                st.markdown(f"**{pool_stats['kind']}** · {pool_stats['label']}")
+                st.text(f"• Users: {pool_stats['users']} / In use: {pool_stats['in_use']} / Idle: {pool_stats['idle']}")
+                st.text(f"• Connect: {pool_stats['connect']['avg_ms']:.0f} ms avg, {pool_stats['connect']['p95_ms']:.0f} ms p95 ({pool_stats['connect']['count']})")
+                st.text(f"• Checkout: {pool_stats['checkout']['avg_ms']:.1f} ms avg, {pool_stats['checkout']['p95_ms']:.1f} ms p95 ({pool_stats['checkout']['count']})")
+                st.text(f"• Health: {'🟢' if pool_stats['healthy'] else '🔴'} checked {health_age:.0f}s ago, {pool_stats['health']['avg_ms']:.0f} ms avg"
+                        if health_age is not None else "• Health: not checked yet")
     st.sidebar.markdown("---")
     st.sidebar.markdown("### 💡 Query Examples")
     with st.sidebar.expander("Examples"):
@@ -606,16 +1278,9 @@ col1, col2 = st.columns([1, 2])
 with col1:
     st.markdown("## 🤖 AI Data Assistant")
     
-    if st.session_state.df is not None and PANDASAI_AVAILABLE:
-        # Prepare AI assistant
-        if st.session_state.ai_assistant is None:
-            try:
-                with st.spinner("🔄 Initializing AI assistant..."):
-                    st.session_state.ai_assistant = create_ai_assistant(st.session_state.df)
-                if st.session_state.ai_assistant:
-                    st.success("✅ AI assistant ready!")
-            except Exception as e:
-                st.error(f"Error initializing AI assistant: {e}")
+    if (st.session_state.df is not None or st.session_state.sql_catalog is not None) and PANDASAI_AVAILABLE:
+        # The AI assistant is created by the first question that needs the LLM, so
+        # sessions answered locally never import PandasAI
         
         # FIXED CHAT CONTAINER - This is the key fix
         
@@ -628,23 +1293,40 @@ with col1:
             </div>
             """, unsafe_allow_html=True)
         
-        # Display all chat messages within the fixed container
-        for msg in st.session_state.chat_messages:
-            if msg["role"] == "user":
-                display_chat_message("user", msg["content"], msg.get("timestamp"))
-            elif msg["role"] == "assistant":
-                display_chat_message(
-                    "assistant", 
-                    msg["content"], 
-                    msg.get("timestamp"),
-                    msg.get("extra_content"),
-                    msg.get("content_type")
-                )
-            elif msg["role"] == "error":
-                display_chat_message("error", msg["content"], msg.get("timestamp"))
+        # Pick up answers that finished in the background since the last run
+        collect_finished_jobs()
+        
+        with tracer.span("chat.render", messages=len(st.session_state.chat_messages)):
+            # Older messages collapse into pre-rendered snapshots; only the recent window renders live
+            older_messages, live_messages = split_history(st.session_state.chat_messages, settings.CHAT_LIVE_MESSAGES)
+            if older_messages:
+                # Snapshots are only built while the history is shown; their tables and charts are
+                # cached in the session's result store, under its memory budget
+                if st.toggle(f"📜 Show {len(older_messages)} earlier messages", key="show_chat_history"):
+                    snapshots = [message_snapshot(msg, settings.CHAT_SNAPSHOT_ROWS, st.session_state.result_store) for msg in older_messages]
+                    st.markdown("".join(snapshots), unsafe_allow_html=True)
+        
+            # Display the recent chat messages within the fixed container
+            for msg in live_messages:
+                if msg["role"] == "user":
+                    display_chat_message("user", msg["content"], msg.get("timestamp"))
+                elif msg["role"] == "assistant":
+                    display_chat_message(
+                        "assistant", 
+                        msg["content"], 
+                        msg.get("timestamp"),
+                        msg.get("extra_content"),
+                        msg.get("content_type"),
+                        msg.get("cache_status")
+                    )
+                elif msg["role"] == "error":
+                    display_chat_message("error", msg["content"], msg.get("timestamp"))
         
         # Close the chat container
         
+        # Questions still being answered in the background, filled in after the input is handled
+        pending_area = st.container()
+        
         # Auto-scroll to bottom when new messages are added
         if st.session_state.chat_messages:
             auto_scroll_chat()
@@ -663,6 +1345,12 @@ with col1:
                     key="user_question",
                     label_visibility="collapsed"
                 )
+                approximate = st.checkbox(
+                    "≈ Approximate answer",
+                    key="approximate_mode",
+                    help="Answer this question from the sketches built at load time (distinct counts, quantiles, "
+                         "frequent values), with error bounds, instead of scanning the data. Needs a fully loaded dataset."
+                )
             
             with col_send:
                 send_button = st.form_submit_button("Send 🚀", use_container_width=False)
@@ -671,76 +1359,185 @@ with col1:
                 clear_button = st.form_submit_button("Clear 🗑️", use_container_width=False)
         
         # Handle chat input
-        if send_button and user_input.strip() and st.session_state.ai_assistant and not st.session_state.processing_query:
-            st.session_state.processing_query = True
-            
-            # Validate query
-            is_valid, error_msg = is_meaningful_query(user_input)
-            
-            if not is_valid:
-                # Add error message
-                st.session_state.chat_messages.append({
-                    "role": "error",
-                    "content": error_msg,
-                    "timestamp": datetime.now().strftime("%H:%M")
-                })
-            else:
-                # Add user message
-                st.session_state.chat_messages.append({
-                    "role": "user",
-                    "content": user_input,
-                    "timestamp": datetime.now().strftime("%H:%M")
-                })
+        if send_button and user_input.strip():
+            with tracer.span("query.send", question_length=len(user_input)) as send_span:
+                # Validate query
+                with tracer.span("query.validate"):
+                    is_valid, error_msg = is_meaningful_query(user_input)
                 
-                # Process query
-                try:
-                    # Check for special queries first
-                    special_type, special_response = handle_special_queries(user_input, st.session_state.df)
-                    
-                    if special_type:
-                        response_type = special_type
-                        response = special_response
-                    else:
-                        # Use PandasAI
-                        with st.spinner("🤔 Thinking..."):
-                            response_type, response = execute_pandasai_query(st.session_state.ai_assistant, user_input)
-                    
-                    # Add assistant response
-                    assistant_msg = {
-                        "role": "assistant",
-                        "timestamp": datetime.now().strftime("%H:%M"),
-                        "content_type": response_type
-                    }
-                    
-                    # Handle different response types
-                    if response_type == "text":
-                        assistant_msg["content"] = response
-                    elif response_type == "dataframe":
-                        assistant_msg["content"] = "Here's the data you requested:"
-                        assistant_msg["extra_content"] = response
-                    elif response_type == "chart":
-                        assistant_msg["content"] = "I've created this visualization for you:"
-                        assistant_msg["extra_content"] = response
-                    else:
-                        assistant_msg["content"] = str(response)
-                    
-                    st.session_state.chat_messages.append(assistant_msg)
-                    
-                except Exception as e:
+                if not is_valid:
+                    send_span.set("route", "rejected")
                     # Add error message
                     st.session_state.chat_messages.append({
                         "role": "error",
-                        "content": f"Error processing your request: {str(e)}",
+                        "content": error_msg,
+                        "timestamp": datetime.now().strftime("%H:%M")
+                    })
+                else:
+                    # Add user message
+                    st.session_state.chat_messages.append({
+                        "role": "user",
+                        "content": user_input,
                         "timestamp": datetime.now().strftime("%H:%M")
                     })
+                    
+                    # Process query
+                    try:
+                        catalog = st.session_state.sql_catalog
+                        query_tables = catalog.tables_for_question(user_input, st.session_state.table_name) if catalog else None
+                        use_catalog = catalog is not None and (st.session_state.df is None or len(query_tables) > 1)
+                        use_pushdown = settings.PUSHDOWN_ENABLED and st.session_state.db_conn is not None and st.session_state.db_dialect is not None
+                        cache_status = None
+                        
+                        # Check for special queries first
+                        with tracer.span("query.special"):
+                            if use_catalog and len(query_tables) > 1:
+                                special_type, special_response = handle_special_queries(
+                                    user_input, catalog.sample(query_tables), row_count=catalog.row_count(query_tables)
+                                )
+                            elif use_catalog:
+                                special_type, special_response = handle_special_queries(
+                                    user_input, catalog.sample(query_tables), profile=get_dataset_profile()
+                                )
+                            else:
+                                special_type, special_response = handle_special_queries(
+                                    user_input, st.session_state.df, profile=get_dataset_profile()
+                                )
+                        if special_type:
+                            send_span.set("route", "special")
+                        
+                        sketches = get_dataset_sketches() if approximate and not special_type and not (use_catalog and len(query_tables) > 1) else None
+                        if sketches is not None:
+                            with tracer.span("query.approx", rows=sketches.rows) as span:
+                                frame = catalog.sample(query_tables) if use_catalog else st.session_state.df
+                                special_type, special_response = answer_approximately(user_input, frame, sketches)
+                                span.set("answered", special_type is not None)
+                            if special_type:
+                                cache_status = "approx"
+                                send_span.set("route", "approx")
+                        
+                        if not special_type:
+                            # Try the local aggregation engine before PandasAI
+                            if use_catalog:
+                                with tracer.span("query.catalog", rows=catalog.row_count(query_tables)) as span:
+                                    special_type, special_response = answer_from_catalog(catalog, query_tables, user_input)
+                                    span.set("answered", special_type is not None)
+                            elif use_pushdown:
+                                # Compile the question to SQL so only the result set leaves the server
+                                with st.spinner("🗄️ Running on the database..."), tracer.span("query.server", rows=st.session_state.table_rows or 0) as span:
+                                    special_type, special_response = answer_on_server(
+                                        user_input, st.session_state.db_conn, st.session_state.table_name,
+                                        st.session_state.db_dialect, st.session_state.df
+                                    )
+                                    span.set("answered", special_type is not None)
+                                if special_type:
+                                    cache_status = "server"
+                            else:
+                                with tracer.span("query.local", rows=len(st.session_state.df)) as span:
+                                    special_type, special_response = answer_locally(user_input, st.session_state.df)
+                                    span.set("answered", special_type is not None)
+                            if special_type and cache_status is None:
+                                cache_status = "local"
+                            if special_type:
+                                send_span.set("route", cache_status)
+                        
+                        if special_type:
+                            st.session_state.chat_messages.append(build_chat_message(special_type, special_response, cache_status))
+                        else:
+                            # Look up the answer cache before calling PandasAI
+                            answer_cache = get_answer_cache()
+                            question_index = get_question_index()
+                            multi_table = catalog is not None and len(query_tables) > 1
+                            with tracer.span("query.cache_lookup") as span:
+                                if multi_table:
+                                    data_fingerprint = catalog_fingerprint(st.session_state.dataset_digest, query_tables)
+                                else:
+                                    data_fingerprint = get_dataset_fingerprint()
+                                fingerprint = data_fingerprint
+                                if sketches is not None:
+                                    # Approximate answers are cached apart from exact ones
+                                    fingerprint = f"{fingerprint}-approx"
+                                cached = answer_cache.get(fingerprint, user_input)
+                                span.set("hit", cached is not None)
+                            similar = None
+                            if not cached:
+                                # A rephrasing of a question already answered reuses its answer
+                                with tracer.span("query.similar") as span:
+                                    similar, cached = find_similar_answer(answer_cache, question_index, fingerprint, user_input)
+                                    span.set("score", round(similar.score, 3) if similar else None)
+                                    span.set("hit", cached is not None)
+                            if cached and similar:
+                                send_span.set("route", "similar")
+                                st.session_state.chat_messages.append(build_similar_message(similar, cached))
+                            elif cached:
+                                send_span.set("route", "cache")
+                                st.session_state.chat_messages.append(build_chat_message(*cached, cache_status="hit"))
+                            elif len(st.session_state.llm_jobs) >= settings.LLM_MAX_PENDING_PER_SESSION:
+                                send_span.set("route", "throttled")
+                                st.session_state.chat_messages.append(build_chat_message(
+                                    "error", "Trop de questions en cours. Attendez une réponse ou annulez une question."
+                                ))
+                            else:
+                                send_span.set("route", "llm")
+                                with tracer.span("llm.prepare") as span:
+                                    if multi_table:
+                                        # Cross-table question: let SQLite join the tables it mentions
+                                        with st.spinner(f"📥 Joining {', '.join(query_tables)}..."):
+                                            query_df = catalog.select(query_tables)
+                                        assistant = None
+                                        description = None
+                                    else:
+                                        get_active_dataframe()
+                                        query_df = st.session_state.df
+                                        description = profile_description(get_dataset_profile())
+                                        if sketches is not None:
+                                            # A one-off assistant whose context carries the sketch estimates
+                                            assistant = None
+                                            description += "\n\n" + sketch_description(sketches)
+                                        else:
+                                            assistant = get_session_assistant()
+                                    span.set("rows", len(query_df))
+                                # Use PandasAI in the background; the answer is cached once it arrives
+                                job = LLMJob(
+                                    user_input,
+                                    assistant,
+                                    assistant_factory=lambda frame=query_df, description=description, key=data_fingerprint: create_ai_assistant(
+                                        frame, description, key
+                                    ),
+                                    on_result=lambda job, result, fingerprint=fingerprint: remember_answer(
+                                        answer_cache, question_index, fingerprint, job.question, result
+                                    ),
+                                    timeout_seconds=settings.LLM_TIMEOUT_SECONDS,
+                                    # A close past question is offered while PandasAI works
+                                    context={"span": send_span, "similar": similar, "fingerprint": fingerprint}
+                                )
+                                st.session_state.llm_jobs.append(get_llm_executor().submit(job))
+                        
+                    except Exception as e:
+                        send_span.status = "error"
+                        send_span.error = str(e)
+                        # Add error message
+                        st.session_state.chat_messages.append({
+                            "role": "error",
+                            "content": f"Error processing your request: {str(e)}",
+                            "timestamp": datetime.now().strftime("%H:%M")
+                        })
+            tracer.count("query.route", send_span.attributes.get("route", "error"))
             
-            st.session_state.processing_query = False
             st.rerun()
         
         # Clear chat
         if clear_button:
+            for job in st.session_state.llm_jobs:
+                get_llm_executor().cancel(job)
+            st.session_state.llm_jobs = []
             st.session_state.chat_messages = []
+            st.session_state.result_store.clear()
             st.rerun()
+        
+        if st.session_state.llm_jobs:
+            with pending_area:
+                render_pending_jobs()
     
     else:
         # No data or PandasAI not available
@@ -0,0 +1,226 @@
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Function to compute a stable fingerprint of a DataFrame (schema + content)
+def dataframe_fingerprint(df):
+    hasher = hashlib.sha256()
+    schema = [(str(col), str(dtype)) for col, dtype in df.dtypes.items()]
+    hasher.update(json.dumps(schema).encode("utf-8"))
+    hasher.update(str(df.shape).encode("utf-8"))
+    try:
+        row_hashes = pd.util.hash_pandas_object(df, index=True)
+    except TypeError:
+        # Unhashable cells (lists, dicts...) are hashed through their string form
+        row_hashes = pd.util.hash_pandas_object(df.astype(str), index=True)
+    hasher.update(row_hashes.values.tobytes())
+    return hasher.hexdigest()
+
+# Function to normalize a question so trivial rephrasings share a cache entry
+def normalize_question(question):
+    text = unicodedata.normalize("NFKD", question.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+# Function to convert a chart response into PNG bytes
+def chart_to_png(chart):
+    if isinstance(chart, (bytes, bytearray)):
+        return bytes(chart)
+    figure = chart if hasattr(chart, "savefig") else getattr(chart, "figure", None)
+    if figure is not None and hasattr(figure, "savefig"):
+        buffer = io.BytesIO()
+        figure.savefig(buffer, format="png", bbox_inches="tight")
+        return buffer.getvalue()
+    if hasattr(chart, "get_base64_image"):
+        return base64.b64decode(chart.get_base64_image())
+    return None
+
+
+# Disk-backed cache of assistant answers keyed by dataset fingerprint and question.
+# Entries are indexed in SQLite; text is stored inline, DataFrames as pickles and
+# charts as PNG files. Eviction is LRU on last access, bounded by count, size and TTL.
+class AnswerCache:
+    def __init__(self, cache_dir, max_entries=1000, max_bytes=256 * 1024 * 1024, ttl_seconds=7 * 24 * 3600):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                question TEXT NOT NULL,
+                content_type TEXT NOT NULL,
+                text_value TEXT,
+                file_name TEXT,
+                size_bytes INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                hit_count INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_last_access ON answers (last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(fingerprint, question):
+        return hashlib.sha256(f"{fingerprint}\0{normalize_question(question)}".encode("utf-8")).hexdigest()
+
+    def get(self, fingerprint, question):
+        key = self.make_key(fingerprint, question)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content_type, text_value, file_name, created_at FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            content_type, text_value, file_name, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                self._delete_locked(key, file_name)
+                self._conn.commit()
+                self.misses += 1
+                return None
+            try:
+                value = self._load_value(content_type, text_value, file_name)
+            except Exception as e:
+                logger.warning("Dropping unreadable answer cache entry %s: %s", key, e)
+                self._delete_locked(key, file_name)
+                self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE answers SET last_access = ?, hit_count = hit_count + 1 WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+        return content_type, value
+
+    def put(self, fingerprint, question, content_type, value):
+        key = self.make_key(fingerprint, question)
+        text_value, file_name, size_bytes = None, None, 0
+        try:
+            if content_type == "dataframe":
+                file_name = f"{key}.pkl"
+                size_bytes = self._write_file(file_name, lambda f: value.to_pickle(f))
+            elif content_type == "chart":
+                png = chart_to_png(value)
+                if png is None:
+                    return False
+                file_name = f"{key}.png"
+                size_bytes = self._write_file(file_name, lambda f: f.write(png))
+            else:
+                text_value = str(value)
+                size_bytes = len(text_value.encode("utf-8"))
+        except Exception as e:
+            logger.warning("Could not store answer in cache: %s", e)
+            return False
+        if size_bytes > self.max_bytes:
+            if file_name:
+                self._remove_file(file_name)
+            return False
+        now = time.time()
+        with self._lock:
+            previous = self._conn.execute("SELECT file_name FROM answers WHERE key = ?", (key,)).fetchone()
+            if previous and previous[0] and previous[0] != file_name:
+                self._remove_file(previous[0])
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers "
+                "(key, fingerprint, question, content_type, text_value, file_name, size_bytes, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, fingerprint, normalize_question(question), content_type, text_value, file_name, size_bytes, now, now)
+            )
+            self._evict_locked(now)
+            self._conn.commit()
+        return True
+
+    def clear(self):
+        with self._lock:
+            for (file_name,) in self._conn.execute("SELECT file_name FROM answers WHERE file_name IS NOT NULL").fetchall():
+                self._remove_file(file_name)
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            entries, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM answers"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "size_bytes": total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _load_value(self, content_type, text_value, file_name):
+        if content_type == "dataframe":
+            return pd.read_pickle(os.path.join(self.cache_dir, file_name))
+        if content_type == "chart":
+            with open(os.path.join(self.cache_dir, file_name), "rb") as f:
+                return f.read()
+        return text_value
+
+    def _write_file(self, file_name, writer):
+        path = os.path.join(self.cache_dir, file_name)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            writer(f)
+        os.replace(tmp_path, path)
+        return os.path.getsize(path)
+
+    def _remove_file(self, file_name):
+        try:
+            os.remove(os.path.join(self.cache_dir, file_name))
+        except FileNotFoundError:
+            pass
+
+    def _delete_locked(self, key, file_name):
+        self._conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+        if file_name:
+            self._remove_file(file_name)
+
+    def _evict_locked(self, now):
+        if self.ttl_seconds:
+            expired = self._conn.execute(
+                "SELECT key, file_name FROM answers WHERE created_at < ?", (now - self.ttl_seconds,)
+            ).fetchall()
+            for key, file_name in expired:
+                self._delete_locked(key, file_name)
+        entries, total_bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM answers"
+        ).fetchone()
+        if entries <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+        for key, file_name, size_bytes in self._conn.execute(
+            "SELECT key, file_name, size_bytes FROM answers ORDER BY last_access ASC"
+        ).fetchall():
+            if entries <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            self._delete_locked(key, file_name)
+            entries -= 1
+            total_bytes -= size_bytes
+            logger.debug("Evicted answer cache entry %s", key)
@@ -0,0 +1,77 @@
+import logging
+import threading
+import weakref
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# Marker object stored in each session's state; when a session ends its token is
+# garbage collected, which removes the session from the registry's sharing counts
+class SessionToken:
+    __slots__ = ("__weakref__",)
+
+
+# Process-wide registry of AI assistants keyed by dataset fingerprint. Sessions holding
+# the same dataset (shared through the DatasetRegistry) get the same assistant, which
+# pandas copy-on-write lets wrap the frame without copying its buffers. Entries are
+# held weakly, so they disappear once no session references them. Assistants are built
+# outside the lock; sessions asking for one being built wait for that build.
+class AssistantRegistry:
+    def __init__(self):
+        self._assistants = weakref.WeakValueDictionary()
+        self._sessions = weakref.WeakKeyDictionary()
+        self._building = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.reuses = 0
+
+    # Function to get the assistant of a dataset, building it from `df` with `factory` on first use
+    def acquire(self, fingerprint, df, factory, session_token):
+        with self._lock:
+            assistant = self._assistants.get(fingerprint)
+            build = None
+            if assistant is not None:
+                self.reuses += 1
+            elif fingerprint in self._building:
+                pending = self._building[fingerprint]
+            else:
+                pending = build = self._building[fingerprint] = Future()
+        if assistant is None and build is None:
+            assistant = pending.result()
+            if assistant is None:
+                return None
+            with self._lock:
+                self.reuses += 1
+        elif build is not None:
+            try:
+                assistant = factory(df)
+            except BaseException as e:
+                with self._lock:
+                    del self._building[fingerprint]
+                build.set_exception(e)
+                raise
+            with self._lock:
+                del self._building[fingerprint]
+                if assistant is not None:
+                    self._assistants[fingerprint] = assistant
+                    self.builds += 1
+            build.set_result(assistant)
+            if assistant is None:
+                return None
+        with self._lock:
+            self._sessions[session_token] = fingerprint
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Assistant for %s shared by %d session(s)", fingerprint[:12], self.sessions_for(fingerprint))
+        return assistant
+
+    def sessions_for(self, fingerprint):
+        return sum(1 for value in list(self._sessions.values()) if value == fingerprint)
+
+    def stats(self):
+        with self._lock:
+            assistants = len(self._assistants)
+        return {
+            "assistants": assistants,
+            "builds": self.builds,
+            "reuses": self.reuses,
+        }
@@ -0,0 +1,367 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+
+import pandas as pd
+
+import settings
+from answer_cache import AnswerCache, chart_to_png, dataframe_fingerprint
+from dataset_cache import DatasetCache, content_digest
+from dataset_profile import ProfileIndex, new_profile_builder, profile_description
+from llm_executor import LLMExecutor, LLMJob, configure_pandasai
+from loaders import load_csv, load_signature
+from logging_setup import configure_logging, parse_module_levels
+from query_engine import answer_approximately, answer_locally, handle_special_queries, is_meaningful_query
+from question_index import QuestionIndex
+from sketches import DatasetSketches, sketch_description
+from sql_catalog import SQLiteCatalog, answer_from_catalog, catalog_fingerprint
+from sql_import import load_sql_dump
+from tracing import LatencyStats, get_tracer
+
+logger = logging.getLogger(__name__)
+tracer = get_tracer()
+
+# File extension of each kind of written answer
+RESULT_EXTENSIONS = {"text": ".md", "dataframe": ".parquet", "chart": ".png"}
+
+# Function to read the questions of a file (or "-" for stdin): one per line, "#" starts a comment
+def read_questions(path):
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        return [line.strip() for line in stream if line.strip() and not line.lstrip().startswith("#")]
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+# A loaded data source with everything the question pipeline needs: the frame of the
+# active table, its fingerprint and profile, and the SQLite catalog of a .sql dump
+class BatchDataset:
+    def __init__(self, df, fingerprint, profile, dataset_key, catalog=None, table=None):
+        self.df = df
+        self.fingerprint = fingerprint
+        self.profile = profile
+        self.dataset_key = dataset_key
+        self.catalog = catalog
+        self.table = table
+        self.sketches = None
+        if profile is not None and not profile["sampled"] and "sketches" in profile:
+            self.sketches = DatasetSketches.from_dict(profile["sketches"])
+
+    def close(self):
+        if self.catalog is not None:
+            self.catalog.close()
+
+# Function to load a CSV file or .sql dump, reusing the app's dataset cache and profile index
+def load_dataset(path, table=None):
+    dataset_cache = DatasetCache(settings.DATASET_CACHE_DIR, max_bytes=settings.DATASET_CACHE_MAX_BYTES)
+    profile_index = ProfileIndex(settings.PROFILE_DIR, max_entries=settings.PROFILE_MAX_ENTRIES)
+    with open(path, "rb") as f:
+        digest = content_digest(f)
+        if path.lower().endswith(".sql"):
+            dataset_key = f"sql-{digest}"
+            db_path = dataset_cache.path_for(dataset_key, ".sqlite")
+            with tracer.span("load.sql_dump", bytes=os.path.getsize(path)) as span:
+                if os.path.exists(db_path):
+                    os.utime(db_path)
+                    catalog = SQLiteCatalog.open(db_path, sample_rows=settings.SQL_CATALOG_SAMPLE_ROWS)
+                else:
+                    conn, stats = load_sql_dump(f, db_path=db_path, batch_rows=settings.SQL_IMPORT_BATCH_ROWS,
+                                                commit_rows=settings.SQL_IMPORT_COMMIT_ROWS)
+                    if stats["failed"]:
+                        logger.warning("%d SQL statement(s) could not be imported from %s", stats["failed"], path)
+                    catalog = SQLiteCatalog(conn, sample_rows=settings.SQL_CATALOG_SAMPLE_ROWS)
+                    dataset_cache.evict()
+                if not catalog.table_names():
+                    catalog.close()
+                    raise ValueError(f"No table found in {path}")
+                table = table or catalog.table_names()[0]
+                if table not in catalog.tables():
+                    catalog.close()
+                    raise ValueError(f"Table {table} not found in {path}: {', '.join(catalog.table_names())}")
+                df = catalog.select([table])
+                span.set("rows", len(df))
+            fingerprint = catalog_fingerprint(dataset_key, [table])
+            profile = profile_index.get_or_build(fingerprint, lambda: new_profile_builder().update(df).finalize())
+            return BatchDataset(df, fingerprint, profile, dataset_key, catalog, table)
+
+        dataset_key = f"csv-{digest}-{load_signature()}"
+        with tracer.span("load.csv", bytes=os.path.getsize(path)) as span:
+            df, cached = dataset_cache.get_frame(dataset_key, with_metadata=True)
+            builder = None
+            if df is None:
+                builder = new_profile_builder()
+                df, report = load_csv(f, profile_builder=builder)
+                cached = {"rows": report["rows"], "truncated": report["truncated"]}
+                dataset_cache.put_frame(dataset_key, df, metadata=cached)
+            if cached.get("truncated"):
+                logger.warning("%s truncated to %d rows to stay within the memory limit", path, len(df))
+            span.set("rows", len(df))
+            span.set("from_cache", builder is None)
+    fingerprint = dataframe_fingerprint(df)
+    if builder is not None:
+        profile_index.put(fingerprint, builder.finalize(dtypes=df.dtypes))
+    profile = profile_index.get_or_build(fingerprint, lambda: new_profile_builder().update(df).finalize())
+    return BatchDataset(df, fingerprint, profile, dataset_key)
+
+
+# Runs a list of questions through the app's pipeline without Streamlit: validation,
+# special queries, sketches (approximate mode), the local engine or SQLite catalog and
+# the shared answer cache (and the index of similar questions) run on `workers` threads;
+# the rest goes to PandasAI through an LLMExecutor with `llm_workers` threads. Answers are
+# cached and indexed exactly as the app does it.
+class BatchRunner:
+    def __init__(self, dataset, answer_cache, workers=4, llm_workers=None, approximate=False, timeout_seconds=None,
+                 question_index=None):
+        self.dataset = dataset
+        self.answer_cache = answer_cache
+        self.question_index = question_index
+        self.workers = workers
+        self.approximate = approximate and dataset.sketches is not None
+        if approximate and not self.approximate:
+            logger.warning("No sketches for this dataset (AI_INSIGHT_APPROX_SKETCHES off?): answering exactly")
+        self.timeout_seconds = timeout_seconds or settings.LLM_TIMEOUT_SECONDS
+        self.executor = LLMExecutor(
+            max_workers=llm_workers or settings.LLM_WORKERS, max_retries=settings.LLM_MAX_RETRIES,
+            base_delay=settings.LLM_RETRY_BASE_SECONDS, max_delay=settings.LLM_RETRY_MAX_SECONDS
+        )
+        self._assistant = None
+
+    def create_assistant(self, df, description=None):
+        pai = configure_pandasai()
+        if pai is None:
+            logger.warning("PandasAI is not installed: questions needing the LLM will fail")
+            return None
+        try:
+            return pai.SmartDataframe(df, description=description)
+        except Exception as e:
+            logger.error("Error preparing DataFrame: %s", e)
+            return None
+
+    # Function to answer a question without the LLM: (route, (type, value), fingerprint),
+    # with a None answer when the question has to go to PandasAI
+    def answer_locally(self, question):
+        dataset = self.dataset
+        valid, message = is_meaningful_query(question)
+        if not valid:
+            return "rejected", ("error", message), None
+        tables = dataset.catalog.tables_for_question(question, dataset.table) if dataset.catalog else [dataset.table]
+        multi_table = len(tables) > 1
+        if multi_table:
+            answer = handle_special_queries(question, dataset.catalog.sample(tables), row_count=dataset.catalog.row_count(tables))
+        else:
+            answer = handle_special_queries(question, dataset.df, profile=dataset.profile)
+        if answer[0]:
+            return "special", answer, None
+        if self.approximate and not multi_table:
+            answer = answer_approximately(question, dataset.df, dataset.sketches)
+            if answer[0]:
+                return "approx", answer, None
+        answer = answer_from_catalog(dataset.catalog, tables, question) if multi_table else answer_locally(question, dataset.df)
+        if answer[0]:
+            return "local", answer, None
+        fingerprint = catalog_fingerprint(dataset.dataset_key, tables) if multi_table else dataset.fingerprint
+        if self.approximate and not multi_table:
+            fingerprint = f"{fingerprint}-approx"
+        cached = self.answer_cache.get(fingerprint, question)
+        if cached:
+            return "cache", cached, None
+        similar = self.question_index.nearest(fingerprint, question) if self.question_index is not None else None
+        if similar is not None and similar.reuse:
+            cached = self.answer_cache.get(fingerprint, similar.question)
+            if cached:
+                return "similar", cached, None
+            self.question_index.forget(fingerprint, similar.question)
+        return "llm", None, (fingerprint, tables)
+
+    def _submit(self, question, fingerprint, tables):
+        dataset = self.dataset
+        if len(tables) > 1:
+            frame, description, assistant = dataset.catalog.select(tables), None, None
+        else:
+            frame = dataset.df
+            description = profile_description(dataset.profile)
+            if self.approximate:
+                description += "\n\n" + sketch_description(dataset.sketches)
+            if self._assistant is None:
+                self._assistant = self.create_assistant(frame, description)
+            assistant = self._assistant
+        return self.executor.submit(LLMJob(
+            question,
+            assistant,
+            assistant_factory=lambda: self.create_assistant(frame, description),
+            on_result=lambda job, result: self._remember(fingerprint, job.question, result),
+            timeout_seconds=self.timeout_seconds
+        ))
+
+    def _remember(self, fingerprint, question, result):
+        if self.answer_cache.put(fingerprint, question, *result) and self.question_index is not None:
+            self.question_index.add(fingerprint, question)
+
+    # Function to answer every question, returning one result dict per question in order
+    def run(self, questions):
+        results = [{"index": i, "question": question} for i, question in enumerate(questions, 1)]
+        jobs = {}
+
+        def answer(result):
+            started = time.perf_counter()
+            with tracer.span("batch.question") as span:
+                route, value, pending = self.answer_locally(result["question"])
+                span.set("route", route)
+            result.update(route=route, seconds=time.perf_counter() - started)
+            if value is not None:
+                result["answer"] = value
+            else:
+                result["llm"] = pending
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch") as pool:
+            for future in [pool.submit(answer, result) for result in results]:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error("Batch question failed: %s", e)
+        for result in results:
+            if "route" not in result:
+                result.update(route="error", answer=("error", "Erreur lors du traitement."), seconds=0.0)
+            elif "llm" in result:
+                jobs[result["index"]] = self._submit(result["question"], *result.pop("llm"))
+
+        while jobs and not all(job.finished for job in jobs.values()):
+            wait([job.future for job in jobs.values() if not job.finished], timeout=settings.LLM_POLL_SECONDS)
+            self.executor.check_timeouts(jobs.values())
+        for index, job in jobs.items():
+            result = results[index - 1]
+            result["answer"] = job.result or ("error", "Aucune réponse.")
+            result["seconds"] += job.elapsed()
+            if job.status == "timeout":
+                result["route"] = "timeout"
+        self.executor.shutdown()
+        return results
+
+# Function to write one answer to the output directory, returning the file name (None for errors)
+def write_answer(output_dir, index, content_type, value):
+    extension = RESULT_EXTENSIONS.get(content_type)
+    if extension is None:
+        return None
+    path = os.path.join(output_dir, f"{index:03d}{extension}")
+    if content_type == "dataframe":
+        try:
+            value.to_parquet(path)
+        except Exception as e:
+            # Mixed-type object columns or non-string column names are not Parquet-compatible
+            logger.debug("Parquet write failed for answer %d, using pickle: %s", index, e)
+            path = os.path.join(output_dir, f"{index:03d}.pkl")
+            value.to_pickle(path)
+    elif content_type == "chart":
+        png = chart_to_png(value)
+        if png is None:
+            return None
+        with open(path, "wb") as f:
+            f.write(png)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(str(value))
+    return os.path.basename(path)
+
+# Function to write the answers and a timing summary, returning the summary
+def write_results(output_dir, results, meta):
+    os.makedirs(output_dir, exist_ok=True)
+    latency = {}
+    rows = []
+    for result in results:
+        content_type, value = result["answer"]
+        stats = latency.get(result["route"])
+        if stats is None:
+            stats = latency[result["route"]] = LatencyStats(max_samples=len(results))
+        stats.record(result["seconds"])
+        rows.append({
+            "index": result["index"],
+            "question": result["question"],
+            "route": result["route"],
+            "content_type": content_type,
+            "file": write_answer(output_dir, result["index"], content_type, value),
+            "error": value if content_type == "error" else None,
+            "note": getattr(value, "attrs", {}).get("note", "").strip() or None,
+            "seconds": round(result["seconds"], 4),
+        })
+    summary = {
+        "meta": meta,
+        "routes": {route: stats.summary() for route, stats in sorted(latency.items())},
+        "stages": tracer.stats(),
+        "results": rows,
+    }
+    with open(os.path.join(output_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False, default=str)
+    with open(os.path.join(output_dir, "spans.jsonl"), "w", encoding="utf-8") as f:
+        f.write(tracer.export_jsonl())
+    return summary
+
+# Function to print the timing summary per route
+def print_summary(summary):
+    print(f"\n{'route':<10} {'count':>6} {'avg':>9} {'p50':>9} {'p95':>9}")
+    for route, stats in summary["routes"].items():
+        print(f"{route:<10} {stats['count']:>6} {stats['avg_ms']:8.1f}ms {stats['p50_ms']:8.1f}ms {stats['p95_ms']:8.1f}ms")
+    meta = summary["meta"]
+    print(f"\n{meta['questions']} questions in {meta['wall_seconds']:.2f}s, answers in {meta['output_dir']}")
+
+# Function to parse the command line
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a file of questions about a CSV file or .sql dump without the web UI.")
+    parser.add_argument("source", help="CSV file or .sql dump")
+    parser.add_argument("questions", help="text file with one question per line (\"#\" comments), or - for stdin")
+    parser.add_argument("--output-dir", default=None, help="where answers and summary.json are written")
+    parser.add_argument("--table", help="active table of a .sql dump (default: the first one)")
+    parser.add_argument("--workers", type=int, default=4, help="questions answered locally in parallel")
+    parser.add_argument("--llm-workers", type=int, default=settings.LLM_WORKERS, help="PandasAI questions in flight")
+    parser.add_argument("--timeout", type=int, default=settings.LLM_TIMEOUT_SECONDS, help="seconds allowed per PandasAI question")
+    parser.add_argument("--approximate", action="store_true", help="answer from the dataset sketches where possible")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging(level=settings.LOG_LEVEL, module_levels=parse_module_levels(settings.LOG_MODULE_LEVELS),
+                      log_file=settings.LOG_FILE or None)
+    pd.set_option("mode.copy_on_write", True)
+    output_dir = args.output_dir or os.path.join("batch_results", datetime.now().strftime("%Y%m%d-%H%M%S"))
+    questions = read_questions(args.questions)
+    started_at = datetime.now().isoformat(timespec="seconds")
+    started = time.perf_counter()
+    dataset = load_dataset(args.source, args.table)
+    try:
+        runner = BatchRunner(
+            dataset, AnswerCache(settings.ANSWER_CACHE_DIR, max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+                                 max_bytes=settings.ANSWER_CACHE_MAX_BYTES, ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS),
+            workers=args.workers, llm_workers=args.llm_workers, approximate=args.approximate,
+            timeout_seconds=args.timeout,
+            question_index=QuestionIndex(
+                settings.QUESTION_INDEX_PATH, max_entries=settings.QUESTION_INDEX_MAX_ENTRIES,
+                memory_entries=settings.QUESTION_INDEX_MEMORY_ENTRIES,
+                reuse_similarity=settings.QUESTION_INDEX_REUSE_PERCENT / 100,
+                suggest_similarity=settings.QUESTION_INDEX_SUGGEST_PERCENT / 100
+            ) if settings.QUESTION_INDEX_ENABLED else None
+        )
+        results = runner.run(questions)
+    finally:
+        dataset.close()
+    meta = {
+        "source": os.path.abspath(args.source),
+        "table": dataset.table,
+        "rows": len(dataset.df),
+        "questions": len(questions),
+        "approximate": runner.approximate,
+        "started_at": started_at,
+        "wall_seconds": round(time.perf_counter() - started, 3),
+        "output_dir": os.path.abspath(output_dir),
+    }
+    summary = write_results(output_dir, results, meta)
+    print_summary(summary)
+    return 1 if any(row["content_type"] == "error" and row["route"] != "rejected" for row in summary["results"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,633 @@
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import psutil
+
+import settings
+from chat_history import message_snapshot, split_history
+from db_fetch import fetch_frame
+from llm_executor import LLMExecutor, LLMJob
+from loaders import load_csv
+from intent_matcher import match_intent
+from logging_setup import configure_logging, parse_module_levels
+from query_engine import answer_approximately, answer_locally, handle_special_queries, is_meaningful_query
+from question_index import QuestionIndex
+from result_store import ResultStore
+from sketches import QUANTILE_LEVELS, DatasetSketches
+from sql_catalog import SQLiteCatalog
+from sql_import import load_sql_dump
+
+logger = logging.getLogger(__name__)
+
+# Value distributions of the synthetic datasets, shaped like fire_call .csv
+CALL_TYPES = {
+    "Medical Incident": 0.63, "Alarms": 0.11, "Structure Fire": 0.09, "Traffic Collision": 0.05,
+    "Other": 0.04, "Outside Fire": 0.02, "Citizen Assist / Service Call": 0.02, "Vehicle Fire": 0.01,
+    "Water Rescue": 0.01, "Gas Leak (Natural and LP Gases)": 0.01, "Electrical Hazard": 0.01,
+}
+UNIT_TYPES = {
+    "ENGINE": 0.45, "MEDIC": 0.30, "TRUCK": 0.10, "PRIVATE": 0.06, "CHIEF": 0.05,
+    "RESCUE CAPTAIN": 0.02, "RESCUE SQUAD": 0.01, "SUPPORT": 0.01,
+}
+ZIPCODES = [94102, 94103, 94104, 94105, 94107, 94108, 94109, 94110, 94111, 94112, 94114, 94115,
+            94116, 94117, 94118, 94121, 94122, 94123, 94124, 94127, 94129, 94130, 94131, 94132, 94133, 94134]
+
+# Questions replayed by the query stages: special queries, local aggregations, chit-chat and LLM-bound
+QUESTIONS = [
+    "show columns", "quelle est la taille du dataset", "data types", "aperçu des données",
+    "quel est le type d'appel le plus fréquent", "What is the most common call type?",
+    "moyenne de Delay par UnitType", "average Delay by UnitType", "nombre d'appels par CallType",
+    "médiane de Delay", "top 5 Zipcode", "combien de CallType distincts",
+    "max Delay for Medical Incident", "répartition de UnitType",
+    "bonjour", "ok", "hi",
+    "explique la saisonnalité des appels", "trace un graphique des appels par année",
+]
+
+# Questions replayed exactly and from the sketches to compare the two modes
+APPROX_QUESTIONS = [
+    "combien de IncidentNumber distincts", "combien de Zipcode distincts", "médiane de Delay",
+    "quantiles de Delay", "quantiles de Delay par CallType", "médiane de Delay par UnitType",
+    "moyenne de Delay par CallType", "max Delay for Medical Incident", "top 5 CallType", "répartition de UnitType",
+]
+
+# Labelled French and English questions for the intent matcher; None means no intent
+INTENT_CORPUS = [
+    ("show columns", "structure"), ("quelles sont les colonnes", "structure"), ("nom des colonnes", "structure"),
+    ("list the column names", "structure"), ("structure du dataset", "structure"), ("quels champs sont disponibles", "structure"),
+    ("what fields are there", "structure"),
+    ("quelle est la taille du dataset", "size"), ("dataset size", "size"), ("combien de lignes", "size"),
+    ("how many rows are there", "size"), ("nombre de colonnes", "size"), ("shape of the data", "size"),
+    ("dimensions des données", "size"), ("how many columns does it have", "size"),
+    ("data types", "dtypes"), ("types de données", "dtypes"), ("dtypes", "dtypes"), ("types des colonnes", "dtypes"),
+    ("what are the column types", "dtypes"), ("quels sont les types", "dtypes"),
+    ("aperçu des données", "preview"), ("preview", "preview"), ("show the first rows", "preview"),
+    ("premières lignes du fichier", "preview"), ("donne un échantillon", "preview"), ("head of the table", "preview"),
+    ("profil du dataset", "profile"), ("describe the data", "profile"), ("valeurs manquantes", "profile"),
+    ("statistiques descriptives", "profile"), ("missing values per column", "profile"),
+    ("trace un graphique des appels par année", "chart"), ("plot Delay by UnitType", "chart"),
+    ("histogramme de Delay", "chart"), ("camembert des CallType", "chart"), ("visualize the trend of calls", "chart"),
+    ("show a bar chart of calls per zipcode", "chart"), ("courbe des appels par mois", "chart"),
+    ("moyenne de Delay par UnitType", "aggregation"), ("average Delay by UnitType", "aggregation"),
+    ("nombre d'appels par CallType", "aggregation"), ("médiane de Delay", "aggregation"), ("top 5 Zipcode", "aggregation"),
+    ("combien de CallType distincts", "aggregation"), ("max Delay for Medical Incident", "aggregation"),
+    ("répartition de UnitType", "aggregation"), ("quel est le type d'appel le plus fréquent", "aggregation"),
+    ("What is the most common call type?", "aggregation"), ("combien de lignes par CallType", "aggregation"),
+    ("how many rows per UnitType", "aggregation"), ("somme de Delay", "aggregation"),
+    ("quantiles de Delay par CallType", "aggregation"),
+    ("how many incidents in 94110", "aggregation"),
+    ("explique la saisonnalité des appels", None), ("summarize the dataset", None), ("prototypes of incidents", None),
+    ("compare les délais entre unités", "analysis"), ("quelle tendance pour les appels", "analysis"),
+    ("what is the trend over time", "analysis"),
+    ("bonjour", "out_of_scope"), ("hello", "out_of_scope"), ("ok merci", "out_of_scope"), ("thanks", "out_of_scope"),
+    ("salut", "out_of_scope"), ("test", "out_of_scope"), ("oui", "out_of_scope"),
+]
+
+# (past question, rephrasing, whether its answer may be reused) for the similar-question
+# index: reuse needs the same operations, numbers and columns in any language or spelling
+SIMILAR_CORPUS = [
+    ("What is the most common call type?", "quel est le type d'appel le plus fréquent", True),
+    ("What is the most common call type?", "top CallType", True),
+    ("What is the most common call type?", "most frequent call types", True),
+    ("What is the most common call type?", "least common call type", False),
+    ("moyenne de Delay par UnitType", "average delay per unit type", True),
+    ("moyenne de Delay par UnitType", "mean delay by unittype", True),
+    ("moyenne de Delay par UnitType", "moyenne de délai par type d'unité", True),
+    ("moyenne de Delay par UnitType", "médiane de Delay par UnitType", False),
+    ("moyenne de Delay par UnitType", "avg delay by unit", False),
+    ("nombre d'appels par CallType", "number of calls by call type", True),
+    ("nombre d'appels par CallType", "how many calls per CallType", True),
+    ("nombre d'appels par année", "number of calls per year", True),
+    ("nombre d'appels par année", "nombre d'appels par mois", False),
+    ("top 5 Zipcode", "top 5 zip code", True),
+    ("top 5 Zipcode", "top 10 Zipcode", False),
+    ("max Delay for Medical Incident", "max delay for medical incidents", True),
+    ("max Delay for Medical Incident", "max Delay for Structure Fire", False),
+    ("combien de CallType distincts", "how many distinct call types", True),
+    ("trace un graphique des appels par année", "plot calls per year", True),
+    ("trace un graphique des appels par année", "camembert des appels par année", False),
+]
+# Templates and columns combined into the synthetic question history the index is timed on
+SIMILAR_TEMPLATES = [
+    "moyenne de {num} par {col}", "average {num} by {col}", "max {num} for {value}", "top {n} {col}",
+    "nombre d'appels par {col}", "how many distinct {col}", "médiane de {num} par {col}", "répartition de {col}",
+    "trace un graphique de {num} par {col}", "somme de {num} pour {value}",
+]
+SIMILAR_COLUMNS = ["CallType", "UnitType", "Zipcode", "Battalion", "StationArea", "Priority", "Neighborhood", "Box"]
+
+# Function to turn "10k", "1m" or "250000" into a row count
+def parse_size(text):
+    text = text.strip().lower().replace("_", "")
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * multiplier)
+
+# Function to build one chunk of synthetic fire calls, deterministic for a given seed and offset
+def synthetic_chunk(rows, offset=0, seed=42):
+    rng = np.random.default_rng(seed + offset)
+    dates = pd.Timestamp("2000-01-01") + pd.to_timedelta(rng.integers(0, 20 * 365, rows), unit="D")
+    zipcodes = rng.choice(ZIPCODES, rows).astype("float64")
+    zipcodes[rng.random(rows) < 0.03] = np.nan
+    return pd.DataFrame({
+        "IncidentNumber": np.arange(2_000_000 + offset, 2_000_000 + offset + rows),
+        "CallType": rng.choice(list(CALL_TYPES), rows, p=list(CALL_TYPES.values())),
+        "CallDate": dates.strftime("%m/%d/%Y"),
+        "Zipcode": zipcodes,
+        "FinalPriority": rng.choice([2.0, 3.0], rows, p=[0.3, 0.7]),
+        "UnitType": rng.choice(list(UNIT_TYPES), rows, p=list(UNIT_TYPES.values())),
+        "Delay": np.round(rng.exponential(3.5, rows), 4),
+    })
+
+# Function to render a chunk as the value tuples of a MySQL INSERT statement
+def _sql_rows(chunk):
+    text = lambda series: "'" + series.str.replace("'", "''", regex=False) + "'"
+    number = lambda series: series.map(repr).where(series.notna(), "NULL")
+    return ("(" + chunk["IncidentNumber"].astype(str) + "," + text(chunk["CallType"]) + "," + text(chunk["CallDate"])
+            + "," + number(chunk["Zipcode"]) + "," + number(chunk["FinalPriority"]) + "," + text(chunk["UnitType"])
+            + "," + number(chunk["Delay"]) + ")").tolist()
+
+# Function to write the synthetic CSV and .sql dump of a size, reusing files from earlier runs
+def generate_datasets(rows, data_dir, seed=42, chunk_rows=1_000_000, insert_rows=1000):
+    os.makedirs(data_dir, exist_ok=True)
+    csv_path = os.path.join(data_dir, f"fire_calls_{rows}_{seed}.csv")
+    sql_path = os.path.join(data_dir, f"fire_calls_{rows}_{seed}.sql")
+    if os.path.exists(csv_path) and os.path.exists(sql_path):
+        return csv_path, sql_path
+    with open(csv_path + ".tmp", "w", newline="") as csv_file, open(sql_path + ".tmp", "w") as sql_file:
+        sql_file.write(
+            "CREATE TABLE `fire_calls` (\n  `IncidentNumber` int NOT NULL,\n  `CallType` varchar(64),\n"
+            "  `CallDate` varchar(10),\n  `Zipcode` double,\n  `FinalPriority` double,\n"
+            "  `UnitType` varchar(32),\n  `Delay` double,\n  PRIMARY KEY (`IncidentNumber`)\n)"
+            " ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;\n\n"
+        )
+        for offset in range(0, rows, chunk_rows):
+            chunk = synthetic_chunk(min(chunk_rows, rows - offset), offset, seed)
+            chunk.to_csv(csv_file, index=False, header=offset == 0)
+            values = _sql_rows(chunk)
+            for start in range(0, len(values), insert_rows):
+                sql_file.write("INSERT INTO `fire_calls` VALUES " + ",".join(values[start:start + insert_rows]) + ";\n")
+    os.replace(csv_path + ".tmp", csv_path)
+    os.replace(sql_path + ".tmp", sql_path)
+    return csv_path, sql_path
+
+
+# Deterministic stand-in for a PandasAI assistant: answers instantly (or after a fixed
+# latency) with a text or a small table derived from the question, without any network
+class StubAssistant:
+    def __init__(self, df=None, latency_seconds=0.0):
+        self.df = df
+        self.latency_seconds = latency_seconds
+
+    def chat(self, query):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        if self.df is not None and ("table" in query or "tableau" in query):
+            return self.df.head(20)
+        return f"Réponse simulée ({len(query)} caractères)"
+
+
+# Samples the process RSS in a background thread while a stage runs
+class PeakRSSMonitor:
+    def __init__(self, interval_seconds=0.01):
+        self.interval_seconds = interval_seconds
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+        self.start_rss = self._process.memory_info().rss
+        self.peak_rss = self.start_rss
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval_seconds):
+            self.peak_rss = max(self.peak_rss, self._process.memory_info().rss)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_rss = max(self.peak_rss, self._process.memory_info().rss)
+
+
+# Runs benchmark stages and collects their timings and memory peaks
+class BenchmarkRun:
+    def __init__(self):
+        self.stages = []
+        self.accuracy = []
+        self.imports = None
+
+    # Function to time one stage; `fn` returns the number of operations it performed (or None)
+    def stage(self, name, size, fn):
+        gc.collect()
+        try:
+            with PeakRSSMonitor() as monitor:
+                started = time.perf_counter()
+                ops = fn()
+                seconds = time.perf_counter() - started
+        except Exception as e:
+            logger.error("Benchmark stage %s (%s) failed: %s", name, size, e)
+            self.stages.append({"name": name, "size": size, "error": str(e)})
+            return
+        result = {
+            "name": name,
+            "size": size,
+            "seconds": round(seconds, 6),
+            "peak_rss_mb": round(monitor.peak_rss / 1024 / 1024, 1),
+            "rss_delta_mb": round((monitor.peak_rss - monitor.start_rss) / 1024 / 1024, 1),
+        }
+        if ops:
+            result["ops"] = ops
+            result["ops_per_second"] = round(ops / seconds, 1) if seconds else None
+        self.stages.append(result)
+        print(f"{name:<22} {size:>10,}  {seconds:9.3f}s  peak {result['peak_rss_mb']:8.1f} MB", flush=True)
+
+
+# Function to replay the question set through a function, returning the number of calls
+def _replay(fn, repeats):
+    for _ in range(repeats):
+        for question in QUESTIONS:
+            fn(question)
+    return repeats * len(QUESTIONS)
+
+# Function to send questions through the background executor and wait for all answers
+def run_llm_dispatch(df, jobs, workers, latency_seconds):
+    executor = LLMExecutor(max_workers=workers, max_retries=1)
+    assistant = StubAssistant(df, latency_seconds)
+    submitted = [
+        executor.submit(LLMJob(QUESTIONS[i % len(QUESTIONS)], assistant,
+                               assistant_factory=lambda: StubAssistant(df, latency_seconds)))
+        for i in range(jobs)
+    ]
+    for job in submitted:
+        job.future.result()
+    return jobs
+
+# Function to build a chat history of stored results, as the app does when answers arrive
+def build_history(df, messages, store):
+    history = []
+    for i in range(messages // 2):
+        history.append({"role": "user", "content": QUESTIONS[i % len(QUESTIONS)], "timestamp": "12:00"})
+        if i % 2:
+            extra = store.put("dataframe", df.head(200))
+            history.append({"role": "assistant", "content": "Here's the data you requested:", "timestamp": "12:00",
+                            "content_type": "dataframe", "extra_content": extra, "cache_status": "local"})
+        else:
+            history.append({"role": "assistant", "content": f"Réponse {i}", "timestamp": "12:00",
+                            "content_type": "text", "cache_status": "miss"})
+    return history
+
+# Function to pre-render the collapsed part of a chat history into snapshots
+def run_snapshots(history, store):
+    older, _ = split_history(history, settings.CHAT_LIVE_MESSAGES)
+    for message in older:
+        message_snapshot(message, settings.CHAT_SNAPSHOT_ROWS, store)
+    return len(older)
+
+# Function to start the Streamlit app headlessly with a long chat history loaded
+def prepare_app(df, messages):
+    import pandasai
+    from streamlit.testing.v1 import AppTest
+
+    pandasai.SmartDataframe = lambda frame, **kwargs: StubAssistant(frame)
+    app = AppTest.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), "aiv1.py"), default_timeout=300)
+    app.session_state["df"] = df
+    app.run()
+    app.session_state["chat_messages"] = build_history(df, messages, app.session_state["result_store"])
+    app.run()
+    return app
+
+# Function to time full reruns of the app, as triggered by any widget interaction
+def run_app_reruns(app, reruns):
+    for _ in range(reruns):
+        app.run()
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+    return reruns
+
+# Function to feed a frame to DatasetSketches chunk by chunk, as load_csv does
+def build_sketches(df, chunk_rows=None):
+    chunk_rows = chunk_rows or settings.CSV_CHUNK_ROWS
+    sketches = DatasetSketches(
+        precision=settings.APPROX_HLL_PRECISION, k=settings.APPROX_KLL_K, width=settings.APPROX_CMS_WIDTH,
+        depth=settings.APPROX_CMS_DEPTH, heavy_hitters=settings.APPROX_HEAVY_HITTERS, max_groups=settings.APPROX_MAX_GROUPS
+    )
+    for start in range(0, len(df), chunk_rows):
+        sketches.update(df.iloc[start:start + chunk_rows])
+    return sketches
+
+# Function to measure how far a quantile estimate is from its level, in rank: 0 when the
+# level falls between the shares of values strictly below and at most the estimate
+def _rank_error(values, estimate, level):
+    below, at_most = np.mean(values < estimate), np.mean(values <= estimate)
+    return max(below - level, level - at_most, 0.0)
+
+# Function to compare the sketch estimates with exact results, per column and per group
+def approx_accuracy(df, sketches):
+    report = []
+    for column in df.columns:
+        estimate, error = sketches.distinct(column)
+        exact = df[column].nunique()
+        report.append({"metric": "distinct", "column": column, "exact": int(exact), "estimate": round(estimate),
+                       "error": round(abs(estimate - exact) / exact, 5) if exact else 0.0, "bound": round(2 * error, 5)})
+    for column, values in sketches.columns.items():
+        if values["kind"] != "numeric":
+            continue
+        data = df[column].dropna().to_numpy(dtype="float64")
+        estimates = sketches.quantiles(column, QUANTILE_LEVELS)
+        worst = max(_rank_error(data, estimate, level) for estimate, level in zip(estimates, QUANTILE_LEVELS))
+        report.append({"metric": "quantile_rank", "column": column, "error": round(worst, 5), "bound": round(sketches.rank_error, 5)})
+        for group, per_value in (sketches.groups or {}).items():
+            if per_value is None:
+                continue
+            groups = df.groupby(group, observed=True)[column]
+            worst = 0.0
+            for value, stats in (sketches.group_stats(group, column) or {}).items():
+                data = groups.get_group(value).dropna().to_numpy(dtype="float64")
+                worst = max([worst] + [_rank_error(data, estimate, level)
+                                       for estimate, level in zip(stats["kll"].quantiles(QUANTILE_LEVELS), QUANTILE_LEVELS)])
+            report.append({"metric": "quantile_rank", "column": f"{column} by {group}", "error": round(worst, 5),
+                           "bound": round(sketches.rank_error, 5)})
+    for column, values in sketches.columns.items():
+        if values["kind"] != "categorical":
+            continue
+        exact = df[column].value_counts().head(10)
+        estimated = dict(sketches.heavy_hitters(column, 10))
+        overcount = max((estimated.get(value, count) - count for value, count in exact.items()), default=0)
+        recall = len(set(exact.index) & set(estimated)) / len(exact) if len(exact) else 1.0
+        report.append({"metric": "top10", "column": column, "recall": round(recall, 3),
+                       "error": int(overcount), "bound": round(sketches.count_error(column)[0], 1)})
+    for row in report:
+        print(f"  {row['metric']:<14} {row['column']:<28} error {row['error']:<10} bound {row['bound']}", flush=True)
+    return report
+
+# Modules the app must not import at startup: they load with the data source or question that needs them
+DEFERRED_MODULES = ["pandasai", "matplotlib.pyplot", "sqlalchemy", "pyodbc", "requests"]
+
+# Function to import the app in a fresh interpreter (Streamlit bare mode), returning the
+# import time and the deferred modules that were loaded anyway
+def measure_cold_import(module="aiv1"):
+    script = (
+        f"import json, sys, time\nstarted = time.perf_counter()\nimport {module}\n"
+        f"print(json.dumps({{'seconds': time.perf_counter() - started, "
+        f"'loaded': [name for name in {DEFERRED_MODULES!r} if name in sys.modules]}}))"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True, timeout=120,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), env={**os.environ, "AI_INSIGHT_CACHE_DIR": tmp}).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+# Function to time the app's cold import against the budget; returns the budget violations
+def run_imports(run, args):
+    report = {}
+    run.stage("cold_import", 1, lambda: report.update(measure_cold_import()))
+    if not report:
+        return []
+    problems = []
+    print(f"  import aiv1      {report['seconds']:.3f}s (budget {args.import_budget:.2f}s)", flush=True)
+    if report["seconds"] > args.import_budget:
+        problems.append(f"importing aiv1 took {report['seconds']:.3f}s, over the {args.import_budget:.2f}s budget")
+    if report["loaded"]:
+        problems.append(f"importing aiv1 loaded {', '.join(report['loaded'])}")
+    run.imports = {**report, "budget_seconds": args.import_budget, "problems": problems}
+    return problems
+
+# Function to check the intent matcher against the labelled corpus
+def intent_accuracy():
+    mismatches = [{"question": question, "expected": expected, "intent": match_intent(question).intent}
+                  for question, expected in INTENT_CORPUS if match_intent(question).intent != expected]
+    for row in mismatches:
+        print(f"  intent mismatch  {row['question']!r}: expected {row['expected']}, got {row['intent']}", flush=True)
+    error = len(mismatches) / len(INTENT_CORPUS)
+    print(f"  intent corpus    {len(INTENT_CORPUS) - len(mismatches)}/{len(INTENT_CORPUS)} labelled questions matched", flush=True)
+    return {"metric": "intent", "column": "corpus", "error": round(error, 5), "bound": 0.0, "mismatches": mismatches}
+
+# Function to time intent matching alone, independent of the dataset size
+def run_intents(run, args):
+    replays = args.repeats * 100
+    run.stage("match_intent", len(INTENT_CORPUS),
+              lambda: sum(1 for _ in range(replays) for question, _ in INTENT_CORPUS if match_intent(question)))
+    run.accuracy.append(intent_accuracy())
+
+# Function to build a history of `count` distinct questions from the templates
+def similar_history(count, seed=42):
+    rng = np.random.default_rng(seed)
+    values = list(CALL_TYPES) + list(UNIT_TYPES)
+    questions = set()
+    while len(questions) < count:
+        template = SIMILAR_TEMPLATES[rng.integers(len(SIMILAR_TEMPLATES))]
+        questions.add(template.format(
+            num=f"Delay{rng.integers(count // 10 + 1)}", col=SIMILAR_COLUMNS[rng.integers(len(SIMILAR_COLUMNS))],
+            value=values[rng.integers(len(values))], n=rng.integers(1, 20)
+        ))
+    return sorted(questions)
+
+# Function to check the similar-question index against the labelled corpus, its past
+# questions mixed into `history` so the approximate candidate search is exercised
+def similar_accuracy(directory, history):
+    index = QuestionIndex(os.path.join(directory, "corpus.sqlite"), max_entries=len(history) + len(SIMILAR_CORPUS),
+                          memory_entries=len(history) + len(SIMILAR_CORPUS))
+    for past in history + sorted({past for past, _, _ in SIMILAR_CORPUS}):
+        index.add("corpus", past)
+    mismatches = []
+    for past, question, expected in SIMILAR_CORPUS:
+        similar = index.nearest("corpus", question)
+        reused = similar is not None and similar.reuse and similar.question == past
+        if reused != expected:
+            mismatches.append({"question": question, "past": past, "expected": expected,
+                               "match": similar.question if similar else None, "score": round(similar.score, 3) if similar else None})
+    for row in mismatches:
+        print(f"  similar mismatch {row['question']!r}: expected reuse={row['expected']}, got {row['match']!r} ({row['score']})", flush=True)
+    print(f"  similar corpus   {len(SIMILAR_CORPUS) - len(mismatches)}/{len(SIMILAR_CORPUS)} labelled rephrasings matched", flush=True)
+    return {"metric": "similar", "column": "corpus", "error": round(len(mismatches) / len(SIMILAR_CORPUS), 5),
+            "bound": 0.0, "mismatches": mismatches}
+
+# Function to time indexing a question history and matching rephrasings against it,
+# independent of the dataset size
+def run_similar(run, args):
+    history = similar_history(args.index_questions, seed=args.seed)
+    questions = [question for _, question, _ in SIMILAR_CORPUS]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "questions.sqlite")
+
+        def build():
+            index = QuestionIndex(path, max_entries=len(history), memory_entries=len(history))
+            for question in history:
+                index.add("history", question)
+            return len(history)
+        run.stage("index_questions", len(history), build)
+        index = QuestionIndex(path, max_entries=len(history), memory_entries=len(history))
+
+        def load():
+            index.nearest("history", questions[0])
+            return index.stats()["loaded_entries"]
+        run.stage("index_load", len(history), load)
+        replays = args.repeats * 20
+        run.stage("similar_lookup", len(history),
+                  lambda: sum(1 for _ in range(replays) for question in questions if index.nearest("history", question) or True))
+        run.accuracy.append(similar_accuracy(tmp, history))
+
+# Function to run every stage for one dataset size
+def run_size(run, rows, args):
+    csv_path, sql_path = generate_datasets(rows, args.data_dir, seed=args.seed)
+    run.stage("read_csv_raw", rows, lambda: pd.read_csv(csv_path).shape[0])
+    loaded = {}
+
+    def load():
+        with open(csv_path, "rb") as f:
+            loaded["df"], _ = load_csv(f, max_rows=0, max_memory_bytes=0)
+        return len(loaded["df"])
+    run.stage("load_csv", rows, load)
+    df = loaded.pop("df", None)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "dump.sqlite")
+
+        def import_dump():
+            with open(sql_path, "rb") as f:
+                conn, stats = load_sql_dump(f, db_path=db_path)
+            conn.close()
+            return stats["rows"]
+        run.stage("sql_import", rows, import_dump)
+
+        def materialize():
+            catalog = SQLiteCatalog.open(db_path)
+            try:
+                return len(catalog.select(["fire_calls"]))
+            finally:
+                catalog.close()
+        run.stage("sql_select_table", rows, materialize)
+
+        # Database pull of the whole table: pandas.read_sql against the chunked Arrow fetch
+        def pull(fetch):
+            conn = sqlite3.connect(db_path)
+            try:
+                return len(fetch(conn))
+            finally:
+                conn.close()
+        run.stage("db_read_sql", rows, lambda: pull(lambda conn: pd.read_sql("SELECT * FROM fire_calls", conn)))
+        run.stage("db_fetch_arrow", rows, lambda: pull(lambda conn: fetch_frame(conn, "SELECT * FROM fire_calls", max_memory_bytes=0)[0]))
+
+    if df is None:
+        return
+    run.stage("is_meaningful_query", rows, lambda: _replay(is_meaningful_query, args.repeats * 100))
+    run.stage("special_queries", rows, lambda: _replay(lambda q: handle_special_queries(q, df), args.repeats))
+    run.stage("answer_locally", rows, lambda: _replay(lambda q: answer_locally(q, df), args.repeats))
+
+    sketched = {}
+
+    def sketch():
+        sketched["sketches"] = build_sketches(df)
+        return len(df)
+    run.stage("sketch_build", rows, sketch)
+    if "sketches" in sketched:
+        sketches = sketched["sketches"]
+        replay = lambda fn: sum(1 for _ in range(args.repeats) for question in APPROX_QUESTIONS if fn(question)[0] is not None)
+        run.stage("exact_answers", rows, lambda: replay(lambda q: answer_locally(q, df)))
+        run.stage("approx_answers", rows, lambda: replay(lambda q: answer_approximately(q, df, sketches)))
+        run.accuracy.extend({"size": rows, **row} for row in approx_accuracy(df, sketches))
+    run.stage("llm_dispatch", args.llm_jobs, lambda: run_llm_dispatch(df, args.llm_jobs, args.llm_workers, args.llm_latency))
+
+    store = ResultStore(os.path.join(args.data_dir, "results"))
+    history = build_history(df, args.messages, store)
+    run.stage("chat_snapshots", args.messages, lambda: run_snapshots(history, store))
+    if args.app_reruns:
+        app = prepare_app(df, args.messages)
+        run.stage("app_rerun", args.messages, lambda: run_app_reruns(app, args.app_reruns))
+
+# Function to describe the environment a result file was produced in
+def run_metadata(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit or None,
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "rows": args.rows,
+        "seed": args.seed,
+        "repeats": args.repeats,
+    }
+
+# Function to compare two result files, returning the stages slower than `threshold` times the
+# baseline; differences under `min_delta_seconds` are timer noise and never count as regressions
+def compare_results(baseline, current, threshold=1.25, min_delta_seconds=0.01):
+    previous = {(stage["name"], stage["size"]): stage for stage in baseline["stages"] if "seconds" in stage}
+    regressions = []
+    print(f"\n{'stage':<22} {'size':>10}  {'baseline':>9}  {'current':>9}  {'ratio':>6}")
+    for stage in current["stages"]:
+        old = previous.get((stage["name"], stage["size"]))
+        if old is None or "seconds" not in stage:
+            continue
+        ratio = stage["seconds"] / old["seconds"] if old["seconds"] else float("inf")
+        regressed = ratio > threshold and stage["seconds"] - old["seconds"] > min_delta_seconds
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{stage['name']:<22} {stage['size']:>10,}  {old['seconds']:8.3f}s  {stage['seconds']:8.3f}s  {ratio:5.2f}x{flag}")
+        if regressed:
+            regressions.append({"name": stage["name"], "size": stage["size"], "ratio": round(ratio, 3)})
+    return regressions
+
+# Function to parse the command line
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Headless benchmark of ingestion, local answers and chat dispatch.")
+    parser.add_argument("--rows", default="10k", help="comma-separated dataset sizes, e.g. 10k,1m,10m")
+    parser.add_argument("--data-dir", default=os.path.join(settings.CACHE_DIR, "benchmark"),
+                        help="where synthetic datasets are generated and reused")
+    parser.add_argument("--output", help="write the JSON results to this file")
+    parser.add_argument("--compare", help="baseline JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio reported as a regression")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeats", type=int, default=5, help="replays of the question set per query stage")
+    parser.add_argument("--messages", type=int, default=200, help="chat history length for the rendering stages")
+    parser.add_argument("--app-reruns", type=int, default=0, help="also time N full reruns of the Streamlit app")
+    parser.add_argument("--llm-jobs", type=int, default=50)
+    parser.add_argument("--llm-workers", type=int, default=settings.LLM_WORKERS)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="simulated seconds per LLM answer")
+    parser.add_argument("--import-budget", type=float, default=1.5, help="seconds allowed for the app's cold import")
+    parser.add_argument("--index-questions", type=int, default=5000, help="past questions in the similar-question index")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging(level="WARNING", module_levels=parse_module_levels(settings.LOG_MODULE_LEVELS))
+    pd.set_option("mode.copy_on_write", True)
+    run = BenchmarkRun()
+    import_problems = run_imports(run, args)
+    run_intents(run, args)
+    run_similar(run, args)
+    for rows in [parse_size(size) for size in args.rows.split(",")]:
+        run_size(run, rows, args)
+    results = {"meta": run_metadata(args), "stages": run.stages, "accuracy": run.accuracy, "imports": run.imports}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    for problem in import_problems:
+        print(f"\nImport budget: {problem}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_results(json.load(f), results, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} stage(s) slower than {args.threshold}x the baseline")
+            return 1
+    return 1 if import_problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+import base64
+
+import pandas as pd
+
+from answer_cache import chart_to_png
+from result_store import ResultHandle
+
+# Suffix added to a message timestamp for each answer origin
+CACHE_STATUS_LABELS = {
+    "hit": "⚡ cached answer",
+    "similar": "🔁 answer to a similar question",
+    "local": "🧮 computed locally",
+    "server": "🗄️ computed on the server",
+    "approx": "≈ approximate answer",
+    "miss": "🌐 fresh answer",
+}
+
+# Function to build the timestamp line of a message
+def message_time(timestamp, cache_status=None):
+    label = CACHE_STATUS_LABELS.get(cache_status)
+    return f"{timestamp} · {label}" if label else timestamp
+
+# Function to split the history into collapsed older messages and the live window
+def split_history(messages, live_count):
+    if live_count <= 0 or len(messages) <= live_count:
+        return [], messages
+    return messages[:-live_count], messages[-live_count:]
+
+# Function to render a table or chart as static HTML; `shape` is the full result's
+def _render_extra(content_type, extra_content, shape, max_rows):
+    if content_type == "dataframe" and isinstance(extra_content, pd.DataFrame):
+        table = extra_content.head(max_rows).to_html(border=0, max_cols=20)
+        rows, cols = shape
+        more = f"<div class=\"message-time\">{rows:,} rows × {cols} columns</div>" if rows > max_rows else ""
+        return f'<div class="message-dataframe">{table}{more}</div>'
+    if content_type == "chart" and extra_content is not None:
+        png = chart_to_png(extra_content)
+        if png:
+            encoded = base64.b64encode(png).decode("ascii")
+            return f'<div class="message-chart"><img src="data:image/png;base64,{encoded}" style="max-width:100%"></div>'
+    return ""
+
+# Function to render the extra content of an answer as static HTML. A result held by the
+# store gets its HTML cached there, under the store's memory budget, not on the message.
+def _extra_html(content_type, extra_content, max_rows, store=None):
+    if not isinstance(extra_content, ResultHandle):
+        return _render_extra(content_type, extra_content, getattr(extra_content, "shape", None), max_rows)
+    if store is None:
+        return ""
+    handle = extra_content
+
+    def render():
+        value = store.preview(handle, max_rows) if content_type == "dataframe" else store.get(handle)
+        return _render_extra(content_type, value, (handle.rows, handle.columns), max_rows)
+    return store.snapshot(handle, render)
+
+# Function to pre-render a message as one HTML block
+def message_snapshot(message, max_rows=20, store=None):
+    timestamp = message_time(message.get("timestamp", ""), message.get("cache_status"))
+    role = message["role"]
+    if role == "user":
+        return f'<div class="user-message">{message["content"]}<div class="message-time">{timestamp}</div></div>'
+    if role == "error":
+        return f'<div class="error-message">❌ {message["content"]}<div class="message-time">{timestamp}</div></div>'
+    html = f'<div class="bot-message">🤖 {message["content"]}<div class="message-time">{timestamp}</div></div>'
+    return html + _extra_html(message.get("content_type"), message.get("extra_content"), max_rows, store)
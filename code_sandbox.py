@@ -0,0 +1,379 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import threading
+import time
+import traceback
+import uuid
+import weakref
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+import psutil
+import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+
+# Raised when generated code goes over the CPU time, wall-clock or memory limit of the
+# sandbox; `limit` names which one. The worker running it has been killed.
+class SandboxLimitExceeded(Exception):
+    def __init__(self, limit, message):
+        super().__init__(message)
+        self.limit = limit
+
+
+# Raised when generated code fails in a worker; the message is the worker's traceback
+class SandboxCodeError(Exception):
+    pass
+
+
+# Raised when the job that asked for the code to run was cancelled or timed out, either
+# before the code started or while it ran (the worker is then killed)
+class SandboxCancelled(Exception):
+    pass
+
+
+# Cancel event of the job running on the current thread, see `cancellable`
+_job = threading.local()
+
+# Function to make sandboxed code run by the current thread stop when `cancel_event` is set.
+# PandasAI calls the sandbox from the thread that called chat(), after generating the code.
+@contextmanager
+def cancellable(cancel_event):
+    previous = getattr(_job, "cancel_event", None)
+    _job.cancel_event = cancel_event
+    try:
+        yield
+    finally:
+        _job.cancel_event = previous
+
+
+# Function to write an Arrow table as an uncompressed IPC file, which readers can map
+# without copying or deserializing it
+def write_arrow(table, path):
+    with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+# Function to map an Arrow IPC file; the table's buffers point into the mapping
+def read_arrow(path):
+    return pa.ipc.open_file(pa.memory_map(path)).read_all()
+
+# Function to remove a file that may already be gone
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+# Function to pass a DataFrame result back through an Arrow file next to the dataset
+# instead of pickling it through the pipe; other results are small and pickled as they are
+def _pack_result(result, result_dir):
+    import pandas as pd
+
+    if not isinstance(result, dict) or result.get("type") != "dataframe":
+        return result
+    value = result.get("value")
+    if not isinstance(value, (pd.DataFrame, pd.Series)):
+        return result
+    series_name = value.name if isinstance(value, pd.Series) else None
+    frame = value.to_frame() if isinstance(value, pd.Series) else value
+    try:
+        table = pa.Table.from_pandas(frame)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, ValueError):
+        return result
+    path = os.path.join(result_dir, f"result-{uuid.uuid4().hex}.arrow")
+    write_arrow(table, path)
+    return {**result, "value": None, "arrow_path": path, "series": isinstance(value, pd.Series), "series_name": series_name}
+
+# Function run by each worker process: maps the dataset of a task, registers it in DuckDB
+# under the table name PandasAI gave it, and executes the generated code in a fresh
+# namespace with the functions PandasAI's own executor provides
+def _worker_main(conn, memory_bytes):
+    import duckdb
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import numpy as np
+    import pandas as pd
+
+    config = {"memory_limit": f"{max(memory_bytes // (1024 * 1024), 64)}MB"} if memory_bytes else {}
+    database = duckdb.connect(config=config)
+    registered = {}
+    conn.send("ready")
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        # Drop the mappings of other datasets so their files can be freed
+        for name in [name for name, path in registered.items() if name != task["table"] or path != task["dataset"]]:
+            database.unregister(name)
+            del registered[name]
+        if task["table"] not in registered:
+            database.register(task["table"], read_arrow(task["dataset"]))
+            registered[task["table"]] = task["dataset"]
+        namespace = {"pd": pd, "np": np, "plt": plt, "execute_sql_query": lambda sql: database.sql(sql).df()}
+        try:
+            exec(compile(task["code"], "<generated>", "exec"), namespace)
+            if "result" not in namespace:
+                reply = ("error", "No result returned")
+            else:
+                reply = ("ok", _pack_result(namespace["result"], task["result_dir"]))
+        except MemoryError:
+            reply = ("limit", "memory", "MemoryError")
+        except Exception as e:
+            if type(e).__name__ == "OutOfMemoryException":
+                reply = ("limit", "memory", str(e))
+            else:
+                reply = ("error", traceback.format_exc())
+        finally:
+            plt.close("all")
+            namespace = None
+        try:
+            conn.send(reply)
+        except Exception as e:
+            conn.send(("error", f"The result cannot be sent back: {str(e)}"))
+
+
+# One worker process and its end of the pipe. Starting one waits until the worker has
+# imported its libraries, so that time is not counted against a task's limits.
+class _Worker:
+    def __init__(self, context, memory_bytes, start_timeout=60):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, memory_bytes), name="sandbox", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ps = psutil.Process(self.process.pid)
+        try:
+            ready = self.conn.poll(start_timeout) and self.conn.recv() == "ready"
+        except EOFError:
+            ready = False
+        if not ready:
+            self.stop(kill=True)
+            raise RuntimeError("The sandbox worker did not start")
+
+    def alive(self):
+        return self.process.is_alive()
+
+    # Function to measure the worker's CPU time and private memory (mapped dataset pages excluded)
+    def usage(self):
+        cpu = self.ps.cpu_times()
+        memory = self.ps.memory_info()
+        return cpu.user + cpu.system, memory.rss - getattr(memory, "shared", 0)
+
+    def stop(self, kill=False):
+        if not kill and self.alive():
+            try:
+                self.conn.send(None)
+                self.process.join(1)
+            except (OSError, ValueError):
+                pass
+        if self.alive():
+            self.process.kill()
+            self.process.join(1)
+        self.conn.close()
+
+
+# One dataset exported for the workers, shared by the sandboxes of its assistants
+@dataclass
+class _Export:
+    path: str = None
+    refs: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+# Process-wide pool of worker processes running PandasAI-generated code outside the
+# server, so a heavy group-by or plot neither holds the GIL of the Streamlit process nor
+# takes it down when it runs out of memory. Datasets reach the workers as Arrow files in
+# `directory` (shared memory under /dev/shm by default) that each worker maps instead of
+# unpickling, once per dataset fingerprint however many assistants use it, and DataFrame
+# results come back the same way. While a task runs the pool
+# watches the worker's CPU time, wall-clock time and private memory and kills it past
+# `cpu_seconds`, `wall_seconds` or `memory_bytes`; a fresh worker replaces it.
+class SandboxPool:
+    def __init__(self, directory, max_workers=2, cpu_seconds=60, wall_seconds=90, memory_bytes=2 * 1024 * 1024 * 1024,
+                 poll_seconds=0.05):
+        self.root = directory
+        self.directory = os.path.join(directory, f"sandbox-{os.getpid()}")
+        os.makedirs(self.directory, exist_ok=True)
+        self.cpu_seconds = cpu_seconds
+        self.wall_seconds = wall_seconds
+        self.memory_bytes = memory_bytes
+        self.poll_seconds = poll_seconds
+        self.limit_kills = {"cpu": 0, "wall": 0, "memory": 0}
+        self._context = multiprocessing.get_context("spawn")
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._exports = {}
+        self._lock = threading.Lock()
+        self._purge_stale_dirs()
+        atexit.register(self.shutdown)
+
+    # Function to remove the directories of pools whose process is gone
+    def _purge_stale_dirs(self):
+        for name in os.listdir(self.root):
+            if not name.startswith("sandbox-"):
+                continue
+            pid = name[len("sandbox-"):]
+            if pid.isdigit() and int(pid) != os.getpid() and not psutil.pid_exists(int(pid)):
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+                logger.info("Removed stale sandbox directory %s", name)
+
+    # Function to write a DataFrame where workers can map it; returns the file path
+    def export(self, df):
+        path = os.path.join(self.directory, f"dataset-{uuid.uuid4().hex}.arrow")
+        write_arrow(pa.Table.from_pandas(df, preserve_index=False), path)
+        logger.debug("Exported %d rows for the sandbox to %s", len(df), path)
+        return path
+
+    # Function to return the file of dataset `key` (its fingerprint), exporting `df` on the
+    # first request; each call holds the file until a matching release_export(key)
+    def acquire_export(self, key, df):
+        with self._lock:
+            entry = self._exports.setdefault(key, _Export())
+            entry.refs += 1
+        try:
+            with entry.lock:
+                if entry.path is None:
+                    entry.path = self.export(df)
+        except BaseException:
+            self.release_export(key)
+            raise
+        return entry.path
+
+    # Function to drop one hold on an exported dataset; the last one removes its file
+    def release_export(self, key):
+        with self._lock:
+            entry = self._exports.get(key)
+            if entry is None:
+                return
+            entry.refs -= 1
+            if entry.refs > 0:
+                return
+            del self._exports[key]
+        if entry.path is not None:
+            _remove_file(entry.path)
+
+    def _checkout(self):
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return _Worker(self._context, self.memory_bytes)
+            if worker.alive():
+                return worker
+            worker.stop(kill=True)
+
+    # Function to wait for the worker's reply, enforcing the limits. Returns the reply,
+    # or the name of the limit that was exceeded ("cancelled" when `cancel_event` was set).
+    def _wait(self, worker, cancel_event=None):
+        started = time.monotonic()
+        cpu_start, memory_start = worker.usage()
+        while not worker.conn.poll(self.poll_seconds):
+            if cancel_event is not None and cancel_event.is_set():
+                return None, "cancelled"
+            if not worker.alive():
+                return None, "memory"
+            try:
+                cpu, memory = worker.usage()
+            except psutil.Error:
+                return None, "memory"
+            if time.monotonic() - started > self.wall_seconds:
+                return None, "wall"
+            if self.cpu_seconds and cpu - cpu_start > self.cpu_seconds:
+                return None, "cpu"
+            if self.memory_bytes and memory - memory_start > self.memory_bytes:
+                return None, "memory"
+        try:
+            return worker.conn.recv(), None
+        except EOFError:
+            # The worker died, most likely killed by the system for its memory use
+            return None, "memory"
+
+    # Function to run generated code against a dataset exported with `export`, registered
+    # as `table`. Returns the code's `result` dict. Setting `cancel_event` kills the worker.
+    def run(self, code, dataset_path, table, cancel_event=None):
+        if not self._slots.acquire(timeout=self.wall_seconds):
+            raise TimeoutError(f"No sandbox worker available after {self.wall_seconds}s")
+        try:
+            worker = self._checkout()
+            worker.conn.send({"code": code, "dataset": dataset_path, "table": table, "result_dir": self.directory})
+            reply, limit = self._wait(worker, cancel_event)
+            if reply is not None and reply[0] == "limit":
+                limit = reply[1]
+            if limit == "cancelled":
+                worker.stop(kill=True)
+                raise SandboxCancelled("The job was cancelled while its code was running")
+            if limit is not None:
+                worker.stop(kill=True)
+                self.limit_kills[limit] += 1
+                logger.warning("Sandboxed code stopped: %s limit exceeded", limit)
+                raise SandboxLimitExceeded(limit, f"Generated code exceeded the sandbox {limit} limit")
+            self._idle.put(worker)
+        finally:
+            self._slots.release()
+        if reply[0] == "error":
+            raise SandboxCodeError(reply[1])
+        return self._unpack(reply[1])
+
+    def _unpack(self, result):
+        if not isinstance(result, dict) or "arrow_path" not in result:
+            return result
+        path = result.pop("arrow_path")
+        frame = read_arrow(path).to_pandas()
+        _remove_file(path)
+        series, series_name = result.pop("series"), result.pop("series_name")
+        result["value"] = frame.iloc[:, 0].rename(series_name) if series else frame
+        return result
+
+    def stats(self):
+        with self._lock:
+            exports = len(self._exports)
+        return {"idle": self._idle.qsize(), "exports": exports, "limit_kills": dict(self.limit_kills)}
+
+    # Function to stop the idle workers and remove the pool's files
+    def shutdown(self):
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+# Sandbox handed to a PandasAI Agent: the Agent calls `execute(code, environment)` with
+# the generated code instead of running it in-process. The frame is exported on the
+# first execution, or the file the pool already holds for `dataset_key` (the frame's
+# fingerprint) is reused; the hold is released when the sandbox, i.e. its assistant, is dropped.
+# Code of a job cancelled under `cancellable` is not started, or stopped while it runs.
+class ProcessSandbox:
+    def __init__(self, pool, table_name, df, dataset_key=None):
+        self.pool = pool
+        self.table_name = table_name
+        self.dataset_key = dataset_key or f"sandbox-{uuid.uuid4().hex}"
+        self._df = df
+        self._path = None
+        self._lock = threading.Lock()
+
+    def execute(self, code, environment):
+        # Only called from PandasAI, so importing it here costs nothing
+        from pandasai.exceptions import CodeExecutionError
+
+        cancel_event = getattr(_job, "cancel_event", None)
+        if cancel_event is not None and cancel_event.is_set():
+            raise SandboxCancelled("The job was cancelled before its code ran")
+        with self._lock:
+            if self._path is None:
+                self._path = self.pool.acquire_export(self.dataset_key, self._df)
+                self._df = None
+                weakref.finalize(self, self.pool.release_export, self.dataset_key)
+        try:
+            return self.pool.run(code, self._path, self.table_name, cancel_event=cancel_event)
+        except SandboxCodeError as e:
+            raise CodeExecutionError(f"Code execution failed:\n{e}") from e
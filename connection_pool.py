@@ -0,0 +1,292 @@
+import hashlib
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from tracing import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+# Base class of the pools handed out by PoolManager. Subclasses implement
+# `connection()` as a context manager yielding something pandas.read_sql accepts.
+class ConnectionPool:
+    kind = "database"
+
+    def __init__(self, label):
+        self.label = label
+        self.connect_latency = LatencyStats()
+        self.checkout_latency = LatencyStats()
+        self.health_latency = LatencyStats()
+        self.last_health_check = 0.0
+        self.last_health_result = False
+        self.last_error = None
+        self.users = 0
+
+    @contextmanager
+    def connection(self):
+        raise NotImplementedError
+
+    def ping(self):
+        started = time.perf_counter()
+        with self.connection() as conn:
+            self._execute_ping(conn)
+        self.health_latency.record(time.perf_counter() - started)
+
+    def _execute_ping(self, conn):
+        raise NotImplementedError
+
+    def size(self):
+        return {}
+
+    def dispose(self):
+        pass
+
+    def stats(self):
+        return {
+            "kind": self.kind,
+            "label": self.label,
+            "users": self.users,
+            "connect": self.connect_latency.summary(),
+            "checkout": self.checkout_latency.summary(),
+            "health": self.health_latency.summary(),
+            "healthy": self.last_health_result,
+            "health_age_seconds": time.monotonic() - self.last_health_check if self.last_health_check else None,
+            **self.size(),
+        }
+
+
+# MySQL pool: a SQLAlchemy engine with a QueuePool that pings connections on checkout
+# and recycles them before MySQL's wait_timeout drops them server-side. SQLAlchemy is
+# imported when the first MySQL pool is created, not when the app starts.
+class MySQLPool(ConnectionPool):
+    kind = "MySQL"
+
+    def __init__(self, url, label, pool_size=5, max_overflow=10, recycle_seconds=1800, timeout_seconds=30):
+        from sqlalchemy import create_engine, event
+        super().__init__(label)
+        self.engine = create_engine(
+            url,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_pre_ping=True,
+            pool_recycle=recycle_seconds,
+            pool_timeout=timeout_seconds,
+        )
+        local = threading.local()
+
+        @event.listens_for(self.engine, "do_connect")
+        def _before_connect(dialect, conn_rec, cargs, cparams):
+            local.started = time.perf_counter()
+
+        @event.listens_for(self.engine, "connect")
+        def _after_connect(dbapi_connection, connection_record):
+            started = getattr(local, "started", None)
+            if started is not None:
+                self.connect_latency.record(time.perf_counter() - started)
+                local.started = None
+
+    @contextmanager
+    def connection(self):
+        started = time.perf_counter()
+        with self.engine.connect() as conn:
+            self.checkout_latency.record(time.perf_counter() - started)
+            yield conn
+
+    def _execute_ping(self, conn):
+        from sqlalchemy import text
+        conn.execute(text("SELECT 1")).fetchone()
+
+    def size(self):
+        pool = self.engine.pool
+        return {"idle": pool.checkedin(), "in_use": pool.checkedout()}
+
+    def dispose(self):
+        self.engine.dispose()
+
+
+# ODBC pool for Azure SQL / Dataverse. pyodbc connections are not safe to share
+# between threads, so each checkout gets exclusive use of one connection; idle ones
+# are validated with SELECT 1 before reuse and replaced once older than the recycle age.
+# pyodbc is imported when the first ODBC pool is created.
+class OdbcPool(ConnectionPool):
+    kind = "ODBC"
+
+    def __init__(self, conn_str, label, max_size=5, recycle_seconds=1800, validate_idle_seconds=5, timeout_seconds=30):
+        import pyodbc
+        super().__init__(label)
+        self._pyodbc = pyodbc
+        self._conn_str = conn_str
+        self.recycle_seconds = recycle_seconds
+        self.validate_idle_seconds = validate_idle_seconds
+        self.timeout_seconds = timeout_seconds
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._in_use = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        started = time.perf_counter()
+        conn = self._pyodbc.connect(self._conn_str)
+        self.connect_latency.record(time.perf_counter() - started)
+        return conn, time.monotonic()
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except self._pyodbc.Error:
+            pass
+
+    # Function to take an idle connection that is still usable, or open a new one
+    def _acquire(self):
+        now = time.monotonic()
+        while True:
+            try:
+                conn, created, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                conn, created = self._connect()
+                return conn, created
+            if now - created > self.recycle_seconds:
+                self._close(conn)
+                continue
+            if now - last_used > self.validate_idle_seconds:
+                try:
+                    conn.cursor().execute("SELECT 1").fetchone()
+                except self._pyodbc.Error as e:
+                    logger.debug("Discarding stale ODBC connection for %s: %s", self.label, e)
+                    self._close(conn)
+                    continue
+            return conn, created
+
+    @contextmanager
+    def connection(self):
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout_seconds):
+            raise TimeoutError(f"No ODBC connection available for {self.label} after {self.timeout_seconds}s")
+        try:
+            conn, created = self._acquire()
+        except Exception:
+            self._slots.release()
+            raise
+        self.checkout_latency.record(time.perf_counter() - started)
+        with self._lock:
+            self._in_use += 1
+        healthy = True
+        try:
+            yield conn
+        except self._pyodbc.Error:
+            healthy = False
+            raise
+        finally:
+            try:
+                if healthy:
+                    try:
+                        conn.rollback()
+                        self._idle.put((conn, created, time.monotonic()))
+                    except self._pyodbc.Error:
+                        self._close(conn)
+                else:
+                    self._close(conn)
+            finally:
+                with self._lock:
+                    self._in_use -= 1
+                self._slots.release()
+
+    def _execute_ping(self, conn):
+        conn.cursor().execute("SELECT 1").fetchone()
+
+    def size(self):
+        return {"idle": self._idle.qsize(), "in_use": self._in_use}
+
+    def dispose(self):
+        while True:
+            try:
+                conn, _, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close(conn)
+
+
+# Process-wide registry of pools keyed by connection target and credentials, so users
+# connecting with the same credentials share one pool. Health checks are rate-limited:
+# a pool pinged within `health_ttl_seconds` reports its cached result.
+class PoolManager:
+    def __init__(self, pool_size=5, max_overflow=10, recycle_seconds=1800, timeout_seconds=30,
+                 validate_idle_seconds=5, health_ttl_seconds=30):
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.recycle_seconds = recycle_seconds
+        self.timeout_seconds = timeout_seconds
+        self.validate_idle_seconds = validate_idle_seconds
+        self.health_ttl_seconds = health_ttl_seconds
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(*parts):
+        return hashlib.sha256("\x00".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+    def _get_or_create(self, key, factory):
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = factory()
+                self._pools[key] = pool
+            pool.users += 1
+            return pool
+
+    def mysql_pool(self, host, database, username, password, port=3306):
+        url = f"mysql+pymysql://{username}:{password or ''}@{host}:{port}/{database}"
+        return self._get_or_create(
+            self._key("mysql", host, port, database, username, password or ""),
+            lambda: MySQLPool(
+                url, f"{username}@{host}:{port}/{database}",
+                pool_size=self.pool_size, max_overflow=self.max_overflow,
+                recycle_seconds=self.recycle_seconds, timeout_seconds=self.timeout_seconds
+            )
+        )
+
+    def odbc_pool(self, server, database, username, password, driver="ODBC Driver 17 for SQL Server"):
+        conn_str = f"DRIVER={{{driver}}};SERVER={server};DATABASE={database};UID={username};PWD={password};Connection Timeout=30"
+        return self._get_or_create(
+            self._key("odbc", driver, server, database, username, password),
+            lambda: OdbcPool(
+                conn_str, f"{username}@{server}/{database}",
+                max_size=self.pool_size + self.max_overflow, recycle_seconds=self.recycle_seconds,
+                validate_idle_seconds=self.validate_idle_seconds, timeout_seconds=self.timeout_seconds
+            )
+        )
+
+    def is_healthy(self, pool, force=False):
+        if pool is None:
+            return False
+        now = time.monotonic()
+        if not force and pool.last_health_check and now - pool.last_health_check < self.health_ttl_seconds:
+            return pool.last_health_result
+        try:
+            pool.ping()
+            pool.last_health_result = True
+            pool.last_error = None
+        except Exception as e:
+            logger.error("Health check failed for %s: %s", pool.label, e)
+            pool.last_health_result = False
+            pool.last_error = str(e)
+        pool.last_health_check = time.monotonic()
+        return pool.last_health_result
+
+    def release(self, pool):
+        with self._lock:
+            pool.users = max(pool.users - 1, 0)
+            if pool.users:
+                return
+            for key, candidate in list(self._pools.items()):
+                if candidate is pool:
+                    del self._pools[key]
+        pool.dispose()
+        logger.debug("Disposed connection pool %s", pool.label)
+
+    def stats(self):
+        with self._lock:
+            pools = list(self._pools.values())
+        return [pool.stats() for pool in pools]
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Check if PyArrow is available
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    ARROW_AVAILABLE = True
+except ImportError:
+    ARROW_AVAILABLE = False
+
+# Cached files held open by readers (imported SQL dumps behind a SQLiteCatalog), with the
+# number of holders of each; evict() leaves them in place
+_held_files = Counter()
+_held_lock = threading.Lock()
+
+# Function to mark a cached file as in use until release_file() is called
+def hold_file(path):
+    with _held_lock:
+        _held_files[os.path.realpath(path)] += 1
+
+# Function to drop one hold on a cached file
+def release_file(path):
+    path = os.path.realpath(path)
+    with _held_lock:
+        _held_files[path] -= 1
+        if _held_files[path] <= 0:
+            del _held_files[path]
+
+# Function to hash the content of an uploaded file without keeping a second copy
+def content_digest(file_obj, block_size=8 * 1024 * 1024):
+    hasher = hashlib.sha256()
+    file_obj.seek(0)
+    while True:
+        block = file_obj.read(block_size)
+        if not block:
+            break
+        hasher.update(block)
+    file_obj.seek(0)
+    return hasher.hexdigest()
+
+
+# Content-addressed cache of parsed datasets stored as uncompressed Arrow IPC (Feather v2)
+# files. Files are memory-mapped on read so sessions loading the same upload share the
+# OS page cache; total size is bounded by evicting the least recently used files that no
+# reader holds (see hold_file). A frame
+# may carry a small JSON metadata dict (e.g. how it was loaded) in its Arrow schema.
+class DatasetCache:
+    def __init__(self, cache_dir, max_bytes=5 * 1024 * 1024 * 1024):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def path_for(self, key, suffix):
+        return os.path.join(self.cache_dir, f"{key}{suffix}")
+
+    def get_frame(self, key, with_metadata=False):
+        if not ARROW_AVAILABLE:
+            return (None, {}) if with_metadata else None
+        path = self.path_for(key, ".arrow")
+        try:
+            table = feather.read_table(path, memory_map=True)
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return (None, {}) if with_metadata else None
+        except Exception as e:
+            logger.warning("Dropping unreadable dataset cache file %s: %s", path, e)
+            self._remove(path)
+            self.misses += 1
+            return (None, {}) if with_metadata else None
+        self.hits += 1
+        df = table.to_pandas(split_blocks=True)
+        if not with_metadata:
+            return df
+        raw = (table.schema.metadata or {}).get(b"ai_insight")
+        return df, json.loads(raw) if raw else {}
+
+    def put_frame(self, key, df, metadata=None):
+        if not ARROW_AVAILABLE:
+            return False
+        path = self.path_for(key, ".arrow")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            table = pa.Table.from_pandas(df)
+            if metadata:
+                table = table.replace_schema_metadata({**(table.schema.metadata or {}), b"ai_insight": json.dumps(metadata)})
+            feather.write_feather(table, tmp_path, compression="uncompressed")
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning("Could not cache dataset %s: %s", key, e)
+            self._remove(tmp_path)
+            return False
+        self.evict()
+        return True
+
+    def evict(self):
+        with self._lock:
+            files = []
+            for name in os.listdir(self.cache_dir):
+                path = os.path.join(self.cache_dir, name)
+                # SQLite -wal/-shm sidecars are accounted for and removed with their database
+                if name.endswith((".tmp", "-wal", "-shm")) or not os.path.isfile(path):
+                    continue
+                stat = os.stat(path)
+                size = stat.st_size + sum(os.path.getsize(path + suffix) for suffix in ("-wal", "-shm") if os.path.exists(path + suffix))
+                files.append((stat.st_mtime, size, path))
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                with _held_lock:
+                    held = os.path.realpath(path) in _held_files
+                if held:
+                    continue
+                if self._remove(path):
+                    for suffix in ("-wal", "-shm"):
+                        self._remove(path + suffix)
+                    total -= size
+                    logger.debug("Evicted cached dataset %s", path)
+
+    def stats(self):
+        files, size = 0, 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".tmp") or not entry.is_file():
+                continue
+            try:
+                size += entry.stat().st_size
+                files += 1
+            except FileNotFoundError:
+                continue
+        return {"files": files, "size_bytes": size, "hits": self.hits, "misses": self.misses}
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
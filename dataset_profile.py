@@ -0,0 +1,282 @@
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import settings
+from sketches import QUANTILE_LEVELS, DatasetSketches, column_kind
+
+logger = logging.getLogger(__name__)
+
+# Function to convert numpy and pandas scalars to JSON-friendly Python values
+def _plain(value):
+    if value is None or (not isinstance(value, (list, tuple)) and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+# Builds a dataset profile from one frame or from successive chunks of it. Null counts,
+# min/max and means are exact; value counts (hence distinct counts and top-K values) are
+# exact until a column exceeds `max_tracked_values` distinct values; quantiles and
+# histograms come from a uniform bottom-k sample of `sample_size` values per column,
+# which merges across chunks. A DatasetSketches passed as `sketches` is fed the same
+# chunks; it is stored in the profile and estimates the distinct counts that went untracked.
+class ProfileBuilder:
+    def __init__(self, top_k=10, bins=20, sample_size=10_000, max_tracked_values=100_000, seed=0, sketches=None):
+        self.top_k = top_k
+        self.bins = bins
+        self.sample_size = sample_size
+        self.max_tracked_values = max_tracked_values
+        self.sketches = sketches
+        self.rows = 0
+        self._columns = {}
+        self._rng = np.random.default_rng(seed)
+
+    def _state(self, name, series):
+        state = self._columns.get(name)
+        if state is None:
+            state = self._columns[name] = {
+                "kind": column_kind(series), "dtype": str(series.dtype), "nulls": 0, "count": 0,
+                "min": None, "max": None, "sum": 0.0, "counts": pd.Series(dtype="int64"),
+                "distinct_at_least": 0, "sample": np.empty(0), "keys": np.empty(0),
+            }
+        return state
+
+    def update(self, chunk):
+        self.rows += len(chunk)
+        if self.sketches is not None:
+            self.sketches.update(chunk)
+        for name in chunk.columns:
+            series = chunk[name]
+            state = self._state(name, series)
+            state["dtype"] = str(series.dtype)
+            values = series.dropna()
+            state["nulls"] += len(series) - len(values)
+            state["count"] += len(values)
+            if values.empty:
+                continue
+            if state["kind"] != "categorical":
+                low, high = values.min(), values.max()
+                state["min"] = low if state["min"] is None else min(state["min"], low)
+                state["max"] = high if state["max"] is None else max(state["max"], high)
+                raw = values.to_numpy()
+                if state["kind"] == "datetime":
+                    raw = raw.astype("datetime64[ns]").astype("int64")
+                else:
+                    raw = raw.astype("float64")
+                    state["sum"] += float(raw.sum())
+                self._sample(state, raw)
+            if state["counts"] is not None:
+                counts = values.value_counts(sort=False)
+                counts = counts[counts > 0]
+                counts.index = counts.index.astype(object)
+                state["counts"] = state["counts"].add(counts, fill_value=0).astype("int64")
+                if len(state["counts"]) > self.max_tracked_values:
+                    state["distinct_at_least"] = len(state["counts"])
+                    state["counts"] = None
+        return self
+
+    # Function to keep the `sample_size` values with the smallest random keys seen so far
+    def _sample(self, state, raw):
+        keys = self._rng.random(len(raw))
+        if len(raw) > self.sample_size:
+            keep = np.argpartition(keys, self.sample_size)[:self.sample_size]
+            raw, keys = raw[keep], keys[keep]
+        sample = np.concatenate([state["sample"], raw])
+        keys = np.concatenate([state["keys"], keys])
+        if len(sample) > self.sample_size:
+            keep = np.argpartition(keys, self.sample_size)[:self.sample_size]
+            sample, keys = sample[keep], keys[keep]
+        state["sample"], state["keys"] = sample, keys
+
+    def _finalize_column(self, name, state):
+        column = {
+            "dtype": state["dtype"],
+            "kind": state["kind"],
+            "nulls": int(state["nulls"]),
+            "null_ratio": state["nulls"] / self.rows if self.rows else 0.0,
+        }
+        if state["counts"] is not None:
+            counts = state["counts"].sort_values(ascending=False, kind="stable")
+            column["distinct"] = int(len(counts))
+            column["top"] = [[_plain(value), int(count)] for value, count in counts.head(self.top_k).items()]
+        else:
+            column["distinct"] = None
+            column["distinct_at_least"] = int(state["distinct_at_least"])
+            if self.sketches is not None:
+                column["distinct_estimate"] = int(round(self.sketches.distinct(name)[0]))
+        if state["kind"] == "categorical" or state["count"] == 0:
+            return column
+        sample = np.sort(state["sample"])
+        levels = QUANTILE_LEVELS
+        quantiles = np.quantile(sample, levels)
+        column["approximate"] = len(sample) < state["count"]
+        if state["kind"] == "datetime":
+            column["min"] = _plain(pd.Timestamp(state["min"]))
+            column["max"] = _plain(pd.Timestamp(state["max"]))
+            column["quantiles"] = {str(level): pd.Timestamp(int(value)).isoformat() for level, value in zip(levels, quantiles)}
+            return column
+        column["min"] = _plain(state["min"])
+        column["max"] = _plain(state["max"])
+        column["mean"] = state["sum"] / state["count"]
+        column["quantiles"] = {str(level): float(value) for level, value in zip(levels, quantiles)}
+        if np.isfinite(sample[[0, -1]]).all():
+            hist, edges = np.histogram(sample, bins=self.bins, range=(float(state["min"]), float(state["max"])))
+            scale = state["count"] / len(sample)
+            column["histogram"] = {"edges": [float(edge) for edge in edges], "counts": [int(round(c * scale)) for c in hist]}
+        return column
+
+    # Function to produce the profile; `dtypes` overrides the chunk dtypes (e.g. after downcasting)
+    # and `rows` the row count, for profiles of a sample standing in for a larger table
+    def finalize(self, dtypes=None, rows=None):
+        columns = {}
+        for name, state in self._columns.items():
+            if dtypes is not None and name in dtypes:
+                state["dtype"] = str(dtypes[name])
+            columns[str(name)] = self._finalize_column(str(name), state)
+        profile = {
+            "rows": int(rows if rows is not None else self.rows),
+            "profiled_rows": int(self.rows),
+            "sampled": rows is not None and rows != self.rows,
+            "columns": columns,
+        }
+        if self.sketches is not None:
+            profile["sketches"] = self.sketches.to_dict()
+        return profile
+
+# Function to get a ProfileBuilder configured from settings, with sketches for approximate mode
+def new_profile_builder():
+    sketches = None
+    if settings.APPROX_SKETCHES:
+        sketches = DatasetSketches(
+            precision=settings.APPROX_HLL_PRECISION, k=settings.APPROX_KLL_K, width=settings.APPROX_CMS_WIDTH,
+            depth=settings.APPROX_CMS_DEPTH, heavy_hitters=settings.APPROX_HEAVY_HITTERS, max_groups=settings.APPROX_MAX_GROUPS
+        )
+    return ProfileBuilder(top_k=settings.PROFILE_TOP_K, max_tracked_values=settings.PROFILE_MAX_TRACKED_VALUES, sketches=sketches)
+
+# Function to profile a whole DataFrame in one pass
+def build_profile(df, rows=None, **kwargs):
+    return ProfileBuilder(**kwargs).update(df).finalize(rows=rows)
+
+# Function to format a profile value for display
+def format_value(value):
+    if isinstance(value, float):
+        return f"{value:.0f}" if abs(value) >= 1e4 else f"{value:.4g}"
+    return "" if value is None else str(value)
+
+# Function to format the distinct count of a profiled column: exact, estimated (≈) or a lower bound (≥)
+def format_distinct(column):
+    if column["distinct"] is not None:
+        return f"{column['distinct']:,}"
+    if column.get("distinct_estimate") is not None:
+        return f"≈{column['distinct_estimate']:,}"
+    return f"≥{column['distinct_at_least']:,}"
+
+# Function to summarize a profile as one row per column
+def profile_table(profile):
+    rows = []
+    for name, column in profile["columns"].items():
+        top = column.get("top") or []
+        rows.append({
+            "column": name,
+            "dtype": column["dtype"],
+            "nulls": column["nulls"],
+            "null %": round(column["null_ratio"] * 100, 2),
+            "distinct": format_distinct(column),
+            "min": format_value(column.get("min")),
+            "median": format_value(column.get("quantiles", {}).get("0.5")),
+            "max": format_value(column.get("max")),
+            "top value": format_value(top[0][0]) if top and column["kind"] == "categorical" else "",
+        })
+    return pd.DataFrame(rows)
+
+# Function to describe a profile in a few lines of text, used as context for the LLM
+def profile_description(profile, max_columns=50, top_values=5):
+    lines = [f"Dataset of {profile['rows']:,} rows and {len(profile['columns'])} columns."]
+    for name, column in list(profile["columns"].items())[:max_columns]:
+        parts = [f"{column['dtype']}"]
+        if column["nulls"]:
+            parts.append(f"{column['null_ratio']:.1%} null")
+        parts.append(f"{format_distinct(column)} distinct")
+        if "min" in column:
+            parts.append(f"range {format_value(column['min'])} to {format_value(column['max'])}")
+            parts.append(f"median {format_value(column['quantiles']['0.5'])}")
+        elif column.get("top"):
+            total = profile["profiled_rows"] or 1
+            parts.append("most frequent: " + ", ".join(
+                f"{value} ({count / total:.0%})" for value, count in column["top"][:top_values]
+            ))
+        lines.append(f"- {name}: " + "; ".join(parts))
+    return "\n".join(lines)
+
+
+# Process-wide index of dataset profiles keyed by dataset fingerprint, kept in memory
+# (LRU-bounded) and as JSON files so profiles survive restarts
+class ProfileIndex:
+    def __init__(self, cache_dir=None, max_entries=64):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.builds = 0
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, fingerprint):
+        return os.path.join(self.cache_dir, f"{fingerprint}.json")
+
+    def get(self, fingerprint):
+        with self._lock:
+            profile = self._profiles.get(fingerprint)
+            if profile is not None:
+                self._profiles.move_to_end(fingerprint)
+                return profile
+        if self.cache_dir and os.path.exists(self._path(fingerprint)):
+            try:
+                with open(self._path(fingerprint), encoding="utf-8") as f:
+                    profile = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning("Could not read profile %s: %s", fingerprint, e)
+                return None
+            self._remember(fingerprint, profile)
+        return profile
+
+    def put(self, fingerprint, profile):
+        self._remember(fingerprint, profile)
+        if self.cache_dir:
+            # Sessions are threads of one process: two of them profiling the same dataset need their own file
+            tmp_path = f"{self._path(fingerprint)}.{os.getpid()}-{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(profile, f, default=str)
+                os.replace(tmp_path, self._path(fingerprint))
+            except OSError as e:
+                logger.warning("Could not write profile %s: %s", fingerprint, e)
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    # Function to return the stored profile, building it with `build` on the first request
+    def get_or_build(self, fingerprint, build):
+        profile = self.get(fingerprint)
+        if profile is None:
+            profile = build()
+            self.builds += 1
+            self.put(fingerprint, profile)
+        return profile
+
+    def _remember(self, fingerprint, profile):
+        with self._lock:
+            self._profiles[fingerprint] = profile
+            self._profiles.move_to_end(fingerprint)
+            while len(self._profiles) > self.max_entries:
+                self._profiles.popitem(last=False)
@@ -0,0 +1,160 @@
+import logging
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from answer_cache import dataframe_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+# One dataset held by the registry: the frame every session shares and its bookkeeping
+@dataclass
+class _Dataset:
+    fingerprint: str
+    frame: object
+    memory_bytes: int
+    info: dict = field(default_factory=dict)
+    sources: set = field(default_factory=set)
+    loaded_at: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)
+    hits: int = 0
+
+
+# Process-wide registry of loaded datasets, keyed by content fingerprint and reachable
+# through the identity of their source (upload digest, SQL table, database table and
+# sample size). Sessions get a shallow copy of the registered frame: it shares the
+# buffers, and with pandas copy-on-write a session modifying its copy never alters what
+# the others see. Each session holds one dataset through its SessionToken, so the
+# sharing count drops when the session switches dataset or ends. Datasets no session
+# holds stay available for reuse until the total goes over `max_bytes`, then the least
+# recently used idle ones are dropped; held datasets are never evicted. A dataset may
+# carry an `info` dict describing how it was loaded (e.g. truncated), handed to sessions
+# that share it.
+class DatasetRegistry:
+    def __init__(self, max_bytes=4 * 1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._datasets = OrderedDict()
+        self._sources = {}
+        self._holders = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _sessions(self):
+        counts = {}
+        for fingerprint in list(self._holders.values()):
+            counts[fingerprint] = counts.get(fingerprint, 0) + 1
+        return counts
+
+    def _hold(self, session_token, dataset):
+        previous = self._holders.get(session_token)
+        if previous is not None and previous != dataset.fingerprint and previous in self._datasets:
+            self._datasets[previous].last_used = time.time()
+        self._holders[session_token] = dataset.fingerprint
+        dataset.last_used = time.time()
+        self._datasets.move_to_end(dataset.fingerprint)
+        return dataset.fingerprint, dataset.frame.copy(deep=False)
+
+    # Function to drop the least recently used datasets no session holds until the total fits the budget
+    def _evict(self):
+        total = sum(dataset.memory_bytes for dataset in self._datasets.values())
+        if total <= self.max_bytes:
+            return
+        held = self._sessions()
+        for fingerprint in sorted(
+            (fingerprint for fingerprint in self._datasets if fingerprint not in held),
+            key=lambda fingerprint: self._datasets[fingerprint].last_used
+        ):
+            if total <= self.max_bytes:
+                break
+            dataset = self._datasets.pop(fingerprint)
+            for source in dataset.sources:
+                if self._sources.get(source) == fingerprint:
+                    del self._sources[source]
+            total -= dataset.memory_bytes
+            self.evictions += 1
+            logger.info("Evicted idle dataset %s (%.1f MB)", fingerprint[:12], dataset.memory_bytes / 1024 / 1024)
+
+    # Function to hand the session the dataset last registered for `source`, or None when
+    # there is none or it was loaded more than `max_age_seconds` ago (live tables).
+    # Returns (fingerprint, frame).
+    def lookup(self, source, session_token, max_age_seconds=None):
+        with self._lock:
+            dataset = self._datasets.get(self._sources.get(source))
+            if dataset is None or (max_age_seconds is not None and time.time() - dataset.loaded_at > max_age_seconds):
+                self.misses += 1
+                return None
+            self.hits += 1
+            dataset.hits += 1
+            shared = self._hold(session_token, dataset)
+            self._evict()
+        return shared
+
+    # Function to register a frame the session just loaded and hand it out. A dataset with
+    # the same content already registered is shared instead, and `df` is dropped.
+    # `source` may be None for frames nobody else can ask for (random samples, synced tables).
+    # Returns (fingerprint, frame).
+    def register(self, source, df, session_token, fingerprint=None, memory_bytes=None, info=None):
+        fingerprint = fingerprint or dataframe_fingerprint(df)
+        with self._lock:
+            dataset = self._datasets.get(fingerprint)
+            if dataset is None:
+                if memory_bytes is None:
+                    memory_bytes = int(df.memory_usage(deep=True).sum())
+                dataset = self._datasets[fingerprint] = _Dataset(fingerprint, df, memory_bytes, dict(info or {}))
+            else:
+                dataset.hits += 1
+                dataset.info.update(info or {})
+            if source is not None:
+                dataset.sources.add(source)
+                self._sources[source] = fingerprint
+                dataset.loaded_at = time.time()
+            shared = self._hold(session_token, dataset)
+            self._evict()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Dataset %s shared by %d session(s)", fingerprint[:12], self._sessions().get(fingerprint, 0))
+        return shared
+
+    # Function to stop counting the session as a holder of its dataset
+    def release(self, session_token):
+        with self._lock:
+            fingerprint = self._holders.pop(session_token, None)
+            if fingerprint in self._datasets:
+                self._datasets[fingerprint].last_used = time.time()
+            self._evict()
+
+    def memory_bytes(self, fingerprint):
+        dataset = self._datasets.get(fingerprint)
+        return dataset.memory_bytes if dataset is not None else 0
+
+    def info(self, fingerprint):
+        dataset = self._datasets.get(fingerprint)
+        return dict(dataset.info) if dataset is not None else {}
+
+    def stats(self):
+        with self._lock:
+            held = self._sessions()
+            now = time.time()
+            datasets = [{
+                "fingerprint": dataset.fingerprint,
+                "sources": sorted(dataset.sources),
+                "rows": len(dataset.frame),
+                "memory_bytes": dataset.memory_bytes,
+                "sessions": held.get(dataset.fingerprint, 0),
+                "hits": dataset.hits,
+                "idle_seconds": 0.0 if held.get(dataset.fingerprint) else now - dataset.last_used,
+            } for dataset in self._datasets.values()]
+        total = sum(dataset["memory_bytes"] for dataset in datasets)
+        return {
+            "datasets": datasets,
+            "memory_bytes": total,
+            "max_bytes": self.max_bytes,
+            "saved_bytes": sum(dataset["memory_bytes"] * max(dataset["sessions"] - 1, 0) for dataset in datasets),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,156 @@
+import logging
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+import settings
+from connection_pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# Function to open a cursor that streams the result of `sql` instead of buffering it in
+# the client. Yields the column names, a fetchmany function and a callback that marks
+# the result as fully read. A SQLAlchemy connection (MySQL) gets a server-side cursor
+# through stream_results; a DB-API connection (pyodbc, sqlite3) reads `arraysize` rows
+# per round trip. A result left unread (cancel, memory ceiling, error) is abandoned
+# rather than drained: the SQLAlchemy connection is invalidated, the ODBC statement cancelled.
+@contextmanager
+def _open_cursor(conn, sql, params, chunk_rows):
+    if isinstance(conn, ConnectionPool):
+        with conn.connection() as pooled:
+            with _open_cursor(pooled, sql, params, chunk_rows) as cursor:
+                yield cursor
+        return
+    if hasattr(conn, "connect") and hasattr(conn, "dialect"):
+        # SQLAlchemy engine
+        with conn.connect() as connection:
+            with _open_cursor(connection, sql, params, chunk_rows) as cursor:
+                yield cursor
+        return
+    exhausted = []
+    if hasattr(conn, "exec_driver_sql"):
+        result = conn.execution_options(stream_results=True, max_row_buffer=chunk_rows).exec_driver_sql(
+            sql, tuple(params) if params else None
+        )
+        try:
+            yield list(result.keys()), result.fetchmany, lambda: exhausted.append(True)
+        finally:
+            if exhausted:
+                result.close()
+            else:
+                # Closing a server-side cursor would read the rest of the result first
+                conn.invalidate()
+        return
+    cursor = conn.cursor()
+    cursor.arraysize = chunk_rows
+    try:
+        if params:
+            cursor.execute(sql, list(params))
+        else:
+            cursor.execute(sql)
+        columns = [column[0] for column in cursor.description or ()]
+        yield columns, cursor.fetchmany, lambda: exhausted.append(True)
+    finally:
+        if not exhausted and hasattr(cursor, "cancel"):
+            try:
+                cursor.cancel()
+            except Exception as e:
+                logger.debug("Could not cancel the statement: %s", e)
+        cursor.close()
+
+# Function to transpose one chunk of driver rows into per-column object arrays. numpy
+# does it in C; a row holding sequence values (a set or an array column) falls back to zip.
+def _columns_of(rows, width):
+    try:
+        matrix = np.array(rows, dtype=object)
+    except ValueError:
+        matrix = None
+    if matrix is not None and matrix.shape == (len(rows), width):
+        return [matrix[:, i] for i in range(width)]
+    return [np.array(values, dtype=object) for values in zip(*rows)]
+
+# Function to convert one chunk of driver rows into an Arrow record batch. DECIMAL values
+# become float64 (as read_sql's coerce_float does), and a column the driver returns with
+# mixed Python types is kept as text.
+def rows_to_record_batch(columns, rows):
+    arrays = []
+    for values in _columns_of(rows, len(columns)):
+        try:
+            array = pa.array(values, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            array = pa.array([None if value is None else str(value) for value in values], type=pa.string())
+        if pa.types.is_decimal(array.type):
+            array = array.cast(pa.float64())
+        arrays.append(array)
+    return pa.RecordBatch.from_arrays(arrays, names=[str(column) for column in columns])
+
+# Function to concatenate the fetched batches, widening types that differ between chunks
+# (a column that is all NULL or all integers in the first chunk)
+def _combine(batches):
+    tables = [pa.Table.from_batches([batch]) for batch in batches]
+    try:
+        return pa.concat_tables(tables, promote_options="permissive")
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        logger.debug("Fetched chunks have incompatible types; combining them with pandas")
+        return None
+
+# Function to run `sql` and stream its result in chunks of `chunk_rows` rows, converting
+# each chunk to an Arrow record batch as it arrives, so the driver's row objects never
+# exist for more than one chunk. Stops early when the batches exceed `max_memory_bytes`
+# (truncated) or when `cancel_event` is set (cancelled). `progress_callback` receives the
+# fraction of `expected_rows` fetched. Returns the DataFrame and a report.
+def fetch_frame(conn, sql, params=None, chunk_rows=None, max_memory_bytes=None, expected_rows=None,
+                progress_callback=None, cancel_event=None):
+    chunk_rows = chunk_rows or settings.DB_FETCH_CHUNK_ROWS
+    max_memory_bytes = settings.DB_FETCH_MAX_MEMORY_BYTES if max_memory_bytes is None else max_memory_bytes
+    logger.debug("Chunked fetch: %s %s", sql, params or "")
+    started = time.perf_counter()
+    batches, chunks, rows, arrow_bytes, truncated, cancelled = [], 0, 0, 0, False, False
+    with _open_cursor(conn, sql, params, chunk_rows) as (columns, fetchmany, mark_exhausted):
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                cancelled = True
+                break
+            chunk = fetchmany(chunk_rows)
+            if not chunk:
+                mark_exhausted()
+                break
+            batch = rows_to_record_batch(columns, chunk)
+            del chunk
+            batches.append(batch)
+            chunks += 1
+            rows += batch.num_rows
+            arrow_bytes += batch.nbytes
+            if progress_callback and expected_rows:
+                progress_callback(min(rows / expected_rows, 1.0))
+            if max_memory_bytes and arrow_bytes > max_memory_bytes:
+                truncated = True
+                break
+
+    if not batches:
+        df = pd.DataFrame(columns=columns)
+    else:
+        table = _combine(batches)
+        if table is None:
+            df = pd.concat([batch.to_pandas() for batch in batches], ignore_index=True)
+        else:
+            batches.clear()
+            df = table.to_pandas(split_blocks=True, self_destruct=True, coerce_temporal_nanoseconds=True)
+            del table
+    if progress_callback:
+        progress_callback(1.0)
+    report = {
+        "rows": len(df),
+        "chunks": chunks,
+        "arrow_bytes": arrow_bytes,
+        "truncated": truncated,
+        "cancelled": cancelled,
+        "seconds": time.perf_counter() - started,
+    }
+    logger.debug("Chunked fetch done: %s", report)
+    if truncated:
+        logger.warning("Fetch stopped at %d rows: the memory ceiling of %d bytes was reached", rows, max_memory_bytes)
+    return df, report
@@ -0,0 +1,218 @@
+import logging
+import time
+from dataclasses import dataclass
+
+import pandas as pd
+
+from pushdown import PLACEHOLDERS, build_select, quote_identifier, quote_table, run_query
+
+logger = logging.getLogger(__name__)
+
+# How a TableSync finds new and changed rows: a monotonic key (append-only tables such
+# as incidents), a last-modified timestamp with the key as tie-breaker (inserts and
+# updates), or SQL Server change tracking (inserts, updates and deletes)
+SYNC_MODES = ("key", "timestamp", "change_tracking")
+
+# Column names of the change-tracking metadata in fetched batches
+_OPERATION = "__sync_operation"
+_CHANGED_KEY = "__sync_key"
+
+
+# Raised when the saved change-tracking version is older than the server still keeps:
+# the changes in between are lost and the table has to be loaded again
+class SyncResetRequired(Exception):
+    pass
+
+
+# Outcome of one incremental sync. `appended` holds the new rows when the sync only
+# inserted rows, so derived data (profile, sketches) can be updated instead of rebuilt;
+# `trimmed` counts the oldest rows dropped to keep the window at its size.
+@dataclass
+class SyncResult:
+    inserted: int = 0
+    updated: int = 0
+    deleted: int = 0
+    trimmed: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+    complete: bool = True
+    appended: pd.DataFrame = None
+
+    @property
+    def changed(self):
+        return bool(self.inserted or self.updated or self.deleted)
+
+
+# Function to turn numpy scalars and pandas timestamps into values the drivers accept
+def _param(value):
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    return value.item() if hasattr(value, "item") else value
+
+
+# Keeps a loaded window of a database table up to date. The high-water mark (last key,
+# last (timestamp, key) pair or change-tracking version) advances after every batch, and
+# batches are keyset-paginated on the key, so a sync that stops after `max_batches`
+# resumes where it left off and no batch rescans rows already fetched. The window keeps
+# the size it was loaded with: new rows push the rows with the lowest keys out.
+# `fetch(conn, sql, params)` loads rows; db_fetch.fetch_frame streams them in chunks.
+class TableSync:
+    def __init__(self, conn, table, dialect, key_column, mode="key", timestamp_column=None, batch_rows=5000, max_batches=100,
+                 fetch=run_query):
+        if mode not in SYNC_MODES:
+            raise ValueError(f"Unknown sync mode: {mode}")
+        if mode == "timestamp" and not timestamp_column:
+            raise ValueError("The timestamp sync mode needs a timestamp column")
+        if mode == "change_tracking" and dialect != "mssql":
+            raise ValueError("Change tracking is only available on SQL Server")
+        self.conn = conn
+        self.table = table
+        self.dialect = dialect
+        self.key_column = key_column
+        self.mode = mode
+        self.timestamp_column = timestamp_column
+        self.batch_rows = batch_rows
+        self.max_batches = max_batches
+        self.fetch = fetch
+        self.window_rows = None
+        self.high_water = None
+        self._resume = None
+        self.last_sync = None
+        self.last_result = None
+
+    def _quote(self, column):
+        return quote_identifier(column, self.dialect)
+
+    def _scalar(self, sql, params=None):
+        return run_query(self.conn, sql, params).iloc[0, 0]
+
+    # Function to load the latest `rows` rows by key and set the high-water mark from them.
+    # `fetch` overrides the sync's fetch function for this load (e.g. to show progress).
+    def initial_load(self, rows, fetch=None):
+        fetch = fetch or self.fetch
+        self.window_rows = rows
+        version = None
+        if self.mode == "change_tracking":
+            # Read before loading, so changes made during the load are fetched by the next sync
+            version = int(self._scalar("SELECT CHANGE_TRACKING_CURRENT_VERSION() AS version"))
+        key = self._quote(self.key_column)
+        df = fetch(self.conn, build_select(self.dialect, self.table, "*", order_by=f"{key} DESC", limit=rows))
+        df = df.sort_values(self.key_column, kind="stable", ignore_index=True)
+        if self.mode == "key":
+            self.high_water = _param(df[self.key_column].max()) if len(df) else None
+        elif self.mode == "timestamp":
+            stamped = df.dropna(subset=[self.timestamp_column])
+            if len(stamped):
+                last = stamped.sort_values([self.timestamp_column, self.key_column]).iloc[-1]
+                self.high_water = (_param(last[self.timestamp_column]), _param(last[self.key_column]))
+        else:
+            self.high_water = version
+        self.last_sync = time.time()
+        return df
+
+    # Function to fetch the next keyset page of new rows (key mode) or changed rows (timestamp mode)
+    def _next_batch(self):
+        key, placeholder = self._quote(self.key_column), PLACEHOLDERS[self.dialect]
+        if self.mode == "key":
+            where, params = ([f"{key} > {placeholder}"], [self.high_water]) if self.high_water is not None else ([], [])
+            return self.fetch(self.conn, build_select(self.dialect, self.table, "*", where, order_by=key, limit=self.batch_rows), params)
+        stamp = self._quote(self.timestamp_column)
+        if self.high_water is None:
+            where, params = [f"{stamp} IS NOT NULL"], []
+        else:
+            where = [f"({stamp} > {placeholder} OR ({stamp} = {placeholder} AND {key} > {placeholder}))"]
+            params = [self.high_water[0], self.high_water[0], self.high_water[1]]
+        return self.fetch(self.conn, build_select(
+            self.dialect, self.table, "*", where, order_by=f"{stamp}, {key}", limit=self.batch_rows
+        ), params)
+
+    # Function to fetch the next page of SQL Server change-tracking rows up to `to_version`
+    def _next_change_batch(self, to_version, after_key):
+        table, key = quote_table(self.table, self.dialect), self._quote(self.key_column)
+        where = "ct.SYS_CHANGE_VERSION <= ?" + (f" AND ct.{key} > ?" if after_key is not None else "")
+        params = [self.high_water, to_version] + ([after_key] if after_key is not None else [])
+        return self.fetch(self.conn, (
+            f"SELECT TOP {int(self.batch_rows)} ct.SYS_CHANGE_OPERATION AS {self._quote(_OPERATION)}, "
+            f"ct.{key} AS {self._quote(_CHANGED_KEY)}, t.* FROM CHANGETABLE(CHANGES {table}, ?) AS ct "
+            f"LEFT JOIN {table} AS t ON t.{key} = ct.{key} WHERE {where} ORDER BY ct.{key}"
+        ), params)
+
+    # Function to apply the new or changed rows of the server to `df`. Returns the updated
+    # frame (a new object, or `df` itself when nothing changed) and a SyncResult.
+    def sync(self, df):
+        started = time.perf_counter()
+        # Set before fetching, so a failing server is retried after the interval, not on every call
+        self.last_sync = time.time()
+        result = SyncResult()
+        upserts, deleted_keys = [], []
+        if self.mode == "change_tracking":
+            min_version = self._scalar("SELECT CHANGE_TRACKING_MIN_VALID_VERSION(OBJECT_ID(?)) AS version", [self.table])
+            if min_version is None or pd.isna(min_version):
+                raise SyncResetRequired(f"Change tracking is not enabled on {self.table}")
+            if self.high_water < int(min_version):
+                raise SyncResetRequired(f"Changes of {self.table} since version {self.high_water} are no longer kept")
+            # A sync stopped by max_batches resumes inside the same version range
+            to_version, after_key = self._resume or (int(self._scalar("SELECT CHANGE_TRACKING_CURRENT_VERSION() AS version")), None)
+        while self.max_batches is None or result.batches < self.max_batches:
+            if self.mode == "change_tracking":
+                batch = self._next_change_batch(to_version, after_key)
+            else:
+                batch = self._next_batch()
+            result.batches += 1
+            if batch.empty:
+                break
+            if self.mode == "change_tracking":
+                after_key = _param(batch[_CHANGED_KEY].iloc[-1])
+                # Rows deleted after the change was recorded come back without their columns
+                deletes = (batch[_OPERATION] == "D") | batch[self.key_column].isna()
+                deleted_keys.extend(batch.loc[deletes, _CHANGED_KEY].tolist())
+                upserts.append(batch.loc[~deletes].drop(columns=[_OPERATION, _CHANGED_KEY]))
+            else:
+                last = batch.iloc[-1]
+                if self.mode == "key":
+                    self.high_water = _param(last[self.key_column])
+                else:
+                    self.high_water = (_param(last[self.timestamp_column]), _param(last[self.key_column]))
+                upserts.append(batch)
+            if len(batch) < self.batch_rows:
+                break
+        else:
+            result.complete = False
+            logger.info("Sync of %s stopped after %d batches; the next sync continues from there", self.table, result.batches)
+        if self.mode == "change_tracking":
+            self._resume = None if result.complete else (to_version, after_key)
+            if result.complete:
+                self.high_water = to_version
+
+        changes = pd.concat(upserts, ignore_index=True) if upserts else df.iloc[0:0]
+        changes = changes.drop_duplicates(subset=[self.key_column], keep="last")
+        existing = df[self.key_column].isin(changes[self.key_column]) if len(changes) else None
+        result.updated = int(existing.sum()) if existing is not None else 0
+        result.inserted = len(changes) - result.updated
+        removed = df[self.key_column].isin(deleted_keys) if deleted_keys else None
+        result.deleted = int(removed.sum()) if removed is not None else 0
+
+        if not result.changed:
+            updated_df = df
+        elif not result.updated and not result.deleted:
+            updated_df = pd.concat([df, changes], ignore_index=True)
+            result.appended = changes
+        else:
+            keep = ~df[self.key_column].isin(changes[self.key_column])
+            if removed is not None:
+                keep &= ~removed
+            updated_df = pd.concat([df[keep], changes], ignore_index=True)
+        if self.window_rows and len(updated_df) > self.window_rows:
+            # Keep the latest `window_rows` rows by key, in their current order
+            latest = updated_df[self.key_column].sort_values(kind="stable", na_position="first").index[-self.window_rows:]
+            result.trimmed = len(updated_df) - self.window_rows
+            updated_df = updated_df[updated_df.index.isin(latest)].reset_index(drop=True)
+        result.seconds = time.perf_counter() - started
+        self.last_result = result
+        logger.info("Synced %s: %d inserted, %d updated, %d deleted, %d trimmed in %d batches (%.2fs)", self.table,
+                    result.inserted, result.updated, result.deleted, result.trimmed, result.batches, result.seconds)
+        return updated_df, result
+
+    # Function to check whether the last sync is older than `interval_seconds`
+    def due(self, interval_seconds):
+        return self.last_sync is None or time.time() - self.last_sync >= interval_seconds
@@ -0,0 +1,106 @@
+import re
+import unicodedata
+from dataclasses import dataclass, field
+
+# Combining diacritical mark blocks, removed after NFKD decomposition
+_COMBINING_MARKS = re.compile("[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]")
+
+# Function to lowercase, accent-fold and strip punctuation from a question
+def normalize_text(text):
+    text = str(text).lower()
+    if not text.isascii():
+        text = _COMBINING_MARKS.sub("", unicodedata.normalize("NFKD", text))
+    return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+# Intents in tie-breaking order; the first five are answered by handle_special_queries
+INTENTS = ["structure", "size", "dtypes", "preview", "profile", "chart", "aggregation", "analysis"]
+SPECIAL_INTENTS = {"structure", "size", "dtypes", "preview", "profile"}
+
+# (intent, weight, accent-folded phrases). Where phrases overlap the longest one wins, so
+# "how many rows" counts for size and not for aggregation, and "first rows" for preview.
+# Grouping words weigh more than a bare "rows" or "size" so that "combien de lignes par
+# CallType" is an aggregation, and chart words outweigh both. Generic "analysis" words
+# only make a question meaningful and win when nothing else matched.
+_KEYWORDS = [
+    ("structure", 2, "column names|noms des colonnes|nom des colonnes|liste des colonnes|list of columns|structure"),
+    ("structure", 1, "colonnes|columns|champs|fields"),
+    ("size", 3, "how many rows|number of rows|row count|combien de lignes|nombre de lignes|nombre d enregistrements|"
+                "how many columns|number of columns|combien de colonnes|nombre de colonnes"),
+    ("size", 2, "taille|size|dimensions|shape"),
+    ("size", 1, "rows|lignes"),
+    ("dtypes", 3, "data types|column types|types of the columns|types des colonnes|types de donnees|type de donnees|dtypes"),
+    ("dtypes", 2, "types"),
+    ("preview", 3, "first rows|first lines|premieres lignes|apercu|preview|head|echantillon|sample"),
+    ("profile", 4, "statistiques descriptives|descriptive statistics|valeurs manquantes|missing values|profil|profile|describe"),
+    ("chart", 5, "chart|graph|graphique|plot|visualize|visualise|visualization|visualisation|courbe|histogram|"
+                 "histogramme|diagramme|pie|camembert|barplot|trace"),
+    ("aggregation", 4, "grouped by|group by|broken down by|for each|for every|pour chaque|en fonction de|en fonction des|"
+                       "en fonction du|par|per|by|selon|chaque|each"),
+    ("aggregation", 1, "how many|number of|count|combien|nombre|compte|nb|average|mean|avg|moyenne|moyen|median|mediane|"
+                       "sum|total|somme|maximum|max|highest|largest|minimum|min|lowest|smallest|plus grand|plus grande|"
+                       "plus eleve|plus elevee|plus petit|plus petite|plus faible|most common|most frequent|plus frequent|"
+                       "plus frequente|plus frequents|plus frequentes|plus courant|plus courante|top|distinct|distincts|"
+                       "distinctes|unique|uniques|differents|differentes|quantile|quantiles|percentile|percentiles|"
+                       "quartiles|deciles|distribution|repartition|breakdown|value counts|frequency|frequence|ventilation"),
+    ("analysis", 1, "montre|affiche|tableau|analyse|analyser|quelle|quel|quels|quelles|compare|comparaison|tendance|"
+                    "evolution|statistique|statistiques|correlation|pourcentage|proportion|cree|genere|show|display|"
+                    "table|analyze|what|which|trend|statistics|percentage|create|generate|most|common|type|list|"
+                    "liste|give|donne"),
+]
+# Words of greetings and acknowledgements; a question made only of these is out of scope
+_OUT_OF_SCOPE_WORDS = {
+    "hi", "hello", "hey", "bonjour", "bonsoir", "salut", "coucou", "test", "ok", "okay", "yes", "no", "oui", "non",
+    "merci", "thanks", "thank", "you", "bye", "au", "revoir",
+}
+
+# Function to index phrases by their first word, longest first, so matching a question
+# costs one dictionary lookup per word
+def _build_index(keywords):
+    index = {}
+    for intent, weight, phrases in keywords:
+        for phrase in phrases.split("|"):
+            words = tuple(phrase.split())
+            index.setdefault(words[0], []).append((len(words), words, intent, weight))
+    for entries in index.values():
+        entries.sort(key=lambda entry: -entry[0])
+    return index
+
+_KEYWORD_INDEX = _build_index(_KEYWORDS)
+
+
+# Scored result of matching a question: the winning intent (None when no keyword
+# matched), its score and the score of every intent that matched
+@dataclass
+class IntentMatch:
+    intent: str = None
+    score: int = 0
+    scores: dict = field(default_factory=dict)
+
+    @property
+    def confidence(self):
+        total = sum(self.scores.values())
+        return self.score / total if total else 0.0
+
+
+# Function to score a question against every intent in one pass over its words
+def match_intent(query):
+    words = normalize_text(query).split()
+    if not words:
+        return IntentMatch()
+    if all(word in _OUT_OF_SCOPE_WORDS for word in words):
+        return IntentMatch("out_of_scope", 1, {"out_of_scope": 1})
+    scores = {}
+    i = 0
+    while i < len(words):
+        step = 1
+        for length, phrase, intent, weight in _KEYWORD_INDEX.get(words[i], ()):
+            if length == 1 or tuple(words[i:i + length]) == phrase:
+                scores[intent] = scores.get(intent, 0) + weight
+                step = length
+                break
+        i += step
+    if not scores:
+        return IntentMatch()
+    ranked = [name for name in INTENTS if name in scores and name != "analysis"] or ["analysis"]
+    intent = max(ranked, key=lambda name: (scores[name], -INTENTS.index(name)))
+    return IntentMatch(intent, scores[intent], scores)
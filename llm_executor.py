@@ -0,0 +1,257 @@
+import importlib.util
+import logging
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from answer_cache import chart_to_png
+from code_sandbox import SandboxCancelled, SandboxLimitExceeded, cancellable
+from result_store import figure_to_png
+from tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+tracer = get_tracer()
+
+# Wording of each sandbox limit in the answer shown when generated code exceeds it
+_SANDBOX_LIMITS = {"cpu": "de temps de calcul", "wall": "de durée", "memory": "de mémoire"}
+
+_pandasai = None
+_pandasai_lock = threading.Lock()
+
+# Function to check whether PandasAI is installed without importing it
+def pandasai_available():
+    return importlib.util.find_spec("pandasai") is not None
+
+# Function to import and configure PandasAI on first use; later calls, including every
+# Streamlit rerun, get the configured module back. Returns None when it is not installed.
+def configure_pandasai():
+    global _pandasai
+    with _pandasai_lock:
+        if _pandasai is None and pandasai_available():
+            with tracer.span("pandasai.configure"):
+                import pandasai as pai
+                pai.config.verbose = False
+                pai.config.enable_cache = False
+                pai.api_key.set("****")
+            _pandasai = pai
+    return _pandasai
+
+# Function to turn a PandasAI response into a (type, value) pair for the chat. PandasAI 3
+# wraps results in response objects carrying `type` and `value` (DataFrameResponse,
+# ChartResponse, StringResponse, NumberResponse, ErrorResponse); charts come back as PNG bytes.
+def classify_response(response):
+    if response is None:
+        return "error", "Je n'ai pas pu générer une réponse pour cette question. Essayez de la reformuler."
+    kind = getattr(response, "type", None)
+    if isinstance(kind, str) and hasattr(response, "value"):
+        if kind == "error":
+            logger.warning("PandasAI could not answer: %s", getattr(response, "error", None) or response.value)
+            return "error", "PandasAI n'a pas pu générer une réponse appropriée. Essayez de reformuler votre question."
+        if kind == "chart":
+            try:
+                png = chart_to_png(response)
+            except Exception as e:
+                logger.error("Could not read the chart generated by PandasAI: %s", e)
+                png = None
+            if png is None:
+                return "error", "Le graphique généré n'a pas pu être lu. Essayez de reformuler votre question."
+            return "chart", png
+        if kind == "dataframe" and isinstance(response.value, pd.DataFrame):
+            return "dataframe", response.value
+        response = response.value
+    if hasattr(response, 'figure') or str(type(response)).find('matplotlib') != -1:
+        return "chart", response
+    if isinstance(response, pd.DataFrame):
+        return "dataframe", response
+    if isinstance(response, pd.Series):
+        return "dataframe", response.to_frame()
+    response_str = str(response)
+    if not response_str.strip():
+        return "error", "Réponse vide reçue. Essayez une question différente."
+    return "text", response_str
+
+# Function to compute a retry delay with exponential backoff and full jitter
+def backoff_delay(attempt, base_delay=1.0, max_delay=10.0):
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+# Function to execute query with retries. Waits between attempts are interruptible:
+# they end early when `cancel_event` is set, and no retry starts past `deadline`. With
+# the sandbox, setting `cancel_event` also stops the generated code, or keeps it from
+# starting once the LLM has produced it.
+def execute_pandasai_query(df, query, max_retries=3, base_delay=1.0, max_delay=10.0, cancel_event=None, deadline=None):
+    # Loaded with PandasAI, so importing it here costs nothing
+    import requests
+    cancel_event = cancel_event or threading.Event()
+    for attempt in range(max_retries):
+        try:
+            logger.debug("Attempt %d/%d to execute query: %s", attempt + 1, max_retries, query)
+            with tracer.span("llm.attempt", attempt=attempt + 1), cancellable(cancel_event):
+                response = df.chat(query)
+            logger.debug("Query executed successfully, response type: %s", type(response))
+            return classify_response(response)
+        except SandboxCancelled:
+            return "error", "Question annulée."
+        except SandboxLimitExceeded as e:
+            # Running the same code again would hit the same limit
+            logger.error("Generated code stopped on attempt %d: %s", attempt + 1, e)
+            return "error", f"L'analyse a dépassé la limite {_SANDBOX_LIMITS[e.limit]} autorisée. Essayez une question plus simple."
+        except requests.exceptions.ConnectionError as e:
+            logger.error("Connection error on attempt %d: %s", attempt + 1, e)
+            failure = ("error", "Problème de connexion avec PandasAI. Vérifiez votre connexion Internet.")
+        except Exception as e:
+            error_msg = str(e).lower()
+            logger.error("Error executing query on attempt %d: %s", attempt + 1, e)
+            if "invalid output" in error_msg or "incompatible type" in error_msg:
+                return "error", f"PandasAI n'a pas pu générer une réponse appropriée. Essayez de reformuler votre question."
+            if "connection" in error_msg or "timeout" in error_msg:
+                failure = ("error", "Problème de connexion avec PandasAI. Vérifiez votre connexion Internet.")
+            else:
+                failure = ("error", f"Erreur lors du traitement : {str(e)}")
+        if attempt == max_retries - 1:
+            return failure
+        delay = backoff_delay(attempt, base_delay, max_delay)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return failure
+        logger.info("Retrying after %.2f seconds...", delay)
+        if cancel_event.wait(delay):
+            return "error", "Question annulée."
+    return "error", "Je n'ai pas pu générer une réponse pour cette question. Essayez de la reformuler."
+
+
+# One chat question running in the background. `status` moves from "queued" to
+# "running" and ends as "done", "cancelled" or "timeout"; `result` is a (type, value) pair.
+class LLMJob:
+    def __init__(self, question, assistant, assistant_factory=None, on_result=None, timeout_seconds=120, context=None):
+        self.id = uuid.uuid4().hex
+        self.question = question
+        self.assistant = assistant
+        self.assistant_factory = assistant_factory
+        self.on_result = on_result
+        self.context = context or {}
+        self.status = "queued"
+        self.result = None
+        self.submitted_at = time.monotonic()
+        self.submitted_ns = time.time_ns()
+        self.started_at = None
+        self.finished_at = None
+        self.deadline = self.submitted_at + timeout_seconds
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    @property
+    def finished(self):
+        return self.status in ("done", "cancelled", "timeout")
+
+    def elapsed(self):
+        return (self.finished_at or time.monotonic()) - self.submitted_at
+
+
+# Process-wide pool of worker threads running PandasAI queries off the script thread.
+# PandasAI agents keep per-conversation state, so a job leases the session's assistant
+# when it is idle and builds its own from `assistant_factory` when it is busy.
+class LLMExecutor:
+    def __init__(self, max_workers=4, max_retries=3, base_delay=1.0, max_delay=10.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+        self._leased = set()
+        self._lock = threading.Lock()
+
+    def submit(self, job):
+        job.future = self._pool.submit(self._run, job)
+        return job
+
+    # Function to stop taking jobs; queued jobs are dropped, running ones finish their attempt
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def cancel(self, job):
+        with self._lock:
+            if job.finished:
+                return
+            job.cancel_event.set()
+            if job.future is not None:
+                job.future.cancel()
+            self._finish(job, "cancelled", ("error", "Question annulée."))
+
+    # Function to mark jobs past their deadline as timed out; the worker's late result is dropped.
+    # The job's cancel event stops sandboxed code and the waits between retries, but an LLM
+    # request already sent runs to completion in its worker thread (the HTTP call cannot be
+    # interrupted), and without the sandbox so does the generated code.
+    def check_timeouts(self, jobs):
+        now = time.monotonic()
+        for job in jobs:
+            if not job.finished and now > job.deadline:
+                with self._lock:
+                    if job.finished:
+                        continue
+                    job.cancel_event.set()
+                    self._finish(job, "timeout", ("error", "La requête a pris trop de temps. Essayez une question plus simple."))
+                logger.warning("LLM job %s timed out after %.0fs", job.id, job.elapsed())
+
+    def _finish(self, job, status, result):
+        job.status = status
+        job.result = result
+        job.finished_at = time.monotonic()
+
+    def _lease(self, job):
+        with self._lock:
+            if job.assistant is not None and id(job.assistant) not in self._leased:
+                self._leased.add(id(job.assistant))
+                return job.assistant, True
+        if job.assistant_factory is None:
+            return None, False
+        with tracer.span("llm.build_assistant"):
+            return job.assistant_factory(), False
+
+    def _run(self, job):
+        if job.cancel_event.is_set():
+            return
+        job.status = "running"
+        job.started_at = time.monotonic()
+        parent = job.context.get("span")
+        tracer.record("llm.queue", job.submitted_ns, time.time_ns(), parent=parent)
+        with tracer.span("llm.job", parent=parent) as span:
+            result = self._execute(job, span)
+        with self._lock:
+            if job.finished:
+                return
+            self._finish(job, "done", result)
+        logger.debug("LLM job %s finished in %.2fs", job.id, job.elapsed())
+
+    def _execute(self, job, span):
+        assistant, leased = self._lease(job)
+        span.set("leased", leased)
+        try:
+            if assistant is None:
+                result = ("error", "L'assistant IA n'a pas pu être initialisé pour ces données.")
+            else:
+                result = execute_pandasai_query(
+                    assistant, job.question, max_retries=self.max_retries, base_delay=self.base_delay,
+                    max_delay=self.max_delay, cancel_event=job.cancel_event, deadline=job.deadline
+                )
+        except Exception as e:
+            logger.error("LLM job %s failed: %s", job.id, e)
+            result = ("error", f"Erreur lors du traitement : {str(e)}")
+        finally:
+            if leased:
+                with self._lock:
+                    self._leased.discard(id(assistant))
+        if result[0] == "chart":
+            # Rasterize in the worker so the figure is closed before anyone else touches it
+            with tracer.span("llm.render_chart"):
+                png = figure_to_png(result[1])
+            if png is not None:
+                result = ("chart", png)
+        span.set("result_type", result[0])
+        if job.on_result is not None and result[0] != "error" and not job.finished:
+            try:
+                job.on_result(job, result)
+            except Exception as e:
+                logger.error("LLM job %s result callback failed: %s", job.id, e)
+        return result
@@ -0,0 +1,144 @@
+import hashlib
+import logging
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+# Function to decide how each column of a sample should be stored
+def infer_column_plan(sample, category_max_ratio=0.5):
+    plan = {}
+    for col in sample.columns:
+        series = sample[col]
+        if series.dtype != object:
+            continue
+        values = series.dropna().astype(str)
+        if values.empty:
+            continue
+        if pd.to_numeric(values, errors="coerce").notna().all():
+            continue
+        date_format = guess_datetime_format(values.iloc[0])
+        if date_format:
+            parsed = pd.to_datetime(values, format=date_format, errors="coerce")
+            if parsed.notna().mean() >= 0.95:
+                plan[col] = ("datetime", date_format)
+                continue
+        if values.nunique() <= max(1, int(len(values) * category_max_ratio)):
+            plan[col] = ("category", None)
+    return plan
+
+# Function to convert the string columns of one chunk according to the plan
+def _apply_plan(chunk, plan):
+    for col, (kind, date_format) in plan.items():
+        if col not in chunk.columns:
+            continue
+        if kind == "datetime":
+            chunk[col] = pd.to_datetime(chunk[col], format=date_format, errors="coerce")
+        elif kind == "category":
+            chunk[col] = chunk[col].astype("category")
+    return chunk
+
+# Function to downcast a numeric column to the smallest lossless dtype. Floats become
+# float32 only when every value survives the round trip, unless `lossy_floats` (the
+# AI_INSIGHT_CSV_LOSSY_FLOAT32 setting by default) accepts a relative error of 1e-6.
+def downcast_numeric(series, lossy_floats=None):
+    lossy_floats = settings.CSV_LOSSY_FLOAT32 if lossy_floats is None else lossy_floats
+    if pd.api.types.is_bool_dtype(series) or not pd.api.types.is_numeric_dtype(series):
+        return series
+    if pd.api.types.is_integer_dtype(series):
+        return pd.to_numeric(series, downcast="integer")
+    non_null = series.dropna()
+    if non_null.empty:
+        return series
+    if (non_null % 1 == 0).all() and non_null.abs().max() < 2 ** 53:
+        return pd.to_numeric(series.astype("Int64"), downcast="integer")
+    as_float32 = series.astype(np.float32)
+    original, round_trip = series.to_numpy(dtype=np.float64), as_float32.to_numpy(dtype=np.float64)
+    if np.array_equal(round_trip, original, equal_nan=True):
+        return as_float32
+    if lossy_floats and np.allclose(round_trip, original, rtol=1e-6, atol=0, equal_nan=True):
+        return as_float32
+    return series
+
+# Function to tag the loader settings that shape a loaded frame (row and memory caps,
+# sampling, float narrowing), so cached frames are not reused under other settings
+def load_signature():
+    values = (settings.CSV_CHUNK_ROWS, settings.CSV_SAMPLE_ROWS, settings.CSV_MAX_ROWS,
+              settings.CSV_MAX_MEMORY_BYTES, settings.CSV_LOSSY_FLOAT32)
+    return hashlib.sha256(repr(values).encode()).hexdigest()[:12]
+
+# Function to compact a DataFrame loaded in one piece (dates, categories, numeric downcast)
+def compact_frame(df, sample_rows=None):
+    sample_rows = sample_rows or settings.CSV_SAMPLE_ROWS
+    df = _apply_plan(df, infer_column_plan(df.head(sample_rows)))
+    for col in df.columns:
+        df[col] = downcast_numeric(df[col])
+    return df
+
+# Function to stream a CSV into a compact DataFrame with bounded memory; a ProfileBuilder
+# passed as `profile_builder` is fed each chunk, so the profile costs no extra pass
+def load_csv(source, chunk_rows=None, sample_rows=None, max_rows=None, max_memory_bytes=None, progress_callback=None, profile_builder=None):
+    chunk_rows = chunk_rows or settings.CSV_CHUNK_ROWS
+    sample_rows = sample_rows or settings.CSV_SAMPLE_ROWS
+    max_rows = settings.CSV_MAX_ROWS if max_rows is None else max_rows
+    max_memory_bytes = settings.CSV_MAX_MEMORY_BYTES if max_memory_bytes is None else max_memory_bytes
+    total_bytes = getattr(source, "size", None)
+
+    sample = pd.read_csv(source, nrows=sample_rows)
+    source.seek(0)
+    plan = infer_column_plan(sample)
+    logger.debug("CSV column plan: %s", plan)
+
+    chunks, rows, raw_bytes, compact_bytes, truncated = [], 0, 0, 0, False
+    reader = pd.read_csv(source, chunksize=chunk_rows, dtype={col: str for col in plan})
+    for chunk in reader:
+        if max_rows and rows + len(chunk) > max_rows:
+            chunk = chunk.iloc[:max_rows - rows]
+            truncated = True
+        raw_bytes += int(chunk.memory_usage(deep=True).sum())
+        chunk = _apply_plan(chunk, plan)
+        compact_bytes += int(chunk.memory_usage(deep=True).sum())
+        if profile_builder is not None:
+            profile_builder.update(chunk)
+        chunks.append(chunk)
+        rows += len(chunk)
+        if progress_callback and total_bytes:
+            progress_callback(min(source.tell() / total_bytes, 1.0))
+        if max_memory_bytes and compact_bytes > max_memory_bytes:
+            truncated = True
+        if truncated:
+            break
+    reader.close()
+
+    if not chunks:
+        df = sample.iloc[0:0]
+    else:
+        for col, (kind, _) in plan.items():
+            if kind == "category":
+                categories = chunks[0][col].cat.categories
+                for chunk in chunks[1:]:
+                    categories = categories.union(chunk[col].cat.categories)
+                for chunk in chunks:
+                    chunk[col] = chunk[col].cat.set_categories(categories)
+        df = pd.concat(chunks, ignore_index=True)
+        chunks.clear()
+    for col in df.columns:
+        df[col] = downcast_numeric(df[col])
+
+    memory_bytes = int(df.memory_usage(deep=True).sum())
+    if progress_callback:
+        progress_callback(1.0)
+    report = {
+        "rows": len(df),
+        "truncated": truncated,
+        "raw_memory_bytes": raw_bytes,
+        "memory_bytes": memory_bytes,
+        "saved_bytes": max(raw_bytes - memory_bytes, 0),
+        "conversions": {col: kind for col, (kind, _) in plan.items()},
+    }
+    logger.debug("CSV loaded: %s", report)
+    return df, report
@@ -0,0 +1,103 @@
+import atexit
+import logging
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+_LEVELS = {"CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG", "NOTSET"}
+_FORMAT = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+
+_listener = None
+_lock = threading.Lock()
+
+# Function to parse "pandasai=WARNING,query_engine=DEBUG" into {logger name: level}
+def parse_module_levels(text):
+    levels = {}
+    for item in (text or "").split(","):
+        name, _, level = item.partition("=")
+        name, level = name.strip(), level.strip().upper()
+        if name and level in _LEVELS:
+            levels[name] = level
+    return levels
+
+
+# Rate limit for DEBUG records: each call site (logger and message template) may emit
+# `per_minute` records per minute; the rest are dropped before they reach the queue and
+# counted, and the next record let through from that site reports how many were dropped.
+class DebugSampler(logging.Filter):
+    def __init__(self, per_minute=60):
+        super().__init__()
+        self.per_minute = per_minute
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.per_minute <= 0:
+            return True
+        key = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            started, emitted, dropped = self._windows.get(key, (now, 0, 0))
+            if now - started >= 60:
+                started, emitted = now, 0
+            if emitted >= self.per_minute:
+                self._windows[key] = (started, emitted, dropped + 1)
+                return False
+            self._windows[key] = (started, emitted + 1, 0)
+        if dropped:
+            record.msg = f"{record.msg} [{dropped} similar debug messages suppressed]"
+        return True
+
+
+# Queue handler that leaves formatting to the writer thread and never blocks the caller:
+# when the queue is full the record is dropped and counted instead.
+class NonBlockingQueueHandler(QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Only exception info is rendered here, since the traceback will be gone later
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# Function to route all logging through a bounded queue drained by a background writer
+# thread. Safe to call on every Streamlit rerun: only the first call configures logging.
+def configure_logging(level="INFO", module_levels=None, log_file=None, debug_per_minute=60, queue_size=10_000):
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return _listener
+        log_queue = queue.Queue(maxsize=queue_size)
+        formatter = logging.Formatter(_FORMAT)
+        handlers = [logging.StreamHandler(sys.stderr)]
+        if log_file:
+            handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        queue_handler = NonBlockingQueueHandler(log_queue)
+        queue_handler.addFilter(DebugSampler(debug_per_minute))
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(level.upper() if isinstance(level, str) else level)
+        for name, module_level in (module_levels or {}).items():
+            logging.getLogger(name).setLevel(module_level)
+
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+        return _listener
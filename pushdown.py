@@ -0,0 +1,287 @@
+import logging
+import math
+
+import pandas as pd
+
+import settings
+from connection_pool import ConnectionPool
+from db_fetch import fetch_frame
+from query_engine import (
+    AGGREGATION_LABELS, AGGREGATIONS, execute_intent, filter_note, format_value, intent_columns, parse_query_intent,
+    quantile_label
+)
+from sketches import QUANTILE_LEVELS
+
+logger = logging.getLogger(__name__)
+
+# Parameter placeholder of each driver: PyMySQL (through SQLAlchemy) and pyodbc
+PLACEHOLDERS = {"mysql": "%s", "mssql": "?"}
+
+# Function to quote an identifier for MySQL (`name`) or SQL Server ([name])
+def quote_identifier(name, dialect):
+    if dialect == "mysql":
+        return "`" + str(name).replace("`", "``") + "`"
+    return "[" + str(name).replace("]", "]]") + "]"
+
+# Function to quote a possibly schema-qualified table name ("dbo.Calls" -> [dbo].[Calls])
+def quote_table(table, dialect):
+    table = str(table).strip()
+    if table[:1] in ("`", "[", '"'):
+        return table
+    return ".".join(quote_identifier(part, dialect) for part in table.split("."))
+
+# Function to run a query on a pooled connection, a SQLAlchemy engine or a DB-API connection.
+# Parameters go as a tuple: pandas hands a plain SQL string on a SQLAlchemy connection to
+# exec_driver_sql, which rejects a list of scalars.
+def run_query(conn, sql, params=None):
+    logger.debug("Pushdown query: %s %s", sql, params or "")
+    params = tuple(params) if params else None
+    if isinstance(conn, ConnectionPool):
+        with conn.connection() as pooled:
+            return pd.read_sql(sql, pooled, params=params)
+    return pd.read_sql(sql, conn, params=params)
+
+# Function to assemble a SELECT, placing the row limit where each dialect expects it
+def build_select(dialect, table, columns, where=None, group_by=None, order_by=None, limit=None):
+    top = f"TOP {int(limit)} " if limit and dialect == "mssql" else ""
+    sql = f"SELECT {top}{columns} FROM {quote_table(table, dialect)}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    if group_by:
+        sql += f" GROUP BY {group_by}"
+    if order_by:
+        sql += f" ORDER BY {order_by}"
+    if limit and dialect == "mysql":
+        sql += f" LIMIT {int(limit)}"
+    return sql
+
+# Function to count the rows of a table on the server
+def count_rows(conn, table, dialect):
+    return int(run_query(conn, build_select(dialect, table, "COUNT(*) AS row_count")).iloc[0, 0])
+
+# Function to load the first or a random sample of rows of a table for exploratory work.
+# SQL Server tries TABLESAMPLE (page-level, cheap) and falls back to ORDER BY NEWID().
+# `fetch(conn, sql)` loads the rows; db_fetch.fetch_frame streams them in chunks.
+def sample_table(conn, table, dialect, rows, random=False, total_rows=None, fetch=run_query):
+    if not random:
+        return fetch(conn, build_select(dialect, table, "*", limit=rows))
+    if dialect == "mysql":
+        return fetch(conn, build_select(dialect, table, "*", order_by="RAND()", limit=rows))
+    if total_rows and total_rows > rows * 10:
+        # Oversample pages since TABLESAMPLE returns a variable number of rows
+        percent = min(100, math.ceil(rows * 200 / total_rows))
+        try:
+            df = fetch(conn, f"SELECT TOP {int(rows)} * FROM {quote_table(table, dialect)} TABLESAMPLE ({percent} PERCENT)")
+            if len(df) >= rows * 0.9:
+                return df
+        except Exception as e:
+            logger.debug("TABLESAMPLE not available on %s: %s", table, e)
+    return fetch(conn, build_select(dialect, table, "*", order_by="NEWID()", limit=rows))
+
+# Function to convert DECIMAL results from the driver to numeric columns
+def _numeric_columns(df, columns):
+    for column in columns:
+        try:
+            df[column] = pd.to_numeric(df[column])
+        except (ValueError, TypeError):
+            pass
+    return df
+
+# Function to compute quantiles of `column` on the server, one row per group (or a single
+# row) with a pN column per level, interpolated linearly as pandas does. SQL Server has
+# PERCENTILE_CONT; MySQL 8 ranks the values with window functions and interpolates
+# between the two neighbouring ranks.
+def _server_quantiles(conn, table, dialect, column, levels, where, params, group_by=None):
+    quote = lambda name: quote_identifier(name, dialect)
+    value = quote(column)
+    group = quote(group_by) if group_by is not None else None
+    where = where + ([f"{group} IS NOT NULL"] if group else [])
+    if dialect == "mssql":
+        partition = f"PARTITION BY {group}" if group else ""
+        columns = ([group] if group else []) + [
+            f"PERCENTILE_CONT({level!r}) WITHIN GROUP (ORDER BY CAST({value} AS FLOAT)) OVER ({partition}) AS {quote(quantile_label(level))}"
+            for level in levels
+        ]
+        sql = build_select(dialect, table, "DISTINCT " + ", ".join(columns), where)
+    else:
+        partition = f"PARTITION BY {group} " if group else ""
+        ranked = build_select(dialect, table, ", ".join(([group] if group else []) + [
+            f"{value} AS v", f"ROW_NUMBER() OVER ({partition}ORDER BY {value}) AS rn", f"COUNT(*) OVER ({partition}) AS n"
+        ]), where + [f"{value} IS NOT NULL"])
+        columns = [group] if group else []
+        for level in levels:
+            position = f"(n - 1) * {level!r}"
+            lower = f"MAX(CASE WHEN rn = FLOOR({position}) + 1 THEN v END)"
+            upper = f"MAX(CASE WHEN rn = FLOOR({position}) + 2 THEN v END)"
+            fraction = f"MAX({position} - FLOOR({position}))"
+            columns.append(f"{lower} + {fraction} * (COALESCE({upper}, {lower}) - {lower}) AS {quote(quantile_label(level))}")
+        sql = f"SELECT {', '.join(columns)} FROM ({ranked}) AS ranked" + (f" GROUP BY {group}" if group else "")
+    labels = [quantile_label(level) for level in levels]
+    result = _numeric_columns(run_query(conn, sql, params), labels)
+    if group:
+        result = result.sort_values(group_by, ignore_index=True)
+    return result
+
+# Function to describe a numeric column on the server with the statistics of pandas' describe()
+def _server_describe(conn, table, dialect, column, where, params):
+    value = quote_identifier(column, dialect)
+    stddev = "STDEV" if dialect == "mssql" else "STDDEV_SAMP"
+    as_float = f"CAST({value} AS FLOAT)" if dialect == "mssql" else value
+    aggregates = {"count": f"COUNT({value})", "mean": f"AVG({as_float})", "std": f"{stddev}({as_float})",
+                  "min": f"MIN({value})", "max": f"MAX({value})"}
+    stats = _numeric_columns(run_query(conn, build_select(
+        dialect, table, ", ".join(f"{sql} AS {quote_identifier(name, dialect)}" for name, sql in aggregates.items()), where
+    ), params), list(aggregates)).iloc[0]
+    levels = [0.25, 0.5, 0.75]
+    quartiles = _server_quantiles(conn, table, dialect, column, levels, where, params)
+    quartiles = quartiles[[quantile_label(level) for level in levels]].iloc[0].tolist() if len(quartiles) else [None] * 3
+    values = [stats["count"], stats["mean"], stats["std"], stats["min"], *quartiles, stats["max"]]
+    return pd.DataFrame({"statistic": ["count", "mean", "std", "min", "25%", "50%", "75%", "max"],
+                         column: pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").astype(float)})
+
+# Function to answer a median, quantile or numeric distribution question on the server
+def _order_statistics_on_server(intent, conn, table, dialect, where, params, note):
+    if intent.operation == "distribution":
+        return "dataframe", _server_describe(conn, table, dialect, intent.column, where, params)
+    levels = [0.5] if intent.operation == "median" else QUANTILE_LEVELS
+    result = _server_quantiles(conn, table, dialect, intent.column, levels, where, params, intent.group_by)
+    if intent.operation == "quantiles":
+        if intent.group_by is None:
+            values = result.iloc[0].tolist() if len(result) else [None] * len(levels)
+            return "dataframe", pd.DataFrame({"quantile": [quantile_label(level) for level in levels],
+                                              intent.column: pd.Series(values, dtype=float).to_numpy()})
+        return "dataframe", result
+    if intent.group_by is None:
+        value = result.iloc[0, 0] if len(result) else float("nan")
+        return "text", f"**{AGGREGATION_LABELS['median']} de {intent.column} :** {format_value(value)}{note}"
+    name = f"median_{intent.column}"
+    result = result.rename(columns={"p50": name}).sort_values(name, ascending=False, ignore_index=True)
+    return "dataframe", result.head(intent.top_n) if intent.top_n else result
+
+# Function to answer an intent from a capped random sample of its columns, fetched in
+# chunks, when the server cannot compute it; the answer is labelled approximate
+def _answer_on_sample(intent, conn, table, dialect, where, params):
+    columns = ", ".join(quote_identifier(column, dialect) for column in intent_columns(intent))
+    order_by = "RAND()" if dialect == "mysql" else "NEWID()"
+    sample, _ = fetch_frame(conn, build_select(dialect, table, columns, where, order_by=order_by,
+                                               limit=settings.PUSHDOWN_SAMPLE_ROWS), params)
+    kind, result = execute_intent(intent, sample)
+    note = f"\n\n_≈ Valeur approchée, calculée sur un échantillon aléatoire de {len(sample):,} lignes._"
+    if kind == "dataframe":
+        result.attrs["note"] = note
+        return kind, result
+    return kind, result + note
+
+# Function to run a QueryIntent on the database server, returning only the result set.
+# `sample` provides the column dtypes. Medians, quantiles and numeric descriptions are
+# computed on the server too; where the server cannot (MySQL before 8.0) they fall back
+# to a capped random sample and are labelled approximate.
+def execute_intent_on_server(intent, conn, table, dialect, sample):
+    quote = lambda column: quote_identifier(column, dialect)
+    where = [f"{quote(column)} = {PLACEHOLDERS[dialect]}" for column, _ in intent.filters]
+    params = [value.item() if hasattr(value, "item") else value for _, value in intent.filters]
+    note = filter_note(intent.filters)
+    numeric = (intent.column is not None and pd.api.types.is_numeric_dtype(sample[intent.column])
+               and not pd.api.types.is_bool_dtype(sample[intent.column]))
+
+    if intent.operation in ("median", "quantiles") or (intent.operation == "distribution" and numeric):
+        try:
+            return _order_statistics_on_server(intent, conn, table, dialect, where, params, note)
+        except Exception as e:
+            logger.info("Server cannot compute the %s of %s (%s); using a sample", intent.operation, intent.column, e)
+            return _answer_on_sample(intent, conn, table, dialect, where, params)
+
+    if intent.operation in AGGREGATIONS:
+        column = quote(intent.column)
+        if intent.operation == "mean" and dialect == "mssql":
+            # AVG over an INT column is integer division in SQL Server
+            column = f"CAST({column} AS FLOAT)"
+        function = {"sum": "SUM", "mean": "AVG", "min": "MIN", "max": "MAX"}[intent.operation]
+        if intent.group_by is None:
+            result = run_query(conn, build_select(dialect, table, f"{function}({column}) AS value", where), params)
+            value = _numeric_columns(result, ["value"]).iloc[0, 0]
+            return "text", f"**{AGGREGATION_LABELS[intent.operation]} de {intent.column} :** {format_value(value)}{note}"
+        name = f"{intent.operation}_{intent.column}"
+        group = quote(intent.group_by)
+        result = run_query(conn, build_select(
+            dialect, table, f"{group}, {function}({column}) AS {quote(name)}",
+            where + [f"{group} IS NOT NULL"], group_by=group,
+            order_by=f"{quote(name)} {'ASC' if intent.operation == 'min' else 'DESC'}", limit=intent.top_n
+        ), params)
+        return "dataframe", _numeric_columns(result, [name])
+
+    if intent.operation == "count":
+        if intent.group_by is not None:
+            group = quote(intent.group_by)
+            return "dataframe", run_query(conn, build_select(
+                dialect, table, f"{group}, COUNT(*) AS {quote('count')}",
+                where + [f"{group} IS NOT NULL"], group_by=group, order_by=f"{quote('count')} DESC"
+            ), params)
+        if intent.column is None:
+            result = run_query(conn, build_select(dialect, table, "COUNT(*) AS value", where), params)
+            return "text", f"**Nombre de lignes :** {format_value(int(result.iloc[0, 0]))}{note}"
+        if numeric or pd.api.types.is_datetime64_any_dtype(sample[intent.column]):
+            result = run_query(conn, build_select(dialect, table, f"COUNT({quote(intent.column)}) AS value", where), params)
+            return "text", f"**Nombre de valeurs renseignées pour {intent.column} :** {format_value(int(result.iloc[0, 0]))}{note}"
+        return "dataframe", _capped_value_counts(conn, table, dialect, intent.column, where, params)
+
+    if intent.operation == "distinct":
+        column = quote(intent.column)
+        if intent.group_by is not None:
+            group, name = quote(intent.group_by), f"distinct_{intent.column}"
+            return "dataframe", run_query(conn, build_select(
+                dialect, table, f"{group}, COUNT(DISTINCT {column}) AS {quote(name)}",
+                where + [f"{group} IS NOT NULL"], group_by=group, order_by=f"{quote(name)} DESC"
+            ), params)
+        result = run_query(conn, build_select(dialect, table, f"COUNT(DISTINCT {column}) AS value", where), params)
+        return "text", f"**Nombre de valeurs distinctes de {intent.column} :** {format_value(int(result.iloc[0, 0]))}{note}"
+
+    if intent.operation == "top" and numeric:
+        return "dataframe", run_query(conn, build_select(
+            dialect, table, "*", where + [f"{quote(intent.column)} IS NOT NULL"],
+            order_by=f"{quote(intent.column)} DESC", limit=intent.top_n
+        ), params)
+
+    if intent.top_n:
+        counts = _value_counts(conn, table, dialect, intent.column, where, params, intent.top_n)
+    else:
+        counts = _capped_value_counts(conn, table, dialect, intent.column, where, params)
+    if intent.operation == "top" and intent.top_n != 1:
+        return "dataframe", counts
+    total = int(run_query(conn, build_select(dialect, table, f"COUNT({quote(intent.column)}) AS value", where), params).iloc[0, 0])
+    if intent.operation == "top":
+        if counts.empty:
+            return "text", f"**Aucune valeur pour {intent.column}.**{note}"
+        value, count = counts.iloc[0, 0], int(counts.iloc[0, 1])
+        return "text", (f"**Valeur la plus fréquente de {intent.column} :** {value} "
+                        f"({format_value(count)} occurrences, {count / total:.1%}){note}")
+    counts["percentage"] = (counts["count"] / total * 100).round(2) if total else 0.0
+    return "dataframe", counts
+
+# Function to count the occurrences of each value of a column on the server
+def _value_counts(conn, table, dialect, column, where, params, limit=None):
+    quoted = quote_identifier(column, dialect)
+    count = quote_identifier("count", dialect)
+    return run_query(conn, build_select(
+        dialect, table, f"{quoted}, COUNT(*) AS {count}", where + [f"{quoted} IS NOT NULL"],
+        group_by=quoted, order_by=f"{count} DESC", limit=limit
+    ), params)
+
+# Function to count the values of a column on the server, keeping the PUSHDOWN_MAX_VALUES
+# most frequent so a high-cardinality column (ids, timestamps) is not pulled into the app
+def _capped_value_counts(conn, table, dialect, column, where, params):
+    limit = settings.PUSHDOWN_MAX_VALUES
+    counts = _value_counts(conn, table, dialect, column, where, params, limit + 1)
+    if len(counts) > limit:
+        counts = counts.head(limit)
+        counts.attrs["note"] = (f"\n\n_Tableau tronqué : seules les {limit:,} valeurs les plus fréquentes "
+                                f"de {column} sont affichées._")
+    return counts
+
+# Function to answer an aggregation question on the database server, using the loaded
+# sample to resolve columns and filter values; returns (None, None) when not understood
+def answer_on_server(query, conn, table, dialect, sample):
+    intent = parse_query_intent(query, sample)
+    if intent is None:
+        return None, None
+    return execute_intent_on_server(intent, conn, table, dialect, sample)
@@ -0,0 +1,459 @@
+import re
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from dataset_profile import build_profile, profile_table
+from intent_matcher import SPECIAL_INTENTS, match_intent, normalize_text
+from sketches import QUANTILE_LEVELS
+
+# Function to check if query is meaningful
+def is_meaningful_query(query):
+    query_text = query.strip()
+    if len(query_text) < 3:
+        return False, "Question trop courte"
+    match = match_intent(query_text)
+    if match.intent == "out_of_scope":
+        return False, "Veuillez poser une question sur les données"
+    if match.intent is not None or len(query_text) > 10:
+        return True, ""
+    return False, "Veuillez poser une question sur les données"
+
+# Function to handle special queries directly; `profile` (see dataset_profile) answers
+# schema and statistics questions without rescanning the frame
+def handle_special_queries(query, df, row_count=None, profile=None):
+    intent = match_intent(query).intent
+    if intent not in SPECIAL_INTENTS:
+        return None, None
+    if row_count is None:
+        row_count = profile["rows"] if profile is not None else len(df)
+    dtype = lambda col: profile["columns"][str(col)]["dtype"] if profile is not None else df[col].dtype
+    if intent == "structure":
+        columns_info = [f"{i}. **{col}** ({dtype(col)})" for i, col in enumerate(df.columns, 1)]
+        return "text", f"**Colonnes disponibles dans le dataset :**\n\n" + "\n".join(columns_info)
+    elif intent == "size":
+        return "text", f"**Informations sur le dataset :**\n\n- **Nombre de lignes :** {row_count}\n- **Nombre de colonnes :** {len(df.columns)}\n- **Taille totale :** {(row_count, len(df.columns))}"
+    elif intent == "dtypes":
+        types_info = [f"- **{col}** : {dtype(col)}" for col in df.columns]
+        return "text", f"**Types de données :**\n\n" + "\n".join(types_info)
+    elif intent == "preview":
+        return "dataframe", df.head(10)
+    return "dataframe", profile_table(profile if profile is not None else build_profile(df))
+
+# Structured form of an aggregation question the local engine can answer
+@dataclass
+class QueryIntent:
+    operation: str
+    column: str = None
+    group_by: str = None
+    top_n: int = None
+    filters: list = field(default_factory=list)
+
+# Operation phrases (accent-folded), matched in this order
+_OPERATION_PATTERNS = [
+    ("distinct", r"(?:how many |combien de |combien d |nombre de |nombre d )?(?:distincts|distinctes|distinct|uniques|unique|differents|differentes)"),
+    ("count", r"total number of|how many|number of|count of|count|combien de|combien d|combien|nombre de|nombre d|nombre|compte|nb de|nb"),
+    ("mean", r"average|mean|avg|moyenne|moyen"),
+    ("median", r"median|mediane"),
+    ("sum", r"sum of|sum|total|somme"),
+    ("max", r"maximum|max|highest|largest|biggest|greatest|(?:le |la )?plus (?:grand|grande|haut|haute|eleve|elevee)"),
+    ("min", r"minimum|min|lowest|smallest|(?:le |la )?plus (?:petit|petite|bas|basse|faible)"),
+    ("top", r"most (?:common|frequent|popular)|(?:les? |la )?plus (?:frequent|frequente|frequents|frequentes|courant|courante|courants|courantes|repandu|repandue)|top|premiers|premieres"),
+    ("quantiles", r"quantiles|quantile|percentiles|percentile|quartiles|quartile|deciles|centiles"),
+    ("distribution", r"distribution|repartition|breakdown|value counts|frequency|frequencies|frequence|frequences|ventilation"),
+]
+_OPERATION_REGEXES = [(name, re.compile(rf"\b(?:{pattern})\b")) for name, pattern in _OPERATION_PATTERNS]
+_GROUP_PATTERN = re.compile(
+    r"\b(?:grouped by|group by|broken down by|for each|for every|pour chaque|en fonction des|en fonction du|"
+    r"en fonction de|par|per|by|selon|chaque|each)\b"
+)
+_STOPWORDS = {
+    "what", "whats", "is", "are", "was", "the", "a", "an", "of", "me", "show", "give", "display", "list", "tell",
+    "which", "in", "for", "and", "with", "value", "values", "column", "field", "there", "do", "does", "have", "has",
+    "find", "get", "compute", "calculate", "please", "all", "overall", "rows", "row", "records", "record", "entries",
+    "entry", "data", "dataset", "on", "to", "it", "its", "i", "we", "want", "would", "like", "see", "can", "you",
+    "could", "s", "quel", "quelle", "quels", "quelles", "qu", "que", "est", "sont", "c", "ce", "le", "la", "les", "l",
+    "d", "de", "des", "du", "un", "une", "au", "aux", "moi", "montre", "montrez", "affiche", "affichez", "donne",
+    "donnez", "liste", "dans", "et", "avec", "valeur", "valeurs", "colonne", "champ", "il", "y", "t", "ont",
+    "calcule", "calculez", "trouve", "tous", "toutes", "tout", "lignes", "ligne", "enregistrements", "donnees",
+    "jeu", "sur", "en", "pour", "svp", "je", "veux", "voir", "peux", "tu", "vous", "global", "globale",
+}
+AGGREGATIONS = {"sum", "mean", "median", "min", "max"}
+AGGREGATION_LABELS = {"sum": "Somme", "mean": "Moyenne", "median": "Médiane", "min": "Minimum", "max": "Maximum"}
+_MAX_FILTER_CARDINALITY = 1000
+
+# Function to list the phrases that can refer to a column ("CallType" -> "call type", "calltype", ...)
+def column_aliases(column):
+    name = str(column)
+    words = re.sub(r"(?<=[a-z0-9])(?=[A-Z])", " ", name)
+    words = normalize_text(re.sub(r"[_\-.]+", " ", words))
+    aliases = {normalize_text(name), words, words.replace(" ", "")}
+    aliases |= {f"{alias}s" for alias in aliases if alias and not alias.endswith("s")}
+    return {alias for alias in aliases if alias}
+
+# Function to replace every phrase of `phrases` (alias -> label) by a placeholder token
+def _tag_phrases(text, phrases, prefix):
+    labels = []
+    for alias in sorted(phrases, key=len, reverse=True):
+        pattern = re.compile(rf"\b{re.escape(alias)}\b")
+        def _substitute(match, alias=alias):
+            labels.append(phrases[alias])
+            return f" {prefix}{len(labels) - 1} "
+        text = pattern.sub(_substitute, text)
+    return text, labels
+
+# Function to tag category values mentioned in the question as equality filters
+def _tag_filter_values(text, df):
+    phrases = {}
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            candidates = series.cat.categories
+        elif series.dtype == object:
+            candidates = series.dropna().unique()
+            if len(candidates) > _MAX_FILTER_CARDINALITY:
+                continue
+        else:
+            continue
+        for value in candidates:
+            alias = normalize_text(value)
+            if len(alias) >= 3 and alias not in phrases:
+                phrases[alias] = (col, value)
+    return _tag_phrases(text, phrases, "__val")
+
+# Function to parse a question into a QueryIntent, or None when it is not understood
+def parse_query_intent(query, df):
+    text = normalize_text(query)
+    # Questions asking for a visualisation are left to PandasAI
+    if not text or "chart" in match_intent(text).scores:
+        return None
+    text, columns = _tag_phrases(text, {alias: col for col in df.columns for alias in column_aliases(col)}, "__col")
+    for name, regex in _OPERATION_REGEXES:
+        text = regex.sub(f" __op_{name} ", text)
+    text = _GROUP_PATTERN.sub(" __group ", text)
+
+    filters = []
+    tokens = text.split()
+    if any(not token.startswith("__") and not token.isdigit() and token not in _STOPWORDS for token in tokens):
+        text, filters = _tag_filter_values(text, df)
+        tokens = text.split()
+
+    operations, targets, group_by, top_n = [], [], None, None
+    expecting_group = False
+    for token in tokens:
+        if token in _STOPWORDS:
+            continue
+        if token == "__group":
+            expecting_group = True
+            continue
+        if token.startswith("__col"):
+            column = columns[int(token[5:])]
+            if expecting_group and group_by is None:
+                group_by = column
+            elif column not in targets:
+                targets.append(column)
+            expecting_group = False
+            continue
+        if expecting_group:
+            return None
+        if token.startswith("__op_"):
+            operations.append(token[5:])
+        elif token.startswith("__val"):
+            continue
+        elif token.isdigit() and top_n is None:
+            top_n = int(token)
+        else:
+            return None
+    if expecting_group or not operations:
+        return None
+
+    filters = [filters[i] for i in sorted({int(t[5:]) for t in tokens if t.startswith("__val")})]
+    aggregations = [op for op in operations if op in AGGREGATIONS]
+    wants_top = "top" in operations
+    if top_n is not None and not wants_top and "distribution" not in operations:
+        return None
+
+    if aggregations:
+        if len(targets) != 1 or len(set(aggregations)) != 1:
+            return None
+        column = targets[0]
+        if not _supports_aggregation(df[column], aggregations[0]):
+            return None
+        if group_by is None and wants_top:
+            return None
+        return QueryIntent(aggregations[0], column, group_by, top_n if wants_top else None, filters)
+    if "quantiles" in operations:
+        if len(targets) != 1 or wants_top or not _supports_aggregation(df[targets[0]], "median"):
+            return None
+        return QueryIntent("quantiles", targets[0], group_by, None, filters)
+    if len(targets) > 1:
+        return None
+    column = targets[0] if targets else None
+    if "distinct" in operations:
+        return QueryIntent("distinct", column, group_by, None, filters) if column else None
+    if "count" in operations and not wants_top and "distribution" not in operations:
+        if group_by is not None and column is not None:
+            return None
+        return QueryIntent("count", column, group_by, None, filters)
+    if wants_top or "distribution" in operations:
+        if column is not None and group_by is not None:
+            return None
+        column = column or group_by
+        if column is None:
+            return None
+        if wants_top:
+            return QueryIntent("top", column, None, top_n or 1, filters)
+        return QueryIntent("distribution", column, None, top_n, filters)
+    return None
+
+# Function to check whether an aggregation makes sense for a column
+def _supports_aggregation(series, operation):
+    if pd.api.types.is_bool_dtype(series):
+        return operation in ("sum", "mean")
+    if pd.api.types.is_numeric_dtype(series):
+        return True
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return operation in ("min", "max", "median")
+    return False
+
+# Function to format a scalar result for display
+def format_value(value):
+    if pd.isna(value):
+        return "N/A"
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float):
+        return f"{value:,.0f}" if value.is_integer() else f"{value:,.4f}".rstrip("0")
+    if isinstance(value, int):
+        return f"{value:,}"
+    return str(value)
+
+# Function to name a quantile level as a column label (0.05 -> "p5")
+def quantile_label(level):
+    return f"p{level * 100:g}"
+
+# Function to describe the filters of an intent below an answer
+def filter_note(filters):
+    if not filters:
+        return ""
+    return "\n\n_Filtre : " + ", ".join(f"{col} = {value}" for col, value in filters) + "_"
+
+# Function to apply the equality filters of an intent
+def _apply_filters(df, filters):
+    if not filters:
+        return df
+    mask = pd.Series(True, index=df.index)
+    for column, value in filters:
+        mask &= df[column] == value
+    return df[mask]
+
+# Function to run a QueryIntent against a DataFrame with vectorized pandas operations
+def execute_intent(intent, df):
+    data = _apply_filters(df, intent.filters)
+    note = filter_note(intent.filters)
+
+    if intent.operation in AGGREGATIONS:
+        if intent.group_by is None:
+            value = getattr(data[intent.column], intent.operation)()
+            label = AGGREGATION_LABELS[intent.operation]
+            return "text", f"**{label} de {intent.column} :** {format_value(value)}{note}"
+        result = data.groupby(intent.group_by, observed=True)[intent.column].agg(intent.operation)
+        result = result.sort_values(ascending=intent.operation == "min")
+        if intent.top_n:
+            result = result.head(intent.top_n)
+        return "dataframe", result.rename(f"{intent.operation}_{intent.column}").reset_index()
+
+    if intent.operation == "quantiles":
+        if intent.group_by is None:
+            result = data[intent.column].quantile(QUANTILE_LEVELS)
+            return "dataframe", pd.DataFrame({"quantile": [quantile_label(level) for level in QUANTILE_LEVELS], intent.column: result.to_numpy()})
+        result = data.groupby(intent.group_by, observed=True)[intent.column].quantile(QUANTILE_LEVELS).unstack()
+        result.columns = [quantile_label(level) for level in result.columns]
+        return "dataframe", result.reset_index()
+
+    if intent.operation == "count":
+        if intent.group_by is not None:
+            result = data.groupby(intent.group_by, observed=True).size().sort_values(ascending=False)
+            return "dataframe", result.rename("count").reset_index()
+        if intent.column is None:
+            return "text", f"**Nombre de lignes :** {format_value(len(data))}{note}"
+        series = data[intent.column]
+        if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_any_dtype(series):
+            return "text", f"**Nombre de valeurs renseignées pour {intent.column} :** {format_value(int(series.count()))}{note}"
+        return "dataframe", series.value_counts().rename("count").reset_index()
+
+    if intent.operation == "distinct":
+        if intent.group_by is not None:
+            result = data.groupby(intent.group_by, observed=True)[intent.column].nunique().sort_values(ascending=False)
+            return "dataframe", result.rename(f"distinct_{intent.column}").reset_index()
+        count = data[intent.column].nunique()
+        return "text", f"**Nombre de valeurs distinctes de {intent.column} :** {format_value(count)}{note}"
+
+    series = data[intent.column]
+    if intent.operation == "top":
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            return "dataframe", data.nlargest(intent.top_n, intent.column)
+        counts = series.value_counts()
+        if counts.empty:
+            return "text", f"**Aucune valeur pour {intent.column}.**{note}"
+        if intent.top_n == 1:
+            share = counts.iloc[0] / counts.sum()
+            return "text", (f"**Valeur la plus fréquente de {intent.column} :** {counts.index[0]} "
+                            f"({format_value(counts.iloc[0])} occurrences, {share:.1%}){note}")
+        return "dataframe", counts.head(intent.top_n).rename("count").reset_index()
+
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return "dataframe", series.describe().to_frame(intent.column).reset_index(names="statistic")
+    counts = series.value_counts()
+    if intent.top_n:
+        counts = counts.head(intent.top_n)
+    result = counts.rename("count").reset_index()
+    result["percentage"] = (counts.values / len(series.dropna()) * 100).round(2) if len(series.dropna()) else 0.0
+    return "dataframe", result
+
+# Function to list the columns a QueryIntent reads, so callers can project before loading
+def intent_columns(intent):
+    columns = [intent.column, intent.group_by] + [column for column, _ in intent.filters]
+    return list(dict.fromkeys(column for column in columns if column is not None))
+
+# Function to answer a question locally, returning (None, None) when it cannot be parsed
+def answer_locally(query, df):
+    intent = parse_query_intent(query, df)
+    if intent is None:
+        return None, None
+    return execute_intent(intent, df)
+
+# Function to state the error bound of an approximate answer below it
+def _approx_note(sketches, method, column=None):
+    if method == "hll":
+        _, error = sketches.distinct(column)
+        if not error:
+            return f"\n\n_Compte exact : moins de {1 << sketches.precision:,} valeurs distinctes, suivies une à une._"
+        return f"\n\n_≈ Estimation HyperLogLog : ±{2 * error:.1%} (intervalle à 95 %)._"
+    if method == "kll":
+        return f"\n\n_≈ Quantiles estimés (sketch KLL) : rang exact à ±{sketches.rank_error:.1%} près (confiance 99 %)._"
+    if method == "cms":
+        bound, confidence = sketches.count_error(column)
+        return (f"\n\n_≈ Comptes estimés (count-min) : jamais sous-estimés, surestimés d'au plus "
+                f"{bound:,.0f} lignes (confiance {confidence:.0%})._")
+    return "\n\n_≈ Mode approximatif : valeur exacte, issue des statistiques calculées à l'ingestion._"
+
+# Function to attach the error note to a table answer; the chat shows it above the table
+def _with_note(frame, note):
+    frame.attrs["note"] = note
+    return frame
+
+# Function to compute one aggregation from the count/sum/min/max/KLL stats of a group
+def _group_value(stats, operation):
+    if operation == "mean":
+        return stats["sum"] / stats["count"] if stats["count"] else None
+    if operation == "median":
+        return stats["kll"].quantiles([0.5])[0]
+    return stats[operation]
+
+# Function to list the heavy hitters of a column as a count table
+def _heavy_hitter_frame(sketches, column, k):
+    hitters = sketches.heavy_hitters(column, k)
+    return _with_note(pd.DataFrame(hitters, columns=[column, "count"]), _approx_note(sketches, "cms", column))
+
+# Function to answer a QueryIntent from the dataset sketches (see sketches), stating the
+# error bound of each estimate. Returns (None, None) for what the sketches cannot answer:
+# row-level results, distinct counts per group and filters other than one grouping value.
+def execute_intent_on_sketches(intent, sketches):
+    if any(column not in sketches.columns for column in intent_columns(intent)):
+        return None, None
+    group_by, only_value = intent.group_by, None
+    if intent.filters:
+        if len(intent.filters) > 1 or group_by is not None or intent.operation not in AGGREGATIONS | {"quantiles"}:
+            return None, None
+        group_by, only_value = intent.filters[0]
+        only_value = only_value.item() if hasattr(only_value, "item") else only_value
+    note = filter_note(intent.filters)
+
+    if intent.operation in AGGREGATIONS or intent.operation == "quantiles":
+        method = "kll" if intent.operation in ("median", "quantiles") else "exact"
+        levels = [0.5] if intent.operation == "median" else QUANTILE_LEVELS
+        if group_by is None:
+            if intent.operation in ("median", "quantiles"):
+                values = sketches.quantiles(intent.column, levels)
+                if values is None:
+                    return None, None
+            else:
+                stats = sketches.columns[intent.column]
+                if stats["kind"] == "categorical" or (stats["kind"] == "datetime" and intent.operation not in ("min", "max")):
+                    return None, None
+                values = [sketches.to_value(intent.column, _group_value(stats, intent.operation))]
+            if intent.operation == "quantiles":
+                frame = pd.DataFrame({"quantile": [quantile_label(level) for level in levels], intent.column: values})
+                return "dataframe", _with_note(frame, _approx_note(sketches, method))
+            label = AGGREGATION_LABELS[intent.operation]
+            return "text", f"**{label} de {intent.column} :** ≈ {format_value(values[0])}{_approx_note(sketches, method)}"
+        per_group = sketches.group_stats(group_by, intent.column)
+        if per_group is None:
+            return None, None
+        if only_value is not None:
+            stats = per_group.get(only_value)
+            if stats is None:
+                return None, None
+            if intent.operation == "quantiles":
+                frame = pd.DataFrame({"quantile": [quantile_label(level) for level in levels], intent.column: stats["kll"].quantiles(levels)})
+                return "dataframe", _with_note(frame, note + _approx_note(sketches, method))
+            label = AGGREGATION_LABELS[intent.operation]
+            value = _group_value(stats, intent.operation)
+            return "text", f"**{label} de {intent.column} :** ≈ {format_value(value)}{note}{_approx_note(sketches, method)}"
+        if intent.operation == "quantiles":
+            result = pd.DataFrame([[value, *stats["kll"].quantiles(levels)] for value, stats in per_group.items()],
+                                  columns=[group_by] + [quantile_label(level) for level in levels])
+            return "dataframe", _with_note(result.sort_values(group_by, ignore_index=True), _approx_note(sketches, method))
+        name = f"{intent.operation}_{intent.column}"
+        result = pd.DataFrame([[value, _group_value(stats, intent.operation)] for value, stats in per_group.items()],
+                              columns=[group_by, name])
+        result = result.sort_values(name, ascending=intent.operation == "min", ignore_index=True)
+        return "dataframe", _with_note(result.head(intent.top_n) if intent.top_n else result, _approx_note(sketches, method))
+
+    if intent.operation == "count":
+        if intent.group_by is not None:
+            return "dataframe", _heavy_hitter_frame(sketches, intent.group_by, sketches.heavy_hitters_capacity)
+        if intent.column is None:
+            return "text", f"**Nombre de lignes :** {format_value(sketches.rows)}{_approx_note(sketches, 'exact')}"
+        column = sketches.columns[intent.column]
+        if column["kind"] != "categorical":
+            return "text", (f"**Nombre de valeurs renseignées pour {intent.column} :** "
+                            f"{format_value(column['count'])}{_approx_note(sketches, 'exact')}")
+        return "dataframe", _heavy_hitter_frame(sketches, intent.column, sketches.heavy_hitters_capacity)
+
+    if intent.operation == "distinct":
+        if intent.group_by is not None:
+            return None, None
+        estimate, error = sketches.distinct(intent.column)
+        return "text", (f"**Nombre de valeurs distinctes de {intent.column} :** {'≈ ' if error else ''}{format_value(round(estimate))}"
+                        f"{_approx_note(sketches, 'hll', intent.column)}")
+
+    column = sketches.columns[intent.column]
+    if intent.operation == "top":
+        if column["kind"] != "categorical":
+            return None, None
+        if intent.top_n != 1:
+            return "dataframe", _heavy_hitter_frame(sketches, intent.column, intent.top_n)
+        hitters = sketches.heavy_hitters(intent.column, 1)
+        if not hitters:
+            return "text", f"**Aucune valeur pour {intent.column}.**"
+        value, count = hitters[0]
+        return "text", (f"**Valeur la plus fréquente de {intent.column} :** {value} "
+                        f"(≈ {format_value(count)} occurrences, {count / column['count']:.1%})"
+                        f"{_approx_note(sketches, 'cms', intent.column)}")
+
+    if column["kind"] != "categorical":
+        frame = pd.DataFrame({"quantile": [quantile_label(level) for level in QUANTILE_LEVELS], intent.column: sketches.quantiles(intent.column)})
+        return "dataframe", _with_note(frame, _approx_note(sketches, "kll"))
+    result = _heavy_hitter_frame(sketches, intent.column, intent.top_n or sketches.heavy_hitters_capacity)
+    result["percentage"] = (result["count"] / column["count"] * 100).round(2) if column["count"] else 0.0
+    return "dataframe", result
+
+# Function to answer a question approximately from the dataset sketches, using `df` (the
+# loaded frame or a sample of it) to resolve columns and values; (None, None) when not answered
+def answer_approximately(query, df, sketches):
+    intent = parse_query_intent(query, df)
+    if intent is None:
+        return None, None
+    return execute_intent_on_sketches(intent, sketches)
@@ -0,0 +1,418 @@
+import heapq
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+
+from answer_cache import normalize_question
+from intent_matcher import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# (concept, accent-folded phrases) folded into one term, so the French and English
+# phrasings of a question share their terms. Where phrases overlap the longest one wins.
+_CONCEPTS = [
+    ("most_common", "most common|most frequent|most often|most popular|le plus frequent|la plus frequente|"
+                    "les plus frequents|les plus frequentes|plus frequent|plus frequente|plus frequents|plus frequentes|"
+                    "le plus courant|la plus courante|plus courant|plus courante|le plus souvent|top|mode"),
+    ("least_common", "least common|least frequent|rarest|le moins frequent|la moins frequente|moins frequent|"
+                     "moins frequente|moins frequents|moins frequentes|moins courant|moins courante|plus rare|plus rares"),
+    ("count", "how many|number of|count|combien|nombre de|nombre d|nombre|nb|compte|compter"),
+    ("distinct", "distinct|distincts|distinctes|unique|uniques|different|differents|differentes"),
+    ("mean", "average|mean|avg|moyenne|moyen|moyens|moyennes"),
+    ("median", "median|mediane"),
+    ("sum", "sum|total|somme"),
+    ("max", "maximum|max|highest|largest|longest|plus grand|plus grande|plus eleve|plus elevee|plus long|plus longue"),
+    ("min", "minimum|min|lowest|smallest|shortest|plus petit|plus petite|plus faible|plus court|plus courte"),
+    ("by", "grouped by|group by|broken down by|for each|for every|pour chaque|en fonction de|en fonction des|"
+           "en fonction du|by|per|par|selon|chaque|each"),
+    ("distribution", "distribution|repartition|breakdown|ventilation|value counts|frequency|frequence|frequences"),
+    ("percent", "percentage|percent|pourcentage|proportion|share|part"),
+    ("trend", "trend|evolution|tendance|over time|au fil du temps"),
+    ("chart", "chart|graph|graphique|plot|visualize|visualise|visualization|visualisation|diagramme|trace"),
+    ("pie", "pie|camembert"),
+    ("histogram", "histogram|histogramme"),
+    ("line", "line|courbe"),
+    ("call", "call|calls|appel|appels"),
+    ("unit", "unit|units|unite|unites"),
+    ("delay", "delay|delays|delai|delais|retard|retards"),
+    ("year", "year|years|yearly|annee|annees|annuel|annuelle"),
+    ("month", "month|months|monthly|mois|mensuel"),
+    ("day", "day|days|daily|jour|jours|journalier"),
+    ("hour", "hour|hours|hourly|heure|heures"),
+]
+# Concepts that change the answer: questions that differ in one of them, or in a number
+# ("top 5" and "top 10"), are never answered with each other's answer, only suggested
+_OPERATIONS = {"most_common", "least_common", "count", "distinct", "mean", "median", "sum", "max", "min", "by",
+               "distribution", "percent", "trend", "chart", "pie", "histogram", "line"}
+# Words that carry no meaning of their own in a question
+_STOP_WORDS = {
+    "a", "an", "the", "of", "in", "on", "for", "to", "is", "are", "was", "what", "which", "who", "show", "me", "give",
+    "list", "tell", "do", "does", "there", "with", "and", "this", "that", "data", "dataset",
+    "quel", "quelle", "quels", "quelles", "est", "sont", "le", "la", "les", "l", "de", "d", "du", "des", "un", "une",
+    "en", "dans", "pour", "sur", "et", "qui", "que", "qu", "montre", "moi", "affiche", "donne", "liste", "y", "il",
+    "au", "aux", "ce", "cette", "ces", "donnees",
+}
+# camelCase and PascalCase boundaries, so "CallType" reads as "call type"
+_CAMEL_CASE = re.compile(r"(?<=[a-z0-9])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])")
+
+# Function to index concept phrases by their first word, longest first
+def _build_concepts(concepts):
+    index = {}
+    for concept, phrases in concepts:
+        for phrase in phrases.split("|"):
+            words = tuple(phrase.split())
+            index.setdefault(words[0], []).append((len(words), words, concept))
+    for entries in index.values():
+        entries.sort(key=lambda entry: -entry[0])
+    return index
+
+_CONCEPT_INDEX = _build_concepts(_CONCEPTS)
+
+# Function to reduce a question to its terms: column names split into words, bilingual
+# phrases folded into concepts, stop words dropped and plurals trimmed
+def question_terms(question):
+    words = normalize_text(_CAMEL_CASE.sub(" ", str(question)).replace("_", " ")).split()
+    terms = []
+    i = 0
+    while i < len(words):
+        for length, phrase, concept in _CONCEPT_INDEX.get(words[i], ()):
+            if length == 1 or tuple(words[i:i + length]) == phrase:
+                terms.append(concept)
+                i += length
+                break
+        else:
+            word = words[i]
+            i += 1
+            if word in _STOP_WORDS:
+                continue
+            if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+                word = word[:-1]
+            terms.append(word)
+    return terms
+
+# Function to add the character trigrams of `text` to `features`, sharing `weight` among them
+def _add_trigrams(features, text, weight):
+    padded = f"#{text}#"
+    grams = [padded[i:i + 3] for i in range(len(padded) - 2)]
+    for gram in grams:
+        features["~" + gram] += weight / len(grams)
+
+# Function to split terms into runs of adjacent words that are not operations or numbers
+def _runs(terms):
+    runs, run = [], []
+    for term in terms:
+        if term in _OPERATIONS or term.isdigit():
+            if run:
+                runs.append(run)
+            run = []
+        else:
+            run.append(term)
+    if run:
+        runs.append(run)
+    return runs
+
+# Function to turn terms into weighted features: operations and numbers as they are, and
+# the other words as character trigrams, of each word and of each run of adjacent words
+# written without spaces, so "unit type", "type d'unité" and "UnitType" match and a typo
+# only costs a few trigrams
+def _features(terms):
+    features = Counter(term for term in terms if term in _OPERATIONS or term.isdigit())
+    for run in _runs(terms):
+        for term in run:
+            _add_trigrams(features, term, 0.5)
+        _add_trigrams(features, "".join(run), len(run) / 2)
+    return features
+
+# Function to get the keys a question is found under in the inverted index: its terms and
+# its runs of words written without spaces ("unittype" for "unit type")
+def _keys(terms):
+    return set(terms) | {"".join(run) for run in _runs(terms)}
+
+# Function to get the operations and numbers of a question, which must be identical for
+# two questions to share an answer
+def _signature(terms):
+    return frozenset(term for term in terms if term in _OPERATIONS or term.isdigit())
+
+# Function to get the other words of a question, and each pair of adjacent ones joined
+def _words(terms):
+    words, joined, previous = set(), set(), None
+    for term in terms:
+        if term in _OPERATIONS or term.isdigit():
+            previous = None
+            continue
+        words.add(term)
+        if previous is not None:
+            joined.add(previous + term)
+        previous = term
+    return words, joined
+
+# Function to check whether every word of a question is in the other, alone or joined
+# with its neighbour, so "unit type" and "UnitType" cover each other but "unit" does not
+# cover "unit type"
+def _covers(terms, other_terms):
+    (words, joined), (other_words, other_joined) = _words(terms), _words(other_terms)
+    return all(
+        word in other_words or word in other_joined or any(word in pair and pair in other_words for pair in joined)
+        for word in words
+    )
+
+
+# Past question most similar to a new one; `reuse` is True when its answer can be served
+# directly, False when it is only worth suggesting
+@dataclass
+class SimilarQuestion:
+    question: str
+    score: float
+    reuse: bool
+
+
+# In-memory TF-IDF index over the questions of one dataset. Terms point to the questions
+# using them (inverted index): a lookup scores only the `max_candidates` questions sharing
+# most of its `probes` rarest terms, which keeps it cheap as the index grows and makes it
+# approximate. The
+# unit-length vectors of the questions are computed on first use and kept until the index
+# has grown or shrunk by a tenth, so IDF weights lag slightly behind the latest questions.
+class _DatasetIndex:
+    def __init__(self):
+        self.entries = {}
+        self.ids = {}
+        self.postings = {}
+        self.document_frequency = Counter()
+        self._vectors = {}
+        self._idfs = {}
+        self._weighted_size = 0
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, key, question):
+        if key in self.ids:
+            return
+        terms = question_terms(question)
+        if not terms:
+            return
+        entry_id = self._next_id
+        self._next_id += 1
+        features = _features(terms)
+        self.entries[entry_id] = (key, question, features, terms)
+        self.ids[key] = entry_id
+        for term in _keys(terms):
+            self.postings.setdefault(term, set()).add(entry_id)
+        self.document_frequency.update(features.keys())
+        self._refresh()
+
+    def remove(self, key):
+        entry_id = self.ids.pop(key, None)
+        if entry_id is None:
+            return
+        _, _, features, terms = self.entries.pop(entry_id)
+        for feature in features:
+            self.document_frequency[feature] -= 1
+            if self.document_frequency[feature] <= 0:
+                del self.document_frequency[feature]
+        for term in _keys(terms):
+            postings = self.postings[term]
+            postings.discard(entry_id)
+            if not postings:
+                del self.postings[term]
+        self._vectors.pop(entry_id, None)
+        self._refresh()
+
+    def _refresh(self):
+        if abs(len(self.entries) - self._weighted_size) > self._weighted_size // 10:
+            self._vectors.clear()
+            self._idfs.clear()
+            self._weighted_size = len(self.entries)
+
+    def _idf(self, feature):
+        idf = self._idfs.get(feature)
+        if idf is None:
+            idf = self._idfs[feature] = math.log((1 + len(self.entries)) / (1 + self.document_frequency.get(feature, 0))) + 1.0
+        return idf
+
+    # Function to weight features by IDF and scale them to unit length
+    def _weigh(self, features):
+        weights = {feature: weight * self._idf(feature) for feature, weight in features.items()}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+        return {feature: weight / norm for feature, weight in weights.items()}
+
+    def _vector(self, entry_id):
+        vector = self._vectors.get(entry_id)
+        if vector is None:
+            vector = self._vectors[entry_id] = self._weigh(self.entries[entry_id][2])
+        return vector
+
+    # Function to find the entry closest to `terms` by cosine similarity, other than the
+    # entry of `exclude`. Candidates are the entries found under the `probes` rarest keys
+    # of the question, ranked by the rarity of the keys they share; the first
+    # `max_candidates` are scored. Returns (score, entry) or None.
+    def nearest(self, terms, probes, max_candidates, exclude=None):
+        probe_keys = sorted((key for key in _keys(terms) if key in self.postings), key=lambda key: len(self.postings[key]))
+        candidates = {}
+        for key in probe_keys[:probes]:
+            postings = self.postings[key]
+            rarity = math.log(1 + len(self.entries) / len(postings))
+            for entry_id in postings:
+                candidates[entry_id] = candidates.get(entry_id, 0.0) + rarity
+        candidates.pop(self.ids.get(exclude), None)
+        if not candidates:
+            return None
+        query = self._weigh(_features(terms))
+        best = None
+        for entry_id in heapq.nlargest(max_candidates, candidates, key=candidates.get):
+            vector = self._vector(entry_id)
+            score = min(sum(query[feature] * vector[feature] for feature in query.keys() & vector.keys()), 1.0)
+            if best is None or score > best[0]:
+                best = (score, self.entries[entry_id])
+        return best
+
+
+# Disk-backed index of the questions whose answers are in the answer cache, per dataset
+# fingerprint, to answer a rephrased question ("most common call type", "quel est le type
+# d'appel le plus fréquent", "top CallType") without calling PandasAI again. Questions are
+# stored in SQLite next to the answer cache; the TF-IDF index of a dataset is built in
+# memory from them on its first lookup. At most `max_entries` questions are kept on disk
+# and `memory_entries` in memory, the least recently used dataset indexes being dropped first.
+class QuestionIndex:
+    def __init__(self, path, max_entries=10_000, memory_entries=5_000, reuse_similarity=0.85, suggest_similarity=0.6,
+                 probes=4, max_candidates=50):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.reuse_similarity = reuse_similarity
+        self.suggest_similarity = suggest_similarity
+        self.probes = probes
+        self.max_candidates = max_candidates
+        self.lookups = 0
+        self.reuses = 0
+        self.suggestions = 0
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # An index entry lost in a crash only costs one PandasAI call: no fsync per commit
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS questions (
+                fingerprint TEXT NOT NULL,
+                key TEXT NOT NULL,
+                question TEXT NOT NULL,
+                added_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (fingerprint, key)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS questions_last_used ON questions (last_used)")
+        self._conn.commit()
+
+    # Function to get the in-memory index of a dataset, building it from disk if needed
+    def _dataset(self, fingerprint):
+        index = self._loaded.get(fingerprint)
+        if index is not None:
+            self._loaded.move_to_end(fingerprint)
+            return index
+        index = _DatasetIndex()
+        for key, question in self._conn.execute(
+            "SELECT key, question FROM questions WHERE fingerprint = ? ORDER BY last_used DESC LIMIT ?",
+            (fingerprint, self.memory_entries)
+        ):
+            index.add(key, question)
+        self._loaded[fingerprint] = index
+        loaded = sum(len(dataset) for dataset in self._loaded.values())
+        while loaded > self.memory_entries and len(self._loaded) > 1:
+            dropped, dataset = self._loaded.popitem(last=False)
+            loaded -= len(dataset)
+            logger.debug("Dropped the question index of %s from memory", dropped[:12])
+        return index
+
+    # Function to record a question whose answer was just cached for `fingerprint`
+    def add(self, fingerprint, question):
+        key = normalize_question(question)
+        if not key:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO questions (fingerprint, key, question, added_at, last_used) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (fingerprint, key) DO UPDATE SET question = excluded.question, last_used = excluded.last_used",
+                (fingerprint, key, question, now, now)
+            )
+            if fingerprint in self._loaded:
+                self._loaded[fingerprint].add(key, question)
+            self._evict_locked()
+            self._conn.commit()
+
+    # Function to find the past question closest to `question` for `fingerprint`, or None
+    # when none reaches the suggestion threshold. The question itself is skipped: when it
+    # is indexed, the answer cache has already been asked for it.
+    def nearest(self, fingerprint, question):
+        terms = question_terms(question)
+        if not terms:
+            return None
+        key = normalize_question(question)
+        with self._lock:
+            self.lookups += 1
+            best = self._dataset(fingerprint).nearest(terms, self.probes, self.max_candidates, exclude=key)
+            if best is None or best[0] < self.suggest_similarity:
+                return None
+            score, (match_key, match_question, _, match_terms) = best
+            reuse = (score >= self.reuse_similarity and _signature(terms) == _signature(match_terms)
+                     and _covers(terms, match_terms) and _covers(match_terms, terms))
+            if reuse:
+                self.reuses += 1
+                self._conn.execute("UPDATE questions SET last_used = ? WHERE fingerprint = ? AND key = ?",
+                                   (time.time(), fingerprint, match_key))
+                self._conn.commit()
+            else:
+                self.suggestions += 1
+        logger.debug("Similar question for %r: %r (%.2f, reuse=%s)", question, match_question, score, reuse)
+        return SimilarQuestion(match_question, score, reuse)
+
+    # Function to drop a question whose answer is no longer in the answer cache
+    def forget(self, fingerprint, question):
+        key = normalize_question(question)
+        with self._lock:
+            self._conn.execute("DELETE FROM questions WHERE fingerprint = ? AND key = ?", (fingerprint, key))
+            self._conn.commit()
+            if fingerprint in self._loaded:
+                self._loaded[fingerprint].remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM questions")
+            self._conn.commit()
+            self._loaded.clear()
+            self.lookups = 0
+            self.reuses = 0
+            self.suggestions = 0
+
+    def stats(self):
+        with self._lock:
+            entries, datasets = self._conn.execute("SELECT COUNT(*), COUNT(DISTINCT fingerprint) FROM questions").fetchone()
+            loaded = sum(len(dataset) for dataset in self._loaded.values())
+        return {
+            "entries": entries,
+            "datasets": datasets,
+            "loaded_entries": loaded,
+            "lookups": self.lookups,
+            "reuses": self.reuses,
+            "suggestions": self.suggestions,
+        }
+
+    def _evict_locked(self):
+        (entries,) = self._conn.execute("SELECT COUNT(*) FROM questions").fetchone()
+        if entries <= self.max_entries:
+            return
+        for fingerprint, key in self._conn.execute(
+            "SELECT fingerprint, key FROM questions ORDER BY last_used ASC LIMIT ?", (entries - self.max_entries,)
+        ).fetchall():
+            self._conn.execute("DELETE FROM questions WHERE fingerprint = ? AND key = ?", (fingerprint, key))
+            if fingerprint in self._loaded:
+                self._loaded[fingerprint].remove(key)
@@ -0,0 +1,208 @@
+import logging
+import os
+import shutil
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+
+import pandas as pd
+
+from answer_cache import chart_to_png
+
+logger = logging.getLogger(__name__)
+
+# Function to render a chart response to PNG bytes and close its matplotlib figure
+def figure_to_png(chart):
+    png = chart_to_png(chart)
+    figure = chart if hasattr(chart, "savefig") else getattr(chart, "figure", None)
+    if figure is not None and hasattr(figure, "savefig"):
+        # A figure exists, so matplotlib is already loaded
+        import matplotlib.pyplot as plt
+        plt.close(figure)
+    return png
+
+# Function to remove spill directories left behind by sessions of earlier processes
+def purge_stale_spill_dirs(root, max_age_seconds=24 * 3600):
+    if not os.path.isdir(root):
+        return 0
+    removed = 0
+    cutoff = time.time() - max_age_seconds
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    if removed:
+        logger.info("Removed %d stale result spill directories from %s", removed, root)
+    return removed
+
+
+# Lightweight reference to a result held by a ResultStore; this is what chat messages keep
+class ResultHandle:
+    __slots__ = ("id", "kind", "rows", "columns")
+
+    def __init__(self, kind, rows=None, columns=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.rows = rows
+        self.columns = columns
+
+
+# Per-session store of chat results. DataFrames above `spill_bytes` go straight to
+# Parquet with only a preview kept in memory; charts are kept as PNG bytes. When the
+# in-memory total exceeds `memory_budget_bytes`, the least recently used results are
+# spilled to disk, then their previews dropped. HTML snapshots of results (see
+# chat_history) count against the budget too and are dropped first, as they can be
+# rebuilt. The spill directory is removed when
+# the store is garbage collected, i.e. when the session ends.
+class ResultStore:
+    def __init__(self, spill_root, memory_budget_bytes=64 * 1024 * 1024, spill_bytes=4 * 1024 * 1024, preview_rows=1000):
+        self.spill_dir = os.path.join(spill_root, uuid.uuid4().hex)
+        self.memory_budget_bytes = memory_budget_bytes
+        self.spill_bytes = spill_bytes
+        self.preview_rows = preview_rows
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self.spills = 0
+        self._entries = OrderedDict()
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.spill_dir, True)
+
+    # Function to store a response and return what the chat message should keep
+    def put(self, content_type, value):
+        if content_type == "dataframe" and isinstance(value, pd.DataFrame):
+            handle = ResultHandle("dataframe", *value.shape)
+            entry = {"handle": handle, "value": value, "preview": None, "path": None, "snapshot": None}
+            entry["memory_bytes"] = int(value.memory_usage(deep=True).sum())
+            self._entries[handle.id] = entry
+            self.memory_bytes += entry["memory_bytes"]
+            if entry["memory_bytes"] > self.spill_bytes:
+                self._spill(entry)
+        elif content_type == "chart":
+            png = value if isinstance(value, bytes) else figure_to_png(value)
+            if png is None:
+                return value
+            handle = ResultHandle("chart")
+            entry = {"handle": handle, "value": png, "preview": None, "path": None, "snapshot": None, "memory_bytes": len(png)}
+            self._entries[handle.id] = entry
+            self.memory_bytes += entry["memory_bytes"]
+        else:
+            return value
+        self._enforce_budget()
+        return handle
+
+    def _write(self, entry):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        handle = entry["handle"]
+        if handle.kind == "chart":
+            path = os.path.join(self.spill_dir, f"{handle.id}.png")
+            with open(path, "wb") as f:
+                f.write(entry["value"])
+            return path
+        path = os.path.join(self.spill_dir, f"{handle.id}.parquet")
+        try:
+            entry["value"].to_parquet(path)
+        except Exception as e:
+            # Mixed-type object columns or non-string column names are not Parquet-compatible
+            logger.debug("Parquet spill failed for %s, using pickle: %s", handle.id, e)
+            path = os.path.join(self.spill_dir, f"{handle.id}.pkl")
+            entry["value"].to_pickle(path)
+        return path
+
+    # Function to move a result's data to disk, keeping a preview of DataFrames in memory
+    def _spill(self, entry):
+        entry["path"] = self._write(entry)
+        self.disk_bytes += os.path.getsize(entry["path"])
+        if entry["handle"].kind == "dataframe" and entry["handle"].rows > self.preview_rows:
+            entry["preview"] = entry["value"].head(self.preview_rows)
+        entry["value"] = None
+        self.memory_bytes -= entry["memory_bytes"]
+        entry["memory_bytes"] = int(entry["preview"].memory_usage(deep=True).sum()) if entry["preview"] is not None else 0
+        self.memory_bytes += entry["memory_bytes"]
+        self.spills += 1
+        logger.debug("Spilled result %s to %s", entry["handle"].id, entry["path"])
+
+    def _enforce_budget(self):
+        for stage in ("snapshot", "value", "preview"):
+            for entry in list(self._entries.values()):
+                if self.memory_bytes <= self.memory_budget_bytes:
+                    return
+                if stage == "snapshot" and entry["snapshot"] is not None:
+                    self.memory_bytes -= len(entry["snapshot"])
+                    entry["snapshot"] = None
+                elif stage == "value" and entry["value"] is not None:
+                    self._spill(entry)
+                elif stage == "preview" and entry["preview"] is not None:
+                    self.memory_bytes -= entry["memory_bytes"]
+                    entry["preview"] = None
+                    entry["memory_bytes"] = 0
+
+    def _entry(self, handle):
+        entry = self._entries.get(handle.id)
+        if entry is not None:
+            self._entries.move_to_end(handle.id)
+        return entry
+
+    def _read_frame(self, path, rows=None):
+        if path.endswith(".pkl"):
+            df = pd.read_pickle(path)
+            return df if rows is None else df.head(rows)
+        if rows is None:
+            return pd.read_parquet(path)
+        import pyarrow.parquet as pq
+        batches = pq.ParquetFile(path).iter_batches(batch_size=rows)
+        batch = next(batches, None)
+        return batch.to_pandas() if batch is not None else pd.read_parquet(path).head(0)
+
+    # Function to get the full DataFrame or PNG bytes of a result (None once cleared)
+    def get(self, handle):
+        entry = self._entry(handle)
+        if entry is None:
+            return None
+        if entry["value"] is not None:
+            return entry["value"]
+        if handle.kind == "chart":
+            with open(entry["path"], "rb") as f:
+                return f.read()
+        return self._read_frame(entry["path"])
+
+    # Function to get at most `rows` rows of a DataFrame result without loading all of it
+    def preview(self, handle, rows=None):
+        rows = rows or self.preview_rows
+        entry = self._entry(handle)
+        if entry is None:
+            return None
+        if entry["value"] is not None:
+            return entry["value"].head(rows)
+        if entry["preview"] is not None and rows <= len(entry["preview"]):
+            return entry["preview"].head(rows)
+        return self._read_frame(entry["path"], rows)
+
+    # Function to get the HTML snapshot of a result, rendering it with `render()` when it is
+    # not cached; "" once the result is cleared
+    def snapshot(self, handle, render):
+        entry = self._entry(handle)
+        if entry is None:
+            return ""
+        html = entry["snapshot"]
+        if html is None:
+            html = render()
+            entry["snapshot"] = html
+            self.memory_bytes += len(html)
+            self._enforce_budget()
+        return html
+
+    def clear(self):
+        self._entries.clear()
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+
+    def stats(self):
+        return {
+            "results": len(self._entries),
+            "memory_bytes": self.memory_bytes,
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "disk_bytes": self.disk_bytes,
+            "spills": self.spills,
+        }
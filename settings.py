@@ -0,0 +1,148 @@
+import os
+
+# Function to read an integer setting from the environment
+def _env_int(name, default):
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        return default
+
+# Function to read a boolean setting from the environment
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+# Base directory for on-disk caches (answers, datasets, ...)
+CACHE_DIR = os.environ.get(
+    "AI_INSIGHT_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+)
+
+# Answer cache placed in front of PandasAI
+ANSWER_CACHE_DIR = os.path.join(CACHE_DIR, "answers")
+ANSWER_CACHE_MAX_ENTRIES = _env_int("AI_INSIGHT_ANSWER_CACHE_MAX_ENTRIES", 1000)
+ANSWER_CACHE_MAX_BYTES = _env_int("AI_INSIGHT_ANSWER_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+ANSWER_CACHE_TTL_SECONDS = _env_int("AI_INSIGHT_ANSWER_CACHE_TTL_SECONDS", 7 * 24 * 3600)
+
+# Index of past questions per dataset: a rephrased question at least REUSE_PERCENT similar
+# to one already answered gets its answer; from SUGGEST_PERCENT the answer is offered
+QUESTION_INDEX_ENABLED = _env_bool("AI_INSIGHT_QUESTION_INDEX_ENABLED", True)
+QUESTION_INDEX_PATH = os.path.join(ANSWER_CACHE_DIR, "questions.sqlite")
+QUESTION_INDEX_MAX_ENTRIES = _env_int("AI_INSIGHT_QUESTION_INDEX_MAX_ENTRIES", 10_000)
+QUESTION_INDEX_MEMORY_ENTRIES = _env_int("AI_INSIGHT_QUESTION_INDEX_MEMORY_ENTRIES", 5_000)
+QUESTION_INDEX_REUSE_PERCENT = _env_int("AI_INSIGHT_QUESTION_INDEX_REUSE_PERCENT", 85)
+QUESTION_INDEX_SUGGEST_PERCENT = _env_int("AI_INSIGHT_QUESTION_INDEX_SUGGEST_PERCENT", 60)
+
+# Chunked CSV ingestion
+CSV_CHUNK_ROWS = _env_int("AI_INSIGHT_CSV_CHUNK_ROWS", 200_000)
+CSV_SAMPLE_ROWS = _env_int("AI_INSIGHT_CSV_SAMPLE_ROWS", 10_000)
+CSV_MAX_ROWS = _env_int("AI_INSIGHT_CSV_MAX_ROWS", 20_000_000)
+CSV_MAX_MEMORY_BYTES = _env_int("AI_INSIGHT_CSV_MAX_MEMORY_BYTES", 2 * 1024 * 1024 * 1024)
+# Store float columns as float32 when they are within 1e-6 of the original values
+# (halves their memory; means and sums drift slightly). Off: only exact float32 values are narrowed.
+CSV_LOSSY_FLOAT32 = _env_bool("AI_INSIGHT_CSV_LOSSY_FLOAT32", False)
+
+# Columnar cache of parsed uploads, keyed by content hash
+DATASET_CACHE_DIR = os.path.join(CACHE_DIR, "datasets")
+DATASET_CACHE_MAX_BYTES = _env_int("AI_INSIGHT_DATASET_CACHE_MAX_BYTES", 5 * 1024 * 1024 * 1024)
+
+# Streaming SQL dump import
+SQL_IMPORT_ON_DISK = _env_bool("AI_INSIGHT_SQL_IMPORT_ON_DISK", True)
+SQL_IMPORT_BATCH_ROWS = _env_int("AI_INSIGHT_SQL_IMPORT_BATCH_ROWS", 5000)
+SQL_IMPORT_COMMIT_ROWS = _env_int("AI_INSIGHT_SQL_IMPORT_COMMIT_ROWS", 100_000)
+
+# Lazy catalog over imported SQL dumps
+SQL_CATALOG_SAMPLE_ROWS = _env_int("AI_INSIGHT_SQL_CATALOG_SAMPLE_ROWS", 10_000)
+
+# Aggregation pushdown for live database connections
+PUSHDOWN_ENABLED = _env_bool("AI_INSIGHT_PUSHDOWN_ENABLED", True)
+PUSHDOWN_SAMPLE_ROWS = _env_int("AI_INSIGHT_PUSHDOWN_SAMPLE_ROWS", 5000)
+# Value counts computed on the server return at most this many values (the most frequent)
+PUSHDOWN_MAX_VALUES = _env_int("AI_INSIGHT_PUSHDOWN_MAX_VALUES", 1000)
+
+# Incremental sync of live database tables
+DB_SYNC_INTERVAL_SECONDS = _env_int("AI_INSIGHT_DB_SYNC_INTERVAL_SECONDS", 300)
+DB_SYNC_BATCH_ROWS = _env_int("AI_INSIGHT_DB_SYNC_BATCH_ROWS", 5000)
+DB_SYNC_MAX_BATCHES = _env_int("AI_INSIGHT_DB_SYNC_MAX_BATCHES", 100)
+
+# Chunked fetch of database rows into Arrow record batches
+DB_FETCH_CHUNK_ROWS = _env_int("AI_INSIGHT_DB_FETCH_CHUNK_ROWS", 50_000)
+DB_FETCH_MAX_MEMORY_BYTES = _env_int("AI_INSIGHT_DB_FETCH_MAX_MEMORY_BYTES", 2 * 1024 * 1024 * 1024)
+
+# Process-wide registry of loaded datasets shared by sessions; live-table samples are
+# shared for DATASET_REGISTRY_LIVE_MAX_AGE_SECONDS after they were fetched
+DATASET_REGISTRY_MAX_BYTES = _env_int("AI_INSIGHT_DATASET_REGISTRY_MAX_BYTES", 4 * 1024 * 1024 * 1024)
+DATASET_REGISTRY_LIVE_MAX_AGE_SECONDS = _env_int("AI_INSIGHT_DATASET_REGISTRY_LIVE_MAX_AGE_SECONDS", 300)
+
+# Shared database connection pools
+POOL_SIZE = _env_int("AI_INSIGHT_POOL_SIZE", 5)
+POOL_MAX_OVERFLOW = _env_int("AI_INSIGHT_POOL_MAX_OVERFLOW", 10)
+POOL_RECYCLE_SECONDS = _env_int("AI_INSIGHT_POOL_RECYCLE_SECONDS", 1800)
+POOL_TIMEOUT_SECONDS = _env_int("AI_INSIGHT_POOL_TIMEOUT_SECONDS", 30)
+POOL_VALIDATE_IDLE_SECONDS = _env_int("AI_INSIGHT_POOL_VALIDATE_IDLE_SECONDS", 5)
+POOL_HEALTH_TTL_SECONDS = _env_int("AI_INSIGHT_POOL_HEALTH_TTL_SECONDS", 30)
+
+# Background execution of PandasAI queries
+LLM_WORKERS = _env_int("AI_INSIGHT_LLM_WORKERS", 4)
+LLM_TIMEOUT_SECONDS = _env_int("AI_INSIGHT_LLM_TIMEOUT_SECONDS", 120)
+LLM_MAX_RETRIES = _env_int("AI_INSIGHT_LLM_MAX_RETRIES", 3)
+LLM_RETRY_BASE_SECONDS = _env_int("AI_INSIGHT_LLM_RETRY_BASE_SECONDS", 1)
+LLM_RETRY_MAX_SECONDS = _env_int("AI_INSIGHT_LLM_RETRY_MAX_SECONDS", 10)
+LLM_MAX_PENDING_PER_SESSION = _env_int("AI_INSIGHT_LLM_MAX_PENDING_PER_SESSION", 3)
+LLM_POLL_SECONDS = _env_int("AI_INSIGHT_LLM_POLL_SECONDS", 1)
+
+# Worker processes running PandasAI-generated code, with the dataset shared as Arrow files
+SANDBOX_ENABLED = _env_bool("AI_INSIGHT_SANDBOX_ENABLED", True)
+SANDBOX_DIR = os.environ.get(
+    "AI_INSIGHT_SANDBOX_DIR",
+    "/dev/shm/ai-insight" if os.path.isdir("/dev/shm") else os.path.join(CACHE_DIR, "sandbox")
+)
+SANDBOX_WORKERS = _env_int("AI_INSIGHT_SANDBOX_WORKERS", 2)
+SANDBOX_CPU_SECONDS = _env_int("AI_INSIGHT_SANDBOX_CPU_SECONDS", 60)
+SANDBOX_WALL_SECONDS = _env_int("AI_INSIGHT_SANDBOX_WALL_SECONDS", 90)
+SANDBOX_MEMORY_BYTES = _env_int("AI_INSIGHT_SANDBOX_MEMORY_BYTES", 2 * 1024 * 1024 * 1024)
+
+# Chat history rendering: the most recent messages render live, older ones as static snapshots
+CHAT_LIVE_MESSAGES = _env_int("AI_INSIGHT_CHAT_LIVE_MESSAGES", 20)
+CHAT_SNAPSHOT_ROWS = _env_int("AI_INSIGHT_CHAT_SNAPSHOT_ROWS", 20)
+
+# Per-session store of chat results (tables and charts)
+RESULT_SPILL_DIR = os.path.join(CACHE_DIR, "results")
+RESULT_MEMORY_BUDGET_BYTES = _env_int("AI_INSIGHT_RESULT_MEMORY_BUDGET_BYTES", 64 * 1024 * 1024)
+RESULT_SPILL_BYTES = _env_int("AI_INSIGHT_RESULT_SPILL_BYTES", 4 * 1024 * 1024)
+RESULT_PREVIEW_ROWS = _env_int("AI_INSIGHT_RESULT_PREVIEW_ROWS", 1000)
+
+# Tracing of the question pipeline and data loads
+TRACE_MAX_SPANS = _env_int("AI_INSIGHT_TRACE_MAX_SPANS", 5000)
+TRACE_EXPORT_PATH = os.environ.get("AI_INSIGHT_TRACE_EXPORT_PATH", "")
+
+# Logging: records go through a queue to a background writer; DEBUG records are sampled per call site
+LOG_LEVEL = os.environ.get("AI_INSIGHT_LOG_LEVEL", "INFO")
+LOG_MODULE_LEVELS = os.environ.get(
+    "AI_INSIGHT_LOG_MODULE_LEVELS",
+    "pandasai=WARNING,matplotlib=WARNING,PIL=WARNING,urllib3=WARNING,httpx=WARNING,httpcore=WARNING,"
+    "sqlalchemy=WARNING,watchdog=WARNING"
+)
+LOG_FILE = os.environ.get("AI_INSIGHT_LOG_FILE", "")
+LOG_DEBUG_PER_MINUTE = _env_int("AI_INSIGHT_LOG_DEBUG_PER_MINUTE", 60)
+LOG_QUEUE_SIZE = _env_int("AI_INSIGHT_LOG_QUEUE_SIZE", 10_000)
+
+# Dataset profiles (per-column statistics built once per dataset)
+PROFILE_DIR = os.path.join(CACHE_DIR, "profiles")
+PROFILE_MAX_ENTRIES = _env_int("AI_INSIGHT_PROFILE_MAX_ENTRIES", 64)
+PROFILE_TOP_K = _env_int("AI_INSIGHT_PROFILE_TOP_K", 10)
+PROFILE_MAX_TRACKED_VALUES = _env_int("AI_INSIGHT_PROFILE_MAX_TRACKED_VALUES", 100_000)
+
+# Approximate mode: per-column sketches (HyperLogLog, KLL, count-min) built with the profile
+APPROX_SKETCHES = _env_bool("AI_INSIGHT_APPROX_SKETCHES", True)
+APPROX_HLL_PRECISION = _env_int("AI_INSIGHT_APPROX_HLL_PRECISION", 12)
+APPROX_KLL_K = _env_int("AI_INSIGHT_APPROX_KLL_K", 200)
+APPROX_CMS_WIDTH = _env_int("AI_INSIGHT_APPROX_CMS_WIDTH", 2048)
+APPROX_CMS_DEPTH = _env_int("AI_INSIGHT_APPROX_CMS_DEPTH", 4)
+APPROX_HEAVY_HITTERS = _env_int("AI_INSIGHT_APPROX_HEAVY_HITTERS", 64)
+APPROX_MAX_GROUPS = _env_int("AI_INSIGHT_APPROX_MAX_GROUPS", 50)
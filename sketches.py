@@ -0,0 +1,466 @@
+import base64
+import math
+
+import numpy as np
+import pandas as pd
+
+# Quantile levels reported for numeric and date columns
+QUANTILE_LEVELS = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+
+# Function to classify a column: "numeric", "datetime" or "categorical"
+def column_kind(series):
+    if pd.api.types.is_bool_dtype(series):
+        return "categorical"
+    if pd.api.types.is_numeric_dtype(series):
+        return "numeric"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "datetime"
+    return "categorical"
+
+# Function to hash values to uint64; equal values hash alike whichever chunk they come from,
+# categoricals included
+def hash_values(values):
+    series = pd.Series(values)
+    try:
+        return pd.util.hash_pandas_object(series, index=False).to_numpy()
+    except TypeError:
+        # Unhashable cells (lists, dicts...) are hashed through their string form
+        return pd.util.hash_pandas_object(series.astype(str), index=False).to_numpy()
+
+# Function to count the significant bits of each uint64. The float conversion rounds only
+# the lowest 11 bits, which changes the result for a negligible 2**-52 share of values
+def _bit_length(values):
+    return np.frexp(values.astype(np.float64))[1]
+
+def _encode(array):
+    return base64.b64encode(np.ascontiguousarray(array).tobytes()).decode("ascii")
+
+def _decode(text, dtype):
+    return np.frombuffer(base64.b64decode(text), dtype=dtype).copy()
+
+# Function to convert numpy and pandas scalars to JSON-friendly Python values
+def _plain(value):
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+# Distinct-count sketch over 2**precision one-byte registers; the standard error of the
+# estimate is 1.04 / sqrt(2**precision), about 1.6% at the default precision of 12. Until
+# it sees more than 2**precision distinct hashes it keeps them as a sorted array and
+# counts exactly, as HyperLogLog++ does with its sparse mode.
+class HyperLogLog:
+    def __init__(self, precision=12, registers=None, sparse=None):
+        self.precision = precision
+        self.registers = registers
+        self.sparse = sparse if sparse is not None or registers is not None else np.empty(0, dtype=np.uint64)
+
+    @property
+    def exact(self):
+        return self.sparse is not None
+
+    @property
+    def relative_error(self):
+        return 0.0 if self.exact else 1.04 / math.sqrt(1 << self.precision)
+
+    def add_hashes(self, hashes):
+        if not len(hashes):
+            return
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if self.sparse is not None:
+            self.sparse = np.union1d(self.sparse, hashes)
+            if len(self.sparse) <= 1 << self.precision:
+                return
+            hashes, self.sparse = self.sparse, None
+            self.registers = np.zeros(1 << self.precision, dtype=np.uint8)
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.intp)
+        rank = (65 - _bit_length(hashes << np.uint64(self.precision)).astype(np.int16)).clip(max=64 - self.precision + 1)
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+
+    def estimate(self):
+        if self.sparse is not None:
+            return float(len(self.sparse))
+        m = len(self.registers)
+        raw = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            return m * math.log(m / zeros)
+        return float(raw)
+
+    def merge(self, other):
+        if other.sparse is not None:
+            self.add_hashes(other.sparse)
+            return self
+        if self.sparse is not None:
+            hashes, self.sparse = self.sparse, None
+            self.registers = np.zeros(1 << self.precision, dtype=np.uint8)
+            self.add_hashes(hashes)
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def to_dict(self):
+        if self.sparse is not None:
+            return {"precision": self.precision, "sparse": _encode(self.sparse)}
+        return {"precision": self.precision, "registers": _encode(self.registers)}
+
+    @classmethod
+    def from_dict(cls, data):
+        if "sparse" in data:
+            return cls(data["precision"], sparse=_decode(data["sparse"], np.uint64))
+        return cls(data["precision"], _decode(data["registers"], np.uint8))
+
+
+# KLL quantile sketch: a stack of compactors where level h holds items of weight 2**h and
+# keeps about k * (2/3)**depth items; a full level is sorted and every other item, from a
+# random offset, is promoted. Holds O(k) items whatever the input size, merges across
+# chunks, and answers quantiles with a normalized rank error of about 2.3 / k**0.97
+# (1.3% at k=200, 99% confidence).
+class KLLSketch:
+    def __init__(self, k=200, seed=0):
+        self.k = k
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def rank_error(self):
+        return 2.296 / self.k ** 0.9723
+
+    def _capacity(self, level):
+        return max(2, int(math.ceil(self.k * (2 / 3) ** (len(self.levels) - level - 1))))
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        self.count += len(values)
+        low, high = float(values.min()), float(values.max())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def _compress(self):
+        # A new level lowers the capacity of every level below it, hence the repeated passes
+        while any(len(items) > self._capacity(level) for level, items in enumerate(self.levels)):
+            for level in range(len(self.levels)):
+                items = self.levels[level]
+                if len(items) <= self._capacity(level):
+                    continue
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                odd = len(items) % 2
+                self.levels[level] = items[:odd]
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], items[odd:][self._rng.integers(2)::2]])
+
+    def quantiles(self, levels):
+        if not self.count:
+            return [None] * len(levels)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2 ** h, dtype=np.float64) for h, items in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        items, cumulative = items[order], np.cumsum(weights[order])
+        positions = np.searchsorted(cumulative, np.asarray(levels) * cumulative[-1], side="left").clip(0, len(items) - 1)
+        result = items[positions]
+        result = np.where(np.asarray(levels) <= 0, self.min, result)
+        return np.where(np.asarray(levels) >= 1, self.max, result).tolist()
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        self.count += other.count
+        self._compress()
+        return self
+
+    def to_dict(self):
+        return {"k": self.k, "count": self.count, "min": self.min, "max": self.max,
+                "levels": [_encode(items) for items in self.levels]}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["k"])
+        sketch.count, sketch.min, sketch.max = data["count"], data["min"], data["max"]
+        sketch.levels = [_decode(items, np.float64) for items in data["levels"]]
+        return sketch
+
+
+# Count-min sketch with a bounded set of heavy-hitter candidates. Estimated counts never
+# undercount and overcount by at most e / width * total with probability 1 - e**-depth
+# (0.13% of the rows with 98% confidence at the defaults).
+class CountMinSketch:
+    def __init__(self, width=2048, depth=4, capacity=64):
+        self.width = width
+        self.depth = depth
+        self.capacity = capacity
+        self.total = 0
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.candidates = {}
+
+    @property
+    def error_bound(self):
+        return math.e / self.width * self.total
+
+    @property
+    def confidence(self):
+        return 1 - math.exp(-self.depth)
+
+    def _buckets(self, hashes):
+        low = hashes & np.uint64(0xFFFFFFFF)
+        high = (hashes >> np.uint64(32)) | np.uint64(1)
+        return [((low + np.uint64(row) * high) % np.uint64(self.width)).astype(np.intp) for row in range(self.depth)]
+
+    # Function to add the counts of distinct values (an Index); `hashes` are their hashes
+    def update(self, values, counts, hashes):
+        counts = np.asarray(counts, dtype=np.int64)
+        for row, buckets in enumerate(self._buckets(hashes)):
+            np.add.at(self.table[row], buckets, counts)
+        self.total += int(counts.sum())
+        pool = dict(self.candidates)
+        top = np.argsort(-counts, kind="stable")[:self.capacity]
+        pool.update(zip(hashes[top].tolist(), values[top].tolist()))
+        pool_hashes = np.fromiter(pool, dtype=np.uint64, count=len(pool))
+        keep = np.argsort(-self.estimate(pool_hashes), kind="stable")[:self.capacity]
+        self.candidates = {int(pool_hashes[i]): pool[int(pool_hashes[i])] for i in keep}
+
+    def estimate(self, hashes):
+        if not len(hashes):
+            return np.empty(0, dtype=np.int64)
+        return np.min([self.table[row, buckets] for row, buckets in enumerate(self._buckets(hashes))], axis=0)
+
+    # Function to list the k most frequent candidates as (value, estimated count)
+    def heavy_hitters(self, k=10):
+        hashes = np.fromiter(self.candidates, dtype=np.uint64, count=len(self.candidates))
+        estimates = self.estimate(hashes)
+        order = np.argsort(-estimates, kind="stable")[:k]
+        return [(self.candidates[int(hashes[i])], int(estimates[i])) for i in order]
+
+    def to_dict(self):
+        return {"width": self.width, "depth": self.depth, "capacity": self.capacity, "total": self.total,
+                "table": _encode(self.table), "candidates": [[str(h), _plain(v)] for h, v in self.candidates.items()]}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["width"], data["depth"], data["capacity"])
+        sketch.total = data["total"]
+        sketch.table = _decode(data["table"], np.int64).reshape(sketch.depth, sketch.width)
+        sketch.candidates = {int(h): v for h, v in data["candidates"]}
+        return sketch
+
+
+# Per-column sketches of a dataset, built chunk by chunk during ingestion: a HyperLogLog
+# and a count-min sketch for every column, a KLL sketch for numeric and date columns, and
+# exact count/sum/min/max. For each categorical column with at most `max_groups` values,
+# the numeric columns also get per-group count/sum/min/max and a KLL sketch, so grouped
+# medians and quantiles need no pass over the rows either.
+class DatasetSketches:
+    def __init__(self, precision=12, k=200, width=2048, depth=4, heavy_hitters=64, max_groups=50, seed=0):
+        self.precision = precision
+        self.k = k
+        self.width = width
+        self.depth = depth
+        self.heavy_hitters_capacity = heavy_hitters
+        self.max_groups = max_groups
+        self.seed = seed
+        self.rows = 0
+        self.columns = {}
+        self.groups = None
+
+    def _column(self, name, series):
+        column = self.columns.get(name)
+        if column is None:
+            kind = column_kind(series)
+            column = self.columns[name] = {
+                "kind": kind, "count": 0, "sum": 0.0, "min": None, "max": None,
+                "hll": HyperLogLog(self.precision),
+                "cms": CountMinSketch(self.width, self.depth, self.heavy_hitters_capacity),
+                "kll": KLLSketch(self.k, self.seed) if kind != "categorical" else None,
+            }
+        return column
+
+    def update(self, chunk):
+        self.rows += len(chunk)
+        numeric = {}
+        for name in chunk.columns:
+            series = chunk[name]
+            column = self._column(str(name), series)
+            counts = series.value_counts(sort=False)
+            counts = counts[counts > 0]
+            if counts.empty:
+                continue
+            hashes = hash_values(counts.index)
+            column["hll"].add_hashes(hashes)
+            column["cms"].update(counts.index, counts.to_numpy(), hashes)
+            column["count"] += int(counts.sum())
+            if column["kind"] == "categorical":
+                continue
+            if column["kind"] == "datetime":
+                values = series.dropna().to_numpy().astype("datetime64[ns]").astype("int64").astype("float64")
+            else:
+                values = series.to_numpy(dtype="float64", na_value=np.nan)
+                numeric[str(name)] = values
+                column["sum"] += float(np.nansum(values))
+            column["kll"].update(values)
+            low, high = float(np.nanmin(values)), float(np.nanmax(values))
+            column["min"] = low if column["min"] is None else min(column["min"], low)
+            column["max"] = high if column["max"] is None else max(column["max"], high)
+        self._update_groups(chunk, numeric)
+        return self
+
+    def _update_groups(self, chunk, numeric):
+        if self.groups is None:
+            # Grouping columns are chosen on the first chunk and dropped once they exceed max_groups
+            self.groups = {
+                str(name): {} for name in chunk.columns
+                if self.columns[str(name)]["kind"] == "categorical" and chunk[name].nunique() <= self.max_groups
+            }
+        for group, per_value in self.groups.items():
+            if per_value is None:
+                continue
+            for value, positions in chunk.groupby(chunk[group], observed=True, sort=False).indices.items():
+                measures = per_value.setdefault(_plain(value), {})
+                for measure, values in numeric.items():
+                    values = values[positions]
+                    values = values[~np.isnan(values)]
+                    if not len(values):
+                        continue
+                    stats = measures.get(measure)
+                    if stats is None:
+                        stats = measures[measure] = {"count": 0, "sum": 0.0, "min": None, "max": None, "kll": KLLSketch(self.k, self.seed)}
+                    stats["count"] += len(values)
+                    stats["sum"] += float(values.sum())
+                    stats["min"] = float(values.min()) if stats["min"] is None else min(stats["min"], float(values.min()))
+                    stats["max"] = float(values.max()) if stats["max"] is None else max(stats["max"], float(values.max()))
+                    stats["kll"].update(values)
+            if len(per_value) > self.max_groups:
+                self.groups[group] = None
+
+    @property
+    def rank_error(self):
+        return KLLSketch(self.k).rank_error
+
+    # Function to estimate the distinct values of a column: (estimate, relative standard error)
+    def distinct(self, column):
+        sketch = self.columns.get(column)
+        if sketch is None:
+            return None, None
+        return sketch["hll"].estimate(), sketch["hll"].relative_error
+
+    # Function to convert a sketched number back to the column's type (dates are sketched as nanoseconds)
+    def to_value(self, column, value):
+        if value is not None and self.columns[column]["kind"] == "datetime":
+            return pd.Timestamp(int(value))
+        return value
+
+    # Function to estimate quantiles of a column, per group when `group_by` is given;
+    # returns None when the sketches cannot answer
+    def quantiles(self, column, levels=QUANTILE_LEVELS, group_by=None):
+        sketch = self.columns.get(column)
+        if sketch is None or sketch["kll"] is None:
+            return None
+        if group_by is None:
+            return [self.to_value(column, value) for value in sketch["kll"].quantiles(levels)]
+        per_value = self.group_stats(group_by, column)
+        if per_value is None:
+            return None
+        return {value: stats["kll"].quantiles(levels) for value, stats in per_value.items()}
+
+    # Function to get the exact count/sum/min/max of a numeric column per group of `group_by`
+    def group_stats(self, group_by, column):
+        per_value = (self.groups or {}).get(group_by)
+        if per_value is None or column not in self.columns or self.columns[column]["kind"] != "numeric":
+            return None
+        return {value: measures[column] for value, measures in per_value.items() if column in measures}
+
+    # Function to list the most frequent values of a column as (value, estimated count)
+    def heavy_hitters(self, column, k=10):
+        sketch = self.columns.get(column)
+        return None if sketch is None else sketch["cms"].heavy_hitters(k)
+
+    def count_error(self, column):
+        cms = self.columns[column]["cms"]
+        return cms.error_bound, cms.confidence
+
+    def to_dict(self):
+        columns = {}
+        for name, column in self.columns.items():
+            columns[name] = {key: value for key, value in column.items() if key not in ("hll", "cms", "kll")}
+            columns[name]["hll"] = column["hll"].to_dict()
+            columns[name]["cms"] = column["cms"].to_dict()
+            columns[name]["kll"] = column["kll"].to_dict() if column["kll"] is not None else None
+        groups = {}
+        for group, per_value in (self.groups or {}).items():
+            if per_value is None:
+                continue
+            groups[group] = [
+                [value, {measure: {**{key: stat for key, stat in stats.items() if key != "kll"}, "kll": stats["kll"].to_dict()}
+                         for measure, stats in measures.items()}]
+                for value, measures in per_value.items()
+            ]
+        return {
+            "params": {"precision": self.precision, "k": self.k, "width": self.width, "depth": self.depth,
+                       "heavy_hitters": self.heavy_hitters_capacity, "max_groups": self.max_groups, "seed": self.seed},
+            "rows": self.rows,
+            "columns": columns,
+            "groups": groups,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketches = cls(**data["params"])
+        sketches.rows = data["rows"]
+        for name, column in data["columns"].items():
+            sketches.columns[name] = {
+                **column,
+                "hll": HyperLogLog.from_dict(column["hll"]),
+                "cms": CountMinSketch.from_dict(column["cms"]),
+                "kll": KLLSketch.from_dict(column["kll"]) if column["kll"] is not None else None,
+            }
+        sketches.groups = {
+            group: {value: {measure: {**stats, "kll": KLLSketch.from_dict(stats["kll"])} for measure, stats in measures.items()}
+                    for value, measures in per_value}
+            for group, per_value in data["groups"].items()
+        }
+        return sketches
+
+# Function to summarize the sketches as text with their error bounds, used as LLM context
+# for approximate questions
+def sketch_description(sketches, max_columns=50, max_groups=20):
+    fmt = lambda value: f"{value:.4g}" if isinstance(value, float) else str(value)
+    lines = [f"Approximate statistics of {sketches.rows:,} rows "
+             f"(distinct counts above {1 << sketches.precision:,} ±{2 * 1.04 / math.sqrt(1 << sketches.precision):.1%}, "
+             f"quantiles within ±{sketches.rank_error:.1%} in rank):"]
+    for name in list(sketches.columns)[:max_columns]:
+        estimate, _ = sketches.distinct(name)
+        parts = [f"~{estimate:,.0f} distinct"]
+        quantiles = sketches.quantiles(name, [0.05, 0.5, 0.95])
+        if quantiles is not None:
+            parts.append("p5/p50/p95 " + " / ".join(fmt(value) for value in quantiles))
+        else:
+            top = sketches.heavy_hitters(name, 5)
+            parts.append("most frequent: " + ", ".join(f"{value} (~{count:,})" for value, count in top))
+        lines.append(f"- {name}: " + "; ".join(parts))
+    for group, per_value in (sketches.groups or {}).items():
+        if per_value is None or len(per_value) > max_groups:
+            continue
+        for measure, column in sketches.columns.items():
+            if column["kind"] != "numeric":
+                continue
+            quantiles = sketches.quantiles(measure, [0.5], group_by=group)
+            if quantiles:
+                lines.append(f"- median {measure} by {group}: " + ", ".join(
+                    f"{value}={fmt(levels[0])}" for value, levels in quantiles.items()
+                ))
+    return "\n".join(lines)
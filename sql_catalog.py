@@ -0,0 +1,241 @@
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+from collections import deque
+
+import pandas as pd
+
+from dataset_cache import hold_file, release_file
+from query_engine import column_aliases, execute_intent, intent_columns, normalize_text, parse_query_intent
+from sql_import import quote_identifier
+
+logger = logging.getLogger(__name__)
+
+# Function to fingerprint a selection of tables from an imported dump for the answer cache
+def catalog_fingerprint(dataset_key, tables):
+    return hashlib.sha256(f"{dataset_key}:{'|'.join(tables)}".encode("utf-8")).hexdigest()
+
+# Function to guess the singular form of a table name ("categories" -> "category")
+def _singular(name):
+    name = name.lower()
+    if name.endswith("ies") and len(name) > 4:
+        return name[:-3] + "y"
+    if name.endswith("s") and not name.endswith("ss"):
+        return name[:-1]
+    return name
+
+# Function to list the phrases that can refer to a table ("order_items" -> "order items", "order item", ...)
+def table_aliases(table):
+    return column_aliases(table) | column_aliases(_singular(table))
+
+# Function to convert a filter value to a type sqlite3 can bind
+def _sql_value(value):
+    return value.item() if hasattr(value, "item") else value
+
+
+# Lazy catalog over an imported SQLite database. Table metadata (schema, row counts,
+# foreign keys) is read once; rows are only materialized on demand, projected to the
+# columns a question needs and filtered in SQL, with related tables joined by SQLite.
+# The database file is held in the dataset cache until close(), so eviction leaves it alone.
+class SQLiteCatalog:
+    def __init__(self, conn, sample_rows=10_000):
+        self.conn = conn
+        self.sample_rows = sample_rows
+        self._lock = threading.RLock()
+        self._tables = None
+        self._relations = None
+        self._samples = {}
+        self.conn.execute("PRAGMA query_only=ON")
+        # Empty for an in-memory database
+        self.db_path = next((row[2] for row in self.conn.execute("PRAGMA database_list") if row[1] == "main"), "") or None
+        if self.db_path:
+            hold_file(self.db_path)
+
+    @classmethod
+    def open(cls, db_path, sample_rows=10_000):
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+        conn.execute("PRAGMA mmap_size=268435456")
+        return cls(conn, sample_rows)
+
+    def tables(self):
+        with self._lock:
+            if self._tables is None:
+                tables = {}
+                names = [row[0] for row in self.conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY rowid"
+                )]
+                for name in names:
+                    quoted = quote_identifier(name)
+                    table_info = self.conn.execute(f"PRAGMA table_info({quoted})").fetchall()
+                    tables[name] = {
+                        "rows": self.conn.execute(f"SELECT COUNT(*) FROM {quoted}").fetchone()[0],
+                        "columns": [(row[1], row[2] or "") for row in table_info],
+                        "primary_key": [row[1] for row in sorted(table_info, key=lambda row: row[5]) if row[5]],
+                        "foreign_keys": [(row[3], row[2], row[4]) for row in self.conn.execute(f"PRAGMA foreign_key_list({quoted})")],
+                    }
+                self._tables = tables
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("SQL catalog tables: %s", {name: info["rows"] for name, info in tables.items()})
+            return self._tables
+
+    def table_names(self):
+        return list(self.tables())
+
+    # Join keys between tables: declared foreign keys first, then naming conventions
+    # ("customer_id" -> customers.id, or the same "*_id" column on both sides) since
+    # many dumps are exported without FOREIGN KEY clauses.
+    def relations(self):
+        with self._lock:
+            if self._relations is not None:
+                return self._relations
+            tables = self.tables()
+            relations, linked = [], set()
+            for name, info in tables.items():
+                for column, ref_table, ref_column in info["foreign_keys"]:
+                    if ref_table not in tables or ref_table == name:
+                        continue
+                    if ref_column is None:
+                        primary_key = tables[ref_table]["primary_key"]
+                        if len(primary_key) != 1:
+                            continue
+                        ref_column = primary_key[0]
+                    relations.append((name, column, ref_table, ref_column))
+                    linked.add(frozenset((name, ref_table)))
+            for name, info in tables.items():
+                columns = {column.lower(): column for column, _ in info["columns"]}
+                for other, other_info in tables.items():
+                    if other == name or frozenset((name, other)) in linked:
+                        continue
+                    other_columns = {column.lower(): column for column, _ in other_info["columns"]}
+                    other_key = other_info["primary_key"][0] if len(other_info["primary_key"]) == 1 else other_columns.get("id")
+                    singular = _singular(other)
+                    for candidate in (f"{singular}_id", f"{singular}id", f"{other.lower()}_id"):
+                        if candidate in columns and other_key:
+                            relations.append((name, columns[candidate], other, other_key))
+                            linked.add(frozenset((name, other)))
+                            break
+                    else:
+                        shared = sorted(column for column in columns if column.endswith("_id") and column in other_columns)
+                        if shared:
+                            relations.append((name, columns[shared[0]], other, other_columns[shared[0]]))
+                            linked.add(frozenset((name, other)))
+            self._relations = relations
+            return relations
+
+    # Joins needed to reach every table from the first one, found by breadth-first
+    # search over the relations so intermediate tables are pulled in when required.
+    # Returns a list of (table, parent, parent_column, table_column), or None.
+    def join_plan(self, tables):
+        adjacency = {}
+        for name, column, other, other_column in self.relations():
+            adjacency.setdefault(name, []).append((other, column, other_column))
+            adjacency.setdefault(other, []).append((name, other_column, column))
+        base = tables[0]
+        parents = {base: None}
+        queue = deque([base])
+        while queue:
+            current = queue.popleft()
+            for neighbour, column, neighbour_column in adjacency.get(current, []):
+                if neighbour not in parents:
+                    parents[neighbour] = (current, column, neighbour_column)
+                    queue.append(neighbour)
+        joins, joined = [], {base}
+        for table in tables[1:]:
+            if table not in parents:
+                return None
+            path, node = [], table
+            while node not in joined:
+                path.append(node)
+                node = parents[node][0]
+            for node in reversed(path):
+                parent, column, node_column = parents[node]
+                joins.append((node, parent, column, node_column))
+                joined.add(node)
+        return joins
+
+    def _from_clause(self, tables):
+        joins = self.join_plan(tables) if len(tables) > 1 else []
+        if joins is None:
+            raise ValueError(f"No join path between tables: {', '.join(tables)}")
+        order = [tables[0]] + [join[0] for join in joins]
+        aliases = {table: f"t{index}" for index, table in enumerate(order)}
+        clause = f"FROM {quote_identifier(order[0])} AS t0"
+        for table, parent, column, table_column in joins:
+            clause += (f" LEFT JOIN {quote_identifier(table)} AS {aliases[table]}"
+                       f" ON {aliases[parent]}.{quote_identifier(column)} = {aliases[table]}.{quote_identifier(table_column)}")
+        # Columns keep their name unless an earlier table already uses it ("customers_name")
+        output = {}
+        for table in order:
+            for column, _ in self.tables()[table]["columns"]:
+                name = column if column not in output else f"{table}_{column}"
+                output[name] = f"{aliases[table]}.{quote_identifier(column)}"
+        return clause, output
+
+    def select(self, tables, columns=None, filters=None, limit=None):
+        clause, output = self._from_clause(tables)
+        if columns is None:
+            columns = list(output)
+        elif not columns:
+            columns = list(output)[:1]
+        sql = "SELECT " + ", ".join(f"{output[name]} AS {quote_identifier(name)}" for name in columns) + f" {clause}"
+        params = []
+        if filters:
+            sql += " WHERE " + " AND ".join(f"{output[column]} = ?" for column, _ in filters)
+            params = [_sql_value(value) for _, value in filters]
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        logger.debug("SQL catalog query: %s", sql)
+        with self._lock:
+            return pd.read_sql_query(sql, self.conn, params=params)
+
+    def sample(self, tables):
+        key = tuple(tables)
+        if key not in self._samples:
+            self._samples[key] = self.select(tables, limit=self.sample_rows)
+        return self._samples[key]
+
+    def row_count(self, tables):
+        if len(tables) == 1:
+            return self.tables()[tables[0]]["rows"]
+        clause, _ = self._from_clause(tables)
+        with self._lock:
+            return self.conn.execute(f"SELECT COUNT(*) {clause}").fetchone()[0]
+
+    # Tables a question refers to: the active table plus any other table whose name,
+    # or one of whose columns missing from the active table, is mentioned and joinable
+    def tables_for_question(self, query, active_table):
+        text = normalize_text(query)
+        tables = self.tables()
+        active_aliases = set()
+        for column, _ in tables[active_table]["columns"]:
+            active_aliases |= column_aliases(column)
+        selection = [active_table]
+        for name, info in tables.items():
+            if name == active_table:
+                continue
+            aliases = set(table_aliases(name))
+            for column, _ in info["columns"]:
+                aliases |= column_aliases(column) - active_aliases
+            if any(re.search(rf"\b{re.escape(alias)}\b", text) for alias in aliases):
+                if self.join_plan(selection + [name]) is not None:
+                    selection.append(name)
+        return selection
+
+    def close(self):
+        with self._lock:
+            self._samples.clear()
+            self.conn.close()
+            if self.db_path:
+                release_file(self.db_path)
+                self.db_path = None
+
+# Function to answer an aggregation question from the catalog, loading only the
+# projected and filtered rows it needs; returns (None, None) when it cannot be parsed
+def answer_from_catalog(catalog, tables, query):
+    intent = parse_query_intent(query, catalog.sample(tables))
+    if intent is None:
+        return None, None
+    frame = catalog.select(tables, columns=intent_columns(intent), filters=intent.filters)
+    return execute_intent(intent, frame)
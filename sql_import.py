@@ -0,0 +1,381 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Tokens that matter when splitting a dump: complete quoted literals are skipped in one
+# step, lone quotes open a literal that continues on the next line
+_TOKEN = re.compile(
+    r"'[^'\\\n]*(?:(?:\\.|'')[^'\\\n]*)*'"
+    r'|"[^"\\\n]*(?:(?:\\.|"")[^"\\\n]*)*"'
+    r"|`[^`\n]*(?:``[^`\n]*)*`"
+    r"|[;'\"`#]|--(?=\s|$)|/\*"
+)
+# Lines containing any of these need the full scan instead of a split on single quotes
+_SLOW_LINE_MARKERS = ('"', "\\", "#", "--", "/*")
+_QUOTE_END = {quote: re.compile(rf"[\\{quote}]") for quote in ("'", '"')}
+_QUOTE_END["`"] = re.compile(r"`")
+
+# Statements with no SQLite equivalent that are dropped from MySQL dumps
+_SKIPPED_STATEMENT = re.compile(
+    r"^(?:SET|START\s+TRANSACTION|BEGIN|COMMIT|ROLLBACK|LOCK\s+TABLES?|UNLOCK\s+TABLES?|USE|DELIMITER|"
+    r"CREATE\s+(?:DATABASE|SCHEMA)|ALTER\s+TABLE|ALTER\s+DATABASE)\b",
+    re.IGNORECASE
+)
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"", re.DOTALL)
+_TABLE_OPTION_PATTERNS = [
+    (re.compile(r"\bAUTO_INCREMENT\b", re.IGNORECASE), ""),
+    (re.compile(r"\bUNSIGNED\b|\bZEROFILL\b", re.IGNORECASE), ""),
+    (re.compile(r"\b(?:CHARACTER\s+SET|CHARSET)\s+\w+", re.IGNORECASE), ""),
+    (re.compile(r"\bCOLLATE\s+\w+", re.IGNORECASE), ""),
+    (re.compile(r"\bON\s+UPDATE\s+CURRENT_TIMESTAMP(?:\(\d*\))?", re.IGNORECASE), ""),
+    (re.compile(r"\b(?:enum|set)\s*\([^)]*\)", re.IGNORECASE), "TEXT"),
+]
+_COLUMN_COMMENT = re.compile(r"\s+COMMENT\s*=?\s*'(?:[^'\\]|\\.|'')*'", re.IGNORECASE)
+_INDEX_DEFINITION = re.compile(r"^(?:(?:FULLTEXT|SPATIAL)\s+)?(?:KEY|INDEX)\b", re.IGNORECASE)
+_UNIQUE_KEY_DEFINITION = re.compile(r"^UNIQUE\s+(?:KEY|INDEX)\s+(?:\"[^\"]*\"\s*)?", re.IGNORECASE)
+
+# INSERT statements are parsed into rows and loaded with executemany
+_INSERT_HEAD = re.compile(
+    r"^INSERT\s+(IGNORE\s+)?INTO\s+(`[^`]+`|\"[^\"]+\"|[\w$.]+)\s*(\([^)]*\))?\s*VALUES\s*",
+    re.IGNORECASE
+)
+_VALUE = re.compile(
+    r"\s*(?:(NULL)\b|'([^'\\]*(?:(?:\\.|'')[^'\\]*)*)'|\"([^\"\\]*(?:(?:\\.|\"\")[^\"\\]*)*)\"|"
+    r"([-+]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?)(?![\w.])|(TRUE|FALSE)\b)\s*",
+    re.IGNORECASE | re.DOTALL
+)
+_ESCAPE = re.compile(r"\\(.)", re.DOTALL)
+_ESCAPES = {"0": "\0", "b": "\b", "n": "\n", "r": "\r", "t": "\t", "Z": "\x1a", "%": "\\%", "_": "\\_"}
+
+
+# Function to find the statement terminators of a simple line, or None if it needs the full scan
+def _simple_line_terminators(line):
+    if any(marker in line for marker in _SLOW_LINE_MARKERS):
+        return None
+    segments = line.split("'")
+    if len(segments) % 2 == 0 or "`" in line[len(segments[0]):] or (len(segments) == 1 and "`" in line):
+        return None
+    if any(";" in segment for segment in segments[0:-1:2]):
+        return None
+    base = len(line) - len(segments[-1])
+    positions, pos = [], segments[-1].find(";")
+    while pos != -1:
+        positions.append(base + pos)
+        pos = segments[-1].find(";", pos + 1)
+    return positions
+
+# Function to split a dump into statements while reading it line by line
+def iter_sql_statements(binary_stream, progress_callback=None, encoding="utf-8"):
+    parts, quote, in_block_comment, consumed = [], None, False, 0
+    for raw_line in binary_stream:
+        consumed += len(raw_line)
+        line = raw_line.decode(encoding, errors="replace")
+        pos = start = 0
+        length = len(line)
+        terminators = None if quote or in_block_comment else _simple_line_terminators(line)
+        if terminators is not None:
+            for end in terminators:
+                parts.append(line[start:end])
+                start = end + 1
+                statement = "".join(parts).strip()
+                parts = []
+                if statement:
+                    yield statement
+            pos = length
+        while pos < length:
+            if in_block_comment:
+                end = line.find("*/", pos)
+                if end == -1:
+                    start = length
+                    break
+                pos = start = end + 2
+                in_block_comment = False
+                continue
+            if quote:
+                match = _QUOTE_END[quote].search(line, pos)
+                if match is None:
+                    break
+                if match.group() == "\\" or line.startswith(quote, match.end()):
+                    pos = match.end() + 1
+                    continue
+                pos, quote = match.end(), None
+                continue
+            match = _TOKEN.search(line, pos)
+            if match is None:
+                break
+            token = match.group()
+            pos = match.end()
+            if len(token) > 1 and token[0] in "'\"`":
+                continue
+            if token in ("'", '"', "`"):
+                quote = token
+                continue
+            parts.append(line[start:match.start()])
+            start = pos
+            if token == ";":
+                statement = "".join(parts).strip()
+                parts = []
+                if statement:
+                    yield statement
+            elif token == "/*":
+                in_block_comment = True
+            else:
+                parts.append("\n")
+                start = length
+                break
+        parts.append(line[start:])
+        if progress_callback:
+            progress_callback(consumed)
+    statement = "".join(parts).strip()
+    if statement:
+        yield statement
+
+# Function to apply `transform` to the parts of a statement outside string literals
+def _transform_outside_strings(statement, transform):
+    result, pos = [], 0
+    for match in _STRING_LITERAL.finditer(statement):
+        result.append(transform(statement[pos:match.start()]))
+        result.append(match.group())
+        pos = match.end()
+    result.append(transform(statement[pos:]))
+    return "".join(result)
+
+# Function to split the body of a CREATE TABLE on top-level commas
+def _split_definitions(body):
+    definitions, depth, start, pos = [], 0, 0, 0
+    while pos < len(body):
+        char = body[pos]
+        if char in "'\"":
+            match = _STRING_LITERAL.match(body, pos)
+            pos = match.end() if match else pos + 1
+            continue
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            definitions.append(body[start:pos])
+            start = pos + 1
+        pos += 1
+    definitions.append(body[start:])
+    return [definition.strip() for definition in definitions if definition.strip()]
+
+# Function to translate a CREATE TABLE statement from MySQL to SQLite
+def _translate_create_table(statement):
+    statement = _transform_outside_strings(statement, lambda code: code.replace("`", '"'))
+    start, end = statement.find("("), statement.rfind(")")
+    table_options = statement[end + 1:] if end != -1 else ""
+    if start == -1 or end < start or "(" in _COLUMN_COMMENT.sub("", table_options):
+        return statement
+    definitions = []
+    for definition in _split_definitions(statement[start + 1:end]):
+        if _INDEX_DEFINITION.match(definition):
+            continue
+        definition = _UNIQUE_KEY_DEFINITION.sub("UNIQUE ", definition)
+        definition = _COLUMN_COMMENT.sub("", definition)
+        for pattern, replacement in _TABLE_OPTION_PATTERNS:
+            definition = pattern.sub(replacement, definition)
+        definitions.append(re.sub(r"\s+", " ", definition).strip())
+    return f"{statement[:start].rstrip()} (\n  " + ",\n  ".join(definitions) + "\n)"
+
+# Function to translate one MySQL statement into SQLite, or None when it must be skipped
+def translate_statement(statement):
+    if _SKIPPED_STATEMENT.match(statement):
+        return None
+    if re.match(r"^CREATE\s+TABLE\b", statement, re.IGNORECASE):
+        return _translate_create_table(statement)
+    return _transform_outside_strings(statement, lambda code: code.replace("`", '"'))
+
+# Function to quote an identifier for SQLite
+def quote_identifier(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+# Function to decode a MySQL string literal body
+def _unescape(value, quote):
+    value = value.replace(quote * 2, quote)
+    if "\\" not in value:
+        return value
+    return _ESCAPE.sub(lambda m: _ESCAPES.get(m.group(1), m.group(1)), value)
+
+# Function to build the SQLite INSERT prefix for a parsed MySQL INSERT head
+def _insert_prefix(ignore, table, columns):
+    column_sql = f" ({', '.join(quote_identifier(col) for col in columns)})" if columns else ""
+    return f"INSERT {'OR IGNORE ' if ignore else ''}INTO {quote_identifier(table)}{column_sql} VALUES "
+
+# Function to split the head of an INSERT into (ignore, table, columns)
+def _insert_target(head):
+    columns = head.group(3)
+    if columns:
+        columns = tuple(col.strip().strip('`"') for col in columns[1:-1].split(","))
+    return bool(head.group(1)), head.group(2).strip('`"'), columns
+
+# Function to parse the VALUES tuples of an INSERT, or None if they use unsupported syntax
+def parse_insert(statement):
+    head = _INSERT_HEAD.match(statement)
+    if head is None:
+        return None
+    ignore, table, columns = _insert_target(head)
+    rows, pos, length = [], head.end(), len(statement)
+    while pos < length:
+        if statement[pos] != "(":
+            return None
+        pos += 1
+        row = []
+        while True:
+            match = _VALUE.match(statement, pos)
+            if match is None:
+                return None
+            null, single, double, number, boolean = match.groups()
+            if null is not None:
+                row.append(None)
+            elif single is not None:
+                row.append(_unescape(single, "'"))
+            elif double is not None:
+                row.append(_unescape(double, '"'))
+            elif number is not None:
+                row.append(float(number) if any(c in number for c in ".eE") else int(number))
+            else:
+                row.append(1 if boolean.upper() == "TRUE" else 0)
+            pos = match.end()
+            if pos < length and statement[pos] == ",":
+                pos += 1
+                continue
+            if pos < length and statement[pos] == ")":
+                pos += 1
+                break
+            return None
+        rows.append(row)
+        while pos < length and statement[pos].isspace():
+            pos += 1
+        if pos < length and statement[pos] == ",":
+            pos += 1
+            while pos < length and statement[pos].isspace():
+                pos += 1
+        elif pos < length:
+            return None
+    return ignore, table, columns, rows
+
+# Function to open a SQLite database tuned for bulk loading
+def open_import_database(db_path):
+    # Dump statements are unique, so caching their prepared form only costs memory
+    conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False, cached_statements=0)
+    if db_path != ":memory:":
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-65536")
+    return conn
+
+# Function to stream a MySQL/SQLite dump into a SQLite database inside explicit transactions.
+# Multi-row INSERTs without backslash escapes go straight to SQLite's parser; rows that
+# need MySQL unescaping are parsed here and loaded in executemany batches.
+def import_sql_dump(binary_stream, conn, batch_rows=5000, commit_rows=100_000, progress_callback=None):
+    stats = {"statements": 0, "rows": 0, "skipped": 0, "failed": 0, "errors": []}
+    started = time.perf_counter()
+    pending_key, pending_rows, rows_since_commit = None, [], 0
+
+    def record_failure(sql, error):
+        stats["failed"] += 1
+        if len(stats["errors"]) < 5:
+            stats["errors"].append(f"{str(error)} in: {sql[:120]}")
+        logger.warning("Skipping failed SQL statement: %s", error)
+
+    def flush():
+        nonlocal pending_key, pending_rows
+        if not pending_rows:
+            return
+        ignore, table, columns, width = pending_key
+        sql = _insert_prefix(ignore, table, columns) + f"({', '.join('?' * width)})"
+        try:
+            conn.executemany(sql, pending_rows)
+            stats["rows"] += len(pending_rows)
+        except sqlite3.Error as e:
+            record_failure(sql, e)
+        pending_key, pending_rows = None, []
+
+    conn.execute("BEGIN")
+    for statement in iter_sql_statements(binary_stream, progress_callback=progress_callback):
+        stats["statements"] += 1
+        head = _INSERT_HEAD.match(statement) if statement[:6].upper() == "INSERT" else None
+        if head is not None and "\\" not in statement:
+            flush()
+            sql = _insert_prefix(*_insert_target(head)) + statement[head.end():]
+            try:
+                inserted = conn.execute(sql).rowcount
+                stats["rows"] += inserted
+                rows_since_commit += inserted
+            except sqlite3.Error as e:
+                record_failure(sql, e)
+        elif head is not None and (parsed := parse_insert(statement)) is not None:
+            ignore, table, columns, rows = parsed
+            for row in rows:
+                key = (ignore, table, columns, len(row))
+                if key != pending_key:
+                    flush()
+                    pending_key = key
+                pending_rows.append(row)
+                rows_since_commit += 1
+                if len(pending_rows) >= batch_rows:
+                    flush()
+        else:
+            flush()
+            translated = translate_statement(statement)
+            if translated is None:
+                stats["skipped"] += 1
+                continue
+            try:
+                conn.execute(translated)
+            except sqlite3.Error as e:
+                record_failure(translated, e)
+            continue
+        if rows_since_commit >= commit_rows:
+            flush()
+            conn.execute("COMMIT")
+            conn.execute("BEGIN")
+            rows_since_commit = 0
+    flush()
+    conn.execute("COMMIT")
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    logger.debug("SQL dump imported: %s", stats)
+    return stats
+
+# Function to import an uploaded dump into a SQLite file (or memory) and return the open connection
+def load_sql_dump(file_obj, db_path=":memory:", batch_rows=5000, commit_rows=100_000, progress_callback=None):
+    total_bytes = getattr(file_obj, "size", None)
+    file_obj.seek(0)
+    report_progress = None
+    if progress_callback and total_bytes:
+        last_reported = [0.0]
+        def report_progress(consumed):
+            fraction = min(consumed / total_bytes, 1.0)
+            if fraction - last_reported[0] >= 0.01:
+                last_reported[0] = fraction
+                progress_callback(fraction)
+    if db_path == ":memory:":
+        conn = open_import_database(db_path)
+        stats = import_sql_dump(file_obj, conn, batch_rows, commit_rows, report_progress)
+        return conn, stats
+    # Sessions are threads of one process: two of them importing the same dump need their own file
+    tmp_path = f"{db_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    conn = open_import_database(tmp_path)
+    try:
+        stats = import_sql_dump(file_obj, conn, batch_rows, commit_rows, report_progress)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.close()
+        os.replace(tmp_path, db_path)
+    finally:
+        conn.close()
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(tmp_path + suffix)
+            except FileNotFoundError:
+                pass
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn, stats
@@ -0,0 +1,28 @@
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# The modules live at the root of the repository and read their settings on import:
+# keep the caches of a test run out of the working tree
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("AI_INSIGHT_CACHE_DIR", tempfile.mkdtemp(prefix="ai-insight-tests-"))
+
+
+# Small frame shaped like fire_call .csv
+@pytest.fixture
+def calls():
+    rng = np.random.default_rng(7)
+    rows = 600
+    df = pd.DataFrame({
+        "IncidentNumber": np.arange(1, rows + 1),
+        "CallType": rng.choice(["Medical Incident", "Structure Fire", "Alarms"], rows, p=[0.6, 0.25, 0.15]),
+        "UnitType": rng.choice(["ENGINE", "MEDIC", "TRUCK"], rows),
+        "Zipcode": rng.choice([94102, 94103, 94110], rows),
+        "Delay": rng.exponential(3.0, rows).round(3),
+    })
+    df.loc[::40, "Delay"] = np.nan
+    return df
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+from chat_history import message_snapshot, split_history
+from result_store import ResultStore
+
+
+def table_message(store, rows=50):
+    handle = store.put("dataframe", pd.DataFrame(np.arange(rows * 4).reshape(rows, 4), columns=list("abcd")))
+    return {"role": "assistant", "content": "Here's the data you requested:", "timestamp": "12:00",
+            "content_type": "dataframe", "extra_content": handle, "cache_status": "local"}
+
+
+def test_split_history_keeps_the_live_window():
+    messages = list(range(30))
+    assert split_history(messages, 20) == (messages[:10], messages[10:])
+    assert split_history(messages[:5], 20) == ([], messages[:5])
+
+
+def test_snapshot_shows_a_preview_of_the_table(tmp_path):
+    store = ResultStore(str(tmp_path))
+    html = message_snapshot(table_message(store), max_rows=20, store=store)
+    assert html.count("</tr>") == 21
+    assert "50 rows × 4 columns" in html
+
+
+def test_snapshots_stay_out_of_messages_and_within_the_store_budget(tmp_path):
+    store = ResultStore(str(tmp_path), memory_budget_bytes=100_000)
+    messages = [table_message(store) for _ in range(40)]
+    for _ in range(2):
+        snapshots = [message_snapshot(message, max_rows=20, store=store) for message in messages]
+    assert all("<table" in html for html in snapshots)
+    assert all(set(message) == set(messages[0]) and "snapshot" not in message for message in messages)
+    assert store.stats()["memory_bytes"] <= 100_000
@@ -0,0 +1,38 @@
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+from dataset_cache import DatasetCache
+from sql_catalog import SQLiteCatalog
+
+
+def test_frames_round_trip_with_their_metadata(tmp_path):
+    cache = DatasetCache(str(tmp_path))
+    df = pd.DataFrame({"CallType": ["Alarms", "Medical Incident"], "Delay": [1.5, 2.25]})
+    assert cache.put_frame("calls", df, metadata={"rows": 2, "truncated": False})
+    cached, metadata = cache.get_frame("calls", with_metadata=True)
+    pd.testing.assert_frame_equal(cached, df)
+    assert metadata == {"rows": 2, "truncated": False}
+    assert cache.get_frame("missing", with_metadata=True) == (None, {})
+
+
+def test_eviction_skips_databases_held_by_a_catalog(tmp_path):
+    cache = DatasetCache(str(tmp_path), max_bytes=1)
+    paths = []
+    for name in ("old", "new"):
+        path = cache.path_for(f"sql-{name}", ".sqlite")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE calls (id INTEGER)")
+        conn.commit()
+        conn.close()
+        paths.append(path)
+        time.sleep(0.01)
+    catalog = SQLiteCatalog.open(paths[0])
+    cache.evict()
+    assert os.path.exists(paths[0]) and not os.path.exists(paths[1])
+    assert catalog.table_names() == ["calls"]
+    catalog.close()
+    cache.evict()
+    assert not os.path.exists(paths[0])
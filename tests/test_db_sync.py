@@ -0,0 +1,90 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import pushdown
+from db_fetch import fetch_frame
+from db_sync import TableSync
+
+
+# SQLite stands in for MySQL: same quoting and LIMIT syntax, "?" placeholders
+@pytest.fixture
+def conn(monkeypatch):
+    monkeypatch.setitem(pushdown.PLACEHOLDERS, "mysql", "?")
+    conn = sqlite3.connect(":memory:")
+    rows = 1200
+    pd.DataFrame({
+        "IncidentNumber": np.arange(1, rows + 1),
+        "CallType": np.where(np.arange(rows) % 3, "Medical Incident", "Alarms"),
+        "Delay": np.arange(rows) * 0.5,
+        "updated_at": (pd.Timestamp("2024-01-01") + pd.to_timedelta(np.arange(rows), "s")).astype(str),
+    }).to_sql("calls", conn, index=False)
+    yield conn
+    conn.close()
+
+
+def fetch(conn, sql, params=None):
+    return fetch_frame(conn, sql, params)[0]
+
+
+def insert(conn, first, count, stamp="2024-02-01 00:00:00"):
+    conn.executemany("INSERT INTO calls VALUES (?, ?, ?, ?)",
+                     [(key, "Structure Fire", 1.0, stamp) for key in range(first, first + count)])
+
+
+def test_initial_load_takes_the_latest_rows(conn):
+    sync = TableSync(conn, "calls", "mysql", "IncidentNumber", fetch=fetch)
+    df = sync.initial_load(500)
+    assert df["IncidentNumber"].tolist() == list(range(701, 1201))
+    assert sync.high_water == 1200
+
+
+def test_sync_without_changes_returns_the_same_frame(conn):
+    sync = TableSync(conn, "calls", "mysql", "IncidentNumber", fetch=fetch)
+    df = sync.initial_load(500)
+    synced, result = sync.sync(df)
+    assert synced is df
+    assert not result.changed
+
+
+def test_new_rows_push_the_oldest_out_of_the_window(conn):
+    sync = TableSync(conn, "calls", "mysql", "IncidentNumber", batch_rows=100, fetch=fetch)
+    df = sync.initial_load(500)
+    insert(conn, 1201, 150)
+    synced, result = sync.sync(df)
+    assert (result.inserted, result.trimmed) == (150, 150)
+    assert synced["IncidentNumber"].tolist() == list(range(851, 1351))
+    assert len(result.appended) == 150
+    assert synced.dtypes.equals(df.dtypes)
+
+
+def test_sync_stopped_by_max_batches_resumes(conn):
+    sync = TableSync(conn, "calls", "mysql", "IncidentNumber", batch_rows=100, max_batches=2, fetch=fetch)
+    df = sync.initial_load(1000)
+    insert(conn, 1201, 350)
+    df, first = sync.sync(df)
+    df, second = sync.sync(df)
+    assert (first.inserted, first.complete) == (200, False)
+    assert (second.inserted, second.complete) == (150, True)
+    assert df["IncidentNumber"].is_unique and df["IncidentNumber"].max() == 1550
+    assert len(df) == 1000
+
+
+def test_timestamp_mode_applies_updates(conn):
+    sync = TableSync(conn, "calls", "mysql", "IncidentNumber", mode="timestamp", timestamp_column="updated_at", fetch=fetch)
+    df = sync.initial_load(500)
+    conn.execute("UPDATE calls SET CallType = 'Updated', updated_at = '2024-03-01 00:00:00' WHERE IncidentNumber = 1000")
+    insert(conn, 1201, 2)
+    synced, result = sync.sync(df)
+    assert (result.inserted, result.updated, result.appended) == (2, 1, None)
+    assert synced.loc[synced["IncidentNumber"] == 1000, "CallType"].tolist() == ["Updated"]
+    assert len(synced) == 500 and synced["IncidentNumber"].min() == 703
+
+
+def test_invalid_options_are_rejected(conn):
+    with pytest.raises(ValueError):
+        TableSync(conn, "calls", "mysql", "IncidentNumber", mode="timestamp")
+    with pytest.raises(ValueError):
+        TableSync(conn, "calls", "mysql", "IncidentNumber", mode="change_tracking")
@@ -0,0 +1,19 @@
+import pytest
+
+from benchmark import INTENT_CORPUS
+from intent_matcher import match_intent, normalize_text
+
+
+@pytest.mark.parametrize("question,expected", INTENT_CORPUS)
+def test_corpus_question_matches_its_intent(question, expected):
+    assert match_intent(question).intent == expected
+
+
+def test_normalize_text_folds_case_and_accents():
+    assert normalize_text("Aperçu des DONNÉES") == normalize_text("apercu des donnees")
+
+
+def test_empty_question_has_no_intent():
+    match = match_intent("   ")
+    assert match.intent is None
+    assert match.confidence == 0.0
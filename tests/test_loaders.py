@@ -0,0 +1,70 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import settings
+from loaders import compact_frame, downcast_numeric, infer_column_plan, load_csv, load_signature
+
+
+def csv_upload(text):
+    upload = io.BytesIO(text.encode("utf-8"))
+    upload.size = len(upload.getvalue())
+    return upload
+
+
+def calls_csv(rows):
+    lines = ["IncidentNumber,CallType,ReceivedDtTm,Delay"]
+    for i in range(rows):
+        lines.append(f"{i},{['Medical Incident', 'Alarms', 'Structure Fire'][i % 3]},2024-01-{i % 28 + 1:02d} 10:00:00,{i * 0.37:.2f}")
+    return "\n".join(lines) + "\n"
+
+
+def test_integers_become_the_smallest_integer_type():
+    assert downcast_numeric(pd.Series([1, 2, 300])).dtype == np.int16
+    assert downcast_numeric(pd.Series([1.0, 2.0, np.nan])).dtype == pd.Int8Dtype()
+
+
+def test_floats_stay_float64_unless_float32_is_exact():
+    assert downcast_numeric(pd.Series([0.5, 1.25, np.nan])).dtype == np.float32
+    delays = pd.Series([3.5434916664825, 0.1, 2.7])
+    assert downcast_numeric(delays).dtype == np.float64
+    assert downcast_numeric(delays, lossy_floats=True).dtype == np.float32
+
+
+def test_plan_detects_dates_and_categories():
+    sample = pd.DataFrame({"when": ["2024-01-01 10:00:00"] * 4, "kind": ["a", "b", "a", "a"], "n": ["1", "2", "3", "4"]})
+    plan = infer_column_plan(sample)
+    assert plan["when"][0] == "datetime"
+    assert plan["kind"] == ("category", None)
+    assert "n" not in plan
+
+
+def test_load_csv_matches_read_csv():
+    text = calls_csv(1000)
+    df, report = load_csv(csv_upload(text), chunk_rows=128, sample_rows=100)
+    expected = pd.read_csv(io.StringIO(text))
+    assert len(df) == 1000 and not report["truncated"]
+    assert isinstance(df["CallType"].dtype, pd.CategoricalDtype)
+    assert pd.api.types.is_datetime64_any_dtype(df["ReceivedDtTm"])
+    assert df["Delay"].mean() == expected["Delay"].mean()
+    assert df["CallType"].astype(str).tolist() == expected["CallType"].tolist()
+
+
+def test_load_csv_stops_at_the_row_cap():
+    df, report = load_csv(csv_upload(calls_csv(1000)), chunk_rows=128, max_rows=300)
+    assert len(df) == 300
+    assert report["truncated"] and report["rows"] == 300
+
+
+def test_compact_frame_shrinks_memory():
+    df = pd.read_csv(io.StringIO(calls_csv(1000)))
+    before = df.memory_usage(deep=True).sum()
+    assert compact_frame(df.copy()).memory_usage(deep=True).sum() < before
+
+
+def test_load_signature_follows_the_loader_caps(monkeypatch):
+    signature = load_signature()
+    monkeypatch.setattr(settings, "CSV_MAX_ROWS", settings.CSV_MAX_ROWS + 1)
+    assert load_signature() != signature
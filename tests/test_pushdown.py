@@ -0,0 +1,110 @@
+import sqlite3
+import statistics
+
+import numpy as np
+import pytest
+
+import pushdown
+from connection_pool import MySQLPool
+from pushdown import build_select, execute_intent_on_server, quote_table
+from query_engine import execute_intent, parse_query_intent
+
+
+# Sample standard deviation, which SQLite lacks
+class StddevSamp:
+    def __init__(self):
+        self.values = []
+
+    def step(self, value):
+        if value is not None:
+            self.values.append(value)
+
+    def finalize(self):
+        return statistics.stdev(self.values) if len(self.values) > 1 else None
+
+
+# Function to add the MySQL functions the pushdown queries use to a SQLite connection
+def add_mysql_functions(conn):
+    conn.create_aggregate("STDDEV_SAMP", 1, StddevSamp)
+    conn.create_function("RAND", 0, np.random.random)
+
+
+# SQLite stands in for MySQL 8: same quoting, LIMIT and window functions, "?" placeholders.
+# Queries run on a DB-API connection and through MySQLPool's SQLAlchemy connections.
+@pytest.fixture(params=["dbapi", "pool"])
+def conn(request, monkeypatch, tmp_path, calls):
+    monkeypatch.setitem(pushdown.PLACEHOLDERS, "mysql", "?")
+    if request.param == "dbapi":
+        conn = sqlite3.connect(":memory:")
+        add_mysql_functions(conn)
+        calls.to_sql("calls", conn, index=False)
+        yield conn
+        conn.close()
+        return
+    from sqlalchemy import event
+    pool = MySQLPool(f"sqlite:///{tmp_path / 'calls.db'}", "calls")
+    event.listen(pool.engine, "connect", lambda dbapi_connection, record: add_mysql_functions(dbapi_connection))
+    with pool.connection() as pooled:
+        calls.to_sql("calls", pooled, index=False)
+        pooled.commit()
+    yield pool
+    pool.dispose()
+
+
+def test_build_select_places_the_limit_per_dialect():
+    assert build_select("mssql", "dbo.Calls", "*", limit=5) == "SELECT TOP 5 * FROM [dbo].[Calls]"
+    assert build_select("mysql", "calls", "*", ["a = %s"], order_by="b", limit=5) == "SELECT * FROM `calls` WHERE a = %s ORDER BY b LIMIT 5"
+    assert quote_table("[dbo].[Calls]", "mssql") == "[dbo].[Calls]"
+
+
+@pytest.mark.parametrize("question", [
+    "moyenne de Delay par UnitType", "somme de Delay", "nombre de lignes par CallType", "combien de CallType distincts",
+    "max Delay for Medical Incident", "médiane de Delay", "médiane de Delay par UnitType", "quantiles de Delay",
+    "quantiles de Delay par CallType", "distribution de Delay", "répartition de UnitType",
+])
+def test_server_answers_match_local_answers(conn, calls, question):
+    intent = parse_query_intent(question, calls)
+    kind, server = execute_intent_on_server(intent, conn, "calls", "mysql", calls)
+    local_kind, local = execute_intent(intent, calls)
+    assert kind == local_kind
+    if kind == "text":
+        assert server == local
+    else:
+        assert list(server.columns) == list(local.columns)
+        np.testing.assert_allclose(server.select_dtypes("number").to_numpy(dtype=float),
+                                   local.select_dtypes("number").to_numpy(dtype=float), rtol=1e-9)
+
+
+def test_order_statistics_never_fetch_the_column(conn, calls, monkeypatch):
+    queries = []
+    run_query = pushdown.run_query
+    monkeypatch.setattr(pushdown, "run_query", lambda conn, sql, params=None: queries.append(sql) or run_query(conn, sql, params))
+    execute_intent_on_server(parse_query_intent("quantiles de Delay", calls), conn, "calls", "mysql", calls)
+    assert queries and all("ROW_NUMBER()" in sql for sql in queries)
+
+
+def test_servers_without_window_functions_answer_from_a_sample(conn, calls, monkeypatch):
+    run_query = pushdown.run_query
+
+    def no_windows(conn, sql, params=None):
+        if "OVER (" in sql:
+            raise RuntimeError("window functions are not supported")
+        return run_query(conn, sql, params)
+    monkeypatch.setattr(pushdown, "run_query", no_windows)
+    kind, text = execute_intent_on_server(parse_query_intent("médiane de Delay", calls), conn, "calls", "mysql", calls)
+    assert kind == "text"
+    assert f"{calls['Delay'].median():,.4f}".rstrip("0") in text
+    assert "échantillon aléatoire de 600 lignes" in text
+    kind, frame = execute_intent_on_server(parse_query_intent("quantiles de Delay", calls), conn, "calls", "mysql", calls)
+    assert "≈" in frame.attrs["note"]
+
+
+def test_value_counts_keep_the_most_frequent_values(conn, calls, monkeypatch):
+    monkeypatch.setattr(pushdown.settings, "PUSHDOWN_MAX_VALUES", 2)
+    kind, frame = execute_intent_on_server(parse_query_intent("répartition de CallType", calls), conn, "calls", "mysql", calls)
+    assert frame["CallType"].tolist() == calls["CallType"].value_counts().index[:2].tolist()
+    assert frame["percentage"].sum() < 100
+    assert "tronqué" in frame.attrs["note"]
+    monkeypatch.setattr(pushdown.settings, "PUSHDOWN_MAX_VALUES", 3)
+    kind, frame = execute_intent_on_server(parse_query_intent("répartition de CallType", calls), conn, "calls", "mysql", calls)
+    assert len(frame) == 3 and "note" not in frame.attrs
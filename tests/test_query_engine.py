@@ -0,0 +1,80 @@
+import pandas as pd
+import pytest
+
+from query_engine import answer_locally, execute_intent, handle_special_queries, is_meaningful_query, parse_query_intent
+from sketches import QUANTILE_LEVELS
+
+
+@pytest.mark.parametrize("question,operation,column,group_by", [
+    ("moyenne de Delay par UnitType", "mean", "Delay", "UnitType"),
+    ("average Delay by UnitType", "mean", "Delay", "UnitType"),
+    ("médiane de Delay", "median", "Delay", None),
+    ("somme de Delay", "sum", "Delay", None),
+    ("quantiles de Delay par CallType", "quantiles", "Delay", "CallType"),
+    ("combien de CallType distincts", "distinct", "CallType", None),
+    ("répartition de UnitType", "distribution", "UnitType", None),
+])
+def test_parse_query_intent(calls, question, operation, column, group_by):
+    intent = parse_query_intent(question, calls)
+    assert (intent.operation, intent.column, intent.group_by) == (operation, column, group_by)
+
+
+def test_chart_questions_are_left_to_pandasai(calls):
+    assert parse_query_intent("trace un graphique de Delay par UnitType", calls) is None
+
+
+def test_filter_values_become_equality_filters(calls):
+    intent = parse_query_intent("max Delay for Medical Incident", calls)
+    assert intent.operation == "max"
+    assert intent.filters == [("CallType", "Medical Incident")]
+    kind, text = execute_intent(intent, calls)
+    expected = calls.loc[calls["CallType"] == "Medical Incident", "Delay"].max()
+    assert kind == "text"
+    assert f"{expected:,.4f}".rstrip("0") in text
+    assert "_Filtre : CallType = Medical Incident_" in text
+
+
+def test_grouped_mean_matches_pandas(calls):
+    kind, result = answer_locally("moyenne de Delay par UnitType", calls)
+    expected = calls.groupby("UnitType")["Delay"].mean().sort_values(ascending=False)
+    assert kind == "dataframe"
+    assert result["UnitType"].tolist() == expected.index.tolist()
+    assert result["mean_Delay"].tolist() == pytest.approx(expected.tolist())
+
+
+def test_quantiles_match_pandas(calls):
+    kind, result = answer_locally("quantiles de Delay", calls)
+    assert kind == "dataframe"
+    assert result["quantile"].tolist()[:2] == ["p1", "p5"]
+    assert result["Delay"].tolist() == pytest.approx(calls["Delay"].quantile(QUANTILE_LEVELS).tolist())
+
+
+def test_top_value_reports_its_share(calls):
+    kind, text = answer_locally("What is the most common call type?", calls)
+    counts = calls["CallType"].value_counts()
+    assert kind == "text"
+    assert counts.index[0] in text
+    assert f"{counts.iloc[0] / counts.sum():.1%}" in text
+
+
+def test_numeric_distribution_is_described(calls):
+    kind, result = answer_locally("distribution de Delay", calls)
+    assert kind == "dataframe"
+    assert result["statistic"].tolist() == ["count", "mean", "std", "min", "25%", "50%", "75%", "max"]
+
+
+def test_special_queries_use_the_profile_row_count(calls):
+    kind, text = handle_special_queries("combien de lignes", calls, row_count=1_000_000)
+    assert kind == "text"
+    assert "1000000" in text
+
+
+@pytest.mark.parametrize("question,meaningful", [
+    ("ok", False), ("bonjour", False), ("moyenne de Delay", True), ("explique la saisonnalité des appels", True),
+])
+def test_is_meaningful_query(question, meaningful):
+    assert is_meaningful_query(question)[0] is meaningful
+
+
+def test_unknown_question_is_not_answered(calls):
+    assert answer_locally("explique la saisonnalité des appels", calls) == (None, None)
@@ -0,0 +1,51 @@
+import pytest
+
+from benchmark import SIMILAR_CORPUS
+from question_index import QuestionIndex
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = QuestionIndex(str(tmp_path / "questions.sqlite"))
+    for past in sorted({past for past, _, _ in SIMILAR_CORPUS}):
+        index.add("calls", past)
+    return index
+
+
+@pytest.mark.parametrize("past,question,reuse", SIMILAR_CORPUS)
+def test_corpus_rephrasing_reuses_only_equivalent_answers(index, past, question, reuse):
+    similar = index.nearest("calls", question)
+    assert (similar is not None and similar.reuse and similar.question == past) is reuse
+
+
+def test_indexed_question_does_not_match_itself(index):
+    similar = index.nearest("calls", "top 5 Zipcode")
+    assert similar is None or similar.question != "top 5 Zipcode"
+
+
+def test_questions_are_kept_per_dataset(index):
+    assert index.nearest("other", "average delay per unit type") is None
+
+
+def test_forget_and_clear(index):
+    index.forget("calls", "moyenne de Delay par UnitType")
+    similar = index.nearest("calls", "average delay per unit type")
+    assert similar is None or similar.question != "moyenne de Delay par UnitType"
+    index.clear()
+    assert index.stats()["entries"] == 0
+    assert index.nearest("calls", "top 5 zip code") is None
+
+
+def test_index_is_reloaded_from_disk(tmp_path):
+    path = str(tmp_path / "questions.sqlite")
+    QuestionIndex(path).add("calls", "nombre d'appels par CallType")
+    similar = QuestionIndex(path).nearest("calls", "number of calls by call type")
+    assert similar.reuse
+    assert similar.question == "nombre d'appels par CallType"
+
+
+def test_oldest_questions_are_evicted(tmp_path):
+    index = QuestionIndex(str(tmp_path / "questions.sqlite"), max_entries=3)
+    for column in ["CallType", "UnitType", "Zipcode", "Battalion", "Priority"]:
+        index.add("calls", f"nombre d'appels par {column}")
+    assert index.stats()["entries"] == 3
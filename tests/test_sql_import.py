@@ -0,0 +1,72 @@
+import io
+import os
+
+import pytest
+
+from sql_import import iter_sql_statements, load_sql_dump, parse_insert, translate_statement
+
+DUMP = b"""-- MySQL dump
+SET NAMES utf8mb4;
+CREATE TABLE `calls` (
+  `id` int(11) NOT NULL AUTO_INCREMENT,
+  `call_type` varchar(64) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci DEFAULT NULL COMMENT 'type; of call',
+  `status` enum('open','closed') DEFAULT 'open',
+  `delay` double DEFAULT NULL,
+  PRIMARY KEY (`id`),
+  KEY `idx_type` (`call_type`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+LOCK TABLES `calls` WRITE;
+INSERT INTO `calls` VALUES (1,'Medical Incident','open',1.5),(2,'It''s a \\'fire\\'; really','closed',NULL),
+(3,'Alarms','open',-2e1);
+UNLOCK TABLES;
+INSERT INTO `calls` (`id`, `call_type`) VALUES (4, 'multi
+line');
+"""
+
+
+class Upload(io.BytesIO):
+    size = len(DUMP)
+
+
+def test_statements_split_outside_literals():
+    statements = list(iter_sql_statements(io.BytesIO(DUMP)))
+    assert any("It''s a \\'fire\\'; really" in statement for statement in statements)
+    assert statements[-1].startswith("INSERT INTO `calls` (`id`, `call_type`)")
+
+
+def test_mysql_only_statements_are_dropped():
+    assert translate_statement("SET NAMES utf8mb4") is None
+    assert translate_statement("LOCK TABLES `calls` WRITE") is None
+
+
+def test_parse_insert_decodes_values():
+    ignore, table, columns, rows = parse_insert("INSERT IGNORE INTO `calls` (`id`, `note`) VALUES (1,'a\\nb'),(2,NULL)")
+    assert (ignore, table, columns) == (True, "calls", ("id", "note"))
+    assert rows == [[1, "a\nb"], [2, None]]
+
+
+def test_load_sql_dump_in_memory():
+    conn, stats = load_sql_dump(Upload(DUMP))
+    rows = conn.execute('SELECT id, call_type, status, delay FROM "calls" ORDER BY id').fetchall()
+    assert rows == [
+        (1, "Medical Incident", "open", 1.5), (2, "It's a 'fire'; really", "closed", None),
+        (3, "Alarms", "open", -20.0), (4, "multi\nline", "open", None),
+    ]
+    assert stats["failed"] == 0
+
+
+def test_load_sql_dump_to_disk_leaves_no_temporary_files(tmp_path):
+    db_path = str(tmp_path / "dump.sqlite")
+    progress = []
+    conn, _ = load_sql_dump(Upload(DUMP), db_path, progress_callback=progress.append)
+    assert conn.execute('SELECT COUNT(*) FROM "calls"').fetchone() == (4,)
+    conn.close()
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".tmp") or ".tmp-" in name] == []
+    assert progress and progress[-1] == pytest.approx(1.0)
+
+
+def test_failed_statements_are_counted():
+    dump = b"CREATE TABLE t (a INTEGER);\nINSERT INTO missing VALUES (1);\nINSERT INTO t VALUES (2);\n"
+    conn, stats = load_sql_dump(io.BytesIO(dump))
+    assert stats["failed"] == 1
+    assert conn.execute("SELECT a FROM t").fetchall() == [(2,)]
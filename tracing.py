@@ -0,0 +1,214 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Span of the code currently running, used as the parent of spans opened inside it
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+# Rolling latency samples (milliseconds) for one kind of operation
+class LatencyStats:
+    def __init__(self, max_samples=500):
+        self.count = 0
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.count += 1
+            self._samples.append(seconds * 1000)
+
+    def summary(self):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {"count": self.count, "avg_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0}
+        return {
+            "count": self.count,
+            "avg_ms": sum(samples) / len(samples),
+            "p50_ms": samples[len(samples) // 2],
+            "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        }
+
+
+# One timed operation. Spans opened while another is active become its children and
+# share its trace id; `attributes` carry measurements such as rows scanned or cache hits.
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "status", "error")
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.error = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+    # Function to convert the span to the OTLP/JSON span layout
+    def to_otel(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": _otel_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.status == "error" else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+# Function to wrap an attribute value in its OTLP AnyValue form
+def _otel_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+# Process-wide collector of spans. Keeps the latest `max_spans` finished spans for export
+# and rolling per-name latency and row counts for the Performance panel; when
+# `export_path` is set, every finished span is also appended to that file as a JSON line.
+class Tracer:
+    def __init__(self, max_spans=5000, export_path=None, service_name="ai-insight"):
+        self.service_name = service_name
+        self.export_path = export_path
+        self._spans = deque(maxlen=max_spans)
+        self._latency = {}
+        self._rows = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def current(self):
+        return _current_span.get()
+
+    # Function to time a block as a span; pass `parent` for work handed to another thread
+    @contextmanager
+    def span(self, name, parent=None, **attributes):
+        span = Span(name, parent if parent is not None else _current_span.get(), attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.status = "error"
+            span.error = str(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self.finish(span)
+
+    # Function to record a span whose start and end were measured elsewhere (e.g. queue waits)
+    def record(self, name, start_ns, end_ns, parent=None, **attributes):
+        span = Span(name, parent, attributes)
+        span.start_ns = start_ns
+        self.finish(span, end_ns)
+        return span
+
+    def finish(self, span, end_ns=None):
+        span.end_ns = end_ns or time.time_ns()
+        with self._lock:
+            self._spans.append(span)
+            stats = self._latency.get(span.name)
+            if stats is None:
+                stats = self._latency[span.name] = LatencyStats()
+            rows = span.attributes.get("rows")
+            if isinstance(rows, int):
+                self._rows[span.name] = self._rows.get(span.name, 0) + rows
+        stats.record(span.duration_ms / 1000)
+        if self.export_path:
+            try:
+                with open(self.export_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(span.to_dict(), default=str) + "\n")
+            except OSError as e:
+                logger.warning("Could not export span to %s: %s", self.export_path, e)
+
+    # Function to count an event outcome, e.g. count("answer_cache", "hit")
+    def count(self, name, outcome):
+        with self._lock:
+            counters = self._counters.setdefault(name, {})
+            counters[outcome] = counters.get(outcome, 0) + 1
+
+    def counters(self):
+        with self._lock:
+            return {name: dict(outcomes) for name, outcomes in self._counters.items()}
+
+    # Function to summarize latency (p50/p95) and rows scanned per span name
+    def stats(self):
+        with self._lock:
+            names = sorted(self._latency)
+            rows = dict(self._rows)
+        return [{"stage": name, **self._latency[name].summary(), "rows": rows.get(name, 0)} for name in names]
+
+    def spans(self):
+        with self._lock:
+            return list(self._spans)
+
+    def export_jsonl(self):
+        return "".join(json.dumps(span.to_dict(), default=str) + "\n" for span in self.spans())
+
+    # Function to export the retained spans as an OTLP/JSON ExportTraceServiceRequest
+    def export_otlp(self):
+        return json.dumps({
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{"scope": {"name": "ai-insight.tracing"}, "spans": [span.to_otel() for span in self.spans()]}],
+            }]
+        })
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+            self._latency.clear()
+            self._rows.clear()
+            self._counters.clear()
+
+
+_tracer = Tracer()
+
+# Function to get the process-wide tracer
+def get_tracer():
+    return _tracer
+
+# Function to configure the process-wide tracer from settings
+def configure_tracer(max_spans=5000, export_path=None):
+    _tracer.export_path = export_path or None
+    if max_spans != _tracer._spans.maxlen:
+        with _tracer._lock:
+            _tracer._spans = deque(_tracer._spans, maxlen=max_spans)
+    return _tracer